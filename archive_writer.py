@@ -0,0 +1,126 @@
+import datetime
+import json
+import os
+import threading
+import time
+from queue import Queue, Full
+from utils import log, vlog, vvlog
+
+
+class ArchiveWriter:
+    # Writes recordings and synthesized speech to disk on a background thread and keeps directories within budget
+    def __init__(self, config):
+        self.config = config
+        self.queue = Queue(maxsize=self.config.archive_queue_size)
+        self.last_prune = {}
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def save_recording(self, audio, transcript):
+        # Queue a recognized utterance (speech_recognition AudioData) and its transcript for archiving
+        timestamp = datetime.datetime.now()
+        self._enqueue(("recording", timestamp, audio, transcript))
+
+    def save_file(self, directory, filename, data):
+        # Queue raw bytes to be written to directory/filename
+        self._enqueue(("file", datetime.datetime.now(), (directory, filename), data))
+
+    def defer(self, function, *args):
+        # Queue any other disk work, e.g. persisting a cache entry, to run on the archive thread
+        self._enqueue(("call", datetime.datetime.now(), function, args))
+
+    def _enqueue(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            # Never block the caller; losing an archive entry is better than delaying a response
+            self.dropped += 1
+            log(f"Archive queue full, dropped entry ({self.dropped} dropped so far)", error=True)
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            kind, timestamp, target, payload = item
+            try:
+                if kind == "recording":
+                    directory = self._write_recording(timestamp, target, payload)
+                elif kind == "call":
+                    target(*payload)
+                    continue
+                else:
+                    directory, filename = target
+                    self._write(directory, filename, payload)
+                self._prune_if_due(directory)
+            except Exception as e:
+                log(f"Error archiving {kind}: {e}", error=True)
+            finally:
+                self.queue.task_done()
+
+    def _write_recording(self, timestamp, audio, transcript):
+        directory = self.config.recordings_directory
+        stamp = timestamp.strftime("%Y-%m-%d_%H-%M-%S-%f")[:-3]
+        if self.config.archive_compress:
+            filename = f"audio_{stamp}.flac"
+            data = audio.get_flac_data()
+        else:
+            filename = f"audio_{stamp}.wav"
+            data = audio.get_wav_data()
+        self._write(directory, filename, data)
+
+        # One JSON line per recording, mapping the timestamp to the file and what was said
+        entry = {"timestamp": timestamp.isoformat(), "file": filename, "transcript": transcript}
+        with open(os.path.join(directory, self.config.archive_index_file), "a") as index:
+            index.write(json.dumps(entry) + "\n")
+        return directory
+
+    def _write(self, directory, filename, data):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+        with open(path, "wb") as file:
+            file.write(data)
+        vlog(f"Archived {path}")
+
+    def _prune_if_due(self, directory):
+        now = time.monotonic()
+        if now - self.last_prune.get(directory, 0) < self.config.archive_prune_interval:
+            return
+        self.last_prune[directory] = now
+        self.prune(directory)
+
+    def prune(self, directory):
+        # Delete the oldest files until the directory is within its size and age budgets
+        max_bytes = self.config.archive_max_bytes.get(directory)
+        max_age = self.config.archive_max_age_days * 86400
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name != self.config.archive_index_file:
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        cutoff = time.time() - max_age
+        removed = 0
+        for mtime, size, path in files:
+            over_budget = max_bytes is not None and total > max_bytes
+            if not over_budget and mtime >= cutoff:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError as e:
+                log(f"Failed to prune {path}: {e}", error=True)
+        if removed:
+            vlog(f"Pruned {removed} old files from {directory}")
+
+    def shutdown(self, timeout=5):
+        # Flush what is queued, but never hang shutdown on a slow disk
+        try:
+            self.queue.put(None, timeout=timeout)
+        except Full:
+            return
+        self.thread.join(timeout)
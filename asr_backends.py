@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from lazy_import import lazy_import
+from utils import log, vlog, vvlog
+
+sr = lazy_import("speech_recognition")
+
+
+class RecognizerBackend:
+    """
+    Base class for speech recognition backends that receive audio while the user is still talking.
+
+    The recognizer calls start() for every utterance, accept() for each captured chunk, on_pause()
+    whenever the speaker pauses, and finish() once the endpointer has decided the utterance is over.
+    Pauses and the final endpoint are identified by the sample offset where speech last ended, so a
+    backend can tell whether anything was said after a pause it already transcribed.
+    """
+    def __init__(self, on_partial=None):
+        self.on_partial = on_partial
+        self.partial = ""
+
+    def start(self):
+        self.partial = ""
+
+    def accept(self, chunk):
+        pass
+
+    def on_pause(self, speech_end, audio):
+        pass
+
+    def finish(self, speech_end, audio):
+        # Return the final transcript; raise sr.UnknownValueError if nothing was understood
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _emit_partial(self, text):
+        self.partial = text
+        vvlog("Partial transcript: %s", text)
+        if self.on_partial:
+            self.on_partial(text)
+
+
+class GoogleBackend(RecognizerBackend):
+    # Google's web API only takes whole utterances, so transcribe speculatively at every pause.
+    # If the user says nothing more before the endpoint fires, that transcript is already (nearly) done.
+    def __init__(self, recognizer, on_partial=None):
+        super().__init__(on_partial)
+        self.recognizer = recognizer
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="asr")
+        self.lock = threading.Lock()
+        self.pending = {}  # speech_end -> future
+
+    def start(self):
+        super().start()
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending = {}
+
+    def on_pause(self, speech_end, audio):
+        with self.lock:
+            if speech_end in self.pending:
+                return
+            future = self.executor.submit(self.recognizer.recognize_google, audio)
+            self.pending[speech_end] = future
+        future.add_done_callback(lambda done: self._partial_done(speech_end, done))
+
+    def _partial_done(self, speech_end, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self.lock:
+            current = self.pending.get(speech_end) is future
+        if current:
+            self._emit_partial(future.result())
+
+    def finish(self, speech_end, audio):
+        with self.lock:
+            future = self.pending.pop(speech_end, None) if speech_end is not None else None
+        if future is not None and not future.cancelled():
+            vvlog("Using transcript started at the last pause")
+            return future.result()
+        return self.recognizer.recognize_google(audio)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class OfflineBackend(RecognizerBackend):
+    # Local stand-in that "recognizes" a fixed transcript, for tests and benchmarks without network access
+    def __init__(self, transcript, sample_rate, words_per_second=2.5, latency=0.0, on_partial=None):
+        super().__init__(on_partial)
+        self.transcript = transcript
+        self.sample_rate = sample_rate
+        self.words_per_second = words_per_second
+        self.latency = latency
+        self.samples_heard = 0
+
+    def start(self):
+        super().start()
+        self.samples_heard = 0
+
+    def accept(self, chunk):
+        # Reveal the transcript word by word in proportion to the audio heard so far
+        self.samples_heard += len(chunk) // 2
+        words = self._transcript().split()
+        count = min(len(words), int(self.samples_heard / self.sample_rate * self.words_per_second))
+        text = " ".join(words[:count])
+        if text != self.partial:
+            self._emit_partial(text)
+
+    def finish(self, speech_end, audio):
+        if self.latency:
+            time.sleep(self.latency)
+        text = self._transcript()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def _transcript(self):
+        return self.transcript() if callable(self.transcript) else self.transcript
+
+
+def create_backend(config, recognizer, on_partial=None):
+    if config.asr_backend == "google":
+        return GoogleBackend(recognizer, on_partial)
+    if config.asr_backend == "offline":
+        return OfflineBackend(config.asr_offline_transcript, config.capture_sample_rate, on_partial=on_partial)
+    raise ValueError(f"Unknown speech recognition backend: {config.asr_backend}")
@@ -1,24 +1,38 @@
-import requests
+from http_client import http_client
+from lazy_import import lazy_import
+from tool_registry import registry
 from utils import log, vlog, vvlog
 
-def get_weather(api_key, location):
+requests = lazy_import("requests")
+
+@registry.register(
+    description="Get the current weather for a location",
+    parameters={
+        "type": "object",
+        "properties": {
+            "location": {"type": "string", "description": "The city to get the weather for"}
+        },
+        "required": ["location"]
+    },
+    config_args={"api_key": "openweathermap_api_key", "cache_ttl": "weather_cache_ttl", "url": "openweathermap_url"},
+)
+def get_weather(api_key, location, cache_ttl=600, url="http://api.openweathermap.org/data/2.5/weather"):
     """
     Get the current weather for a location using the OpenWeatherMap API.
 
     :param api_key: API key for the OpenWeatherMap service.
     :param location: The city to get the weather for.
+    :param cache_ttl: Seconds a report for the same location is reused; it is served stale for as long again while refreshing.
+    :param url: The current weather endpoint.
     :return: A string containing weather information or an error message.
     """
-    # Construct the API endpoint with the location and API key
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={api_key}&units=imperial"
-    
+    params = {"q": location, "appid": api_key, "units": "imperial"}
+    # "New York" and "new york " are the same report
+    cache_key = ("weather", " ".join(location.lower().split()))
+
     try:
-        # Make the API request
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an HTTPError if the HTTP request returned an unsuccessful status code
-        
-        # Parse the JSON response
-        weather_data = response.json()
+        # Make the API request through the shared pooled and cached client
+        weather_data = http_client.get_json(url, params, cache_key=cache_key, ttl=cache_ttl, stale_ttl=cache_ttl)
         
         # Format the weather information into a readable string
         weather_info = (
@@ -0,0 +1,116 @@
+import time
+# Imported eagerly because CaptureSource subclasses sr.AudioSource
+import speech_recognition as sr
+from lazy_import import lazy_import
+from ring_buffer import SampleRingBuffer
+from utils import log, vlog, vvlog
+
+sd = lazy_import("sounddevice")
+
+
+class AudioCapture:
+    # Owns the only microphone stream; every consumer reads from the shared time-indexed ring
+    def __init__(self, config):
+        self.config = config
+        self.sample_rate = self.config.capture_sample_rate
+        self.block_size = self.config.capture_block_size
+        self.ring = SampleRingBuffer(int(self.config.capture_buffer_seconds * self.sample_rate))
+        self.stream = None
+        self.callback_budget = self.block_size / self.sample_rate / 2
+
+        # Counters written only by the audio callback
+        self.callback_overruns = 0
+        self.status_errors = 0
+
+    def start(self):
+        if self.stream is not None or self.config.capture_input != "microphone":
+            return
+        self.stream = sd.InputStream(
+            device=self.config.capture_device,
+            callback=self._audio_callback,
+            blocksize=self.block_size,
+            samplerate=self.sample_rate,
+            dtype="int16",
+            channels=1
+        )
+        self.stream.start()
+        vlog(f"Audio capture started at {self.sample_rate} Hz")
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def _audio_callback(self, indata, frames, time_info, status):
+        # Runs on the PortAudio thread: no allocation, no logging, no blocking
+        start = time.perf_counter()
+        if status:
+            self.status_errors += 1
+        self.ring.write(indata[:, 0])
+        if time.perf_counter() - start > self.callback_budget:
+            self.callback_overruns += 1
+
+    def feed(self, samples):
+        # Append int16 samples from somewhere other than the microphone (Config.capture_input = "external")
+        self.ring.write(samples)
+
+    def now(self):
+        # Absolute index of the next sample the microphone will deliver
+        return self.ring.total_written
+
+    def reader(self, start=None):
+        return CaptureReader(self, self.now() if start is None else start)
+
+    def source(self, start=None):
+        # A speech_recognition AudioSource reading from the shared ring
+        return CaptureSource(self, start)
+
+
+class CaptureReader:
+    # Sequential cursor into the capture ring
+    def __init__(self, capture, position):
+        self.capture = capture
+        self.position = position
+        self.dropped_samples = 0
+        self.poll_interval = capture.block_size / capture.sample_rate / 2
+
+    def read(self, count, out=None, timeout=None):
+        # Block until count samples past the cursor are available, then return them
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.capture.ring.total_written - self.position < count:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+        start, samples = self.capture.ring.read(self.position, count, out)
+        if start > self.position:
+            # The reader fell more than a buffer behind; the skipped audio is gone
+            self.dropped_samples += start - self.position
+        self.position = start + len(samples)
+        return samples
+
+
+class CaptureStream:
+    # Minimal stand-in for the PyAudio stream speech_recognition expects
+    def __init__(self, reader):
+        self.reader = reader
+
+    def read(self, size):
+        return self.reader.read(size).tobytes()
+
+
+class CaptureSource(sr.AudioSource):
+    def __init__(self, capture, start=None):
+        self.capture = capture
+        self.start = start
+        self.SAMPLE_RATE = capture.sample_rate
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = 1024
+        self.stream = None
+
+    def __enter__(self):
+        self.stream = CaptureStream(self.capture.reader(self.start))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
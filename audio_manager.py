@@ -1,43 +1,96 @@
-import sounddevice as sd
-from scipy.io import wavfile
-from queue import Queue
+import io
+import os
 import threading
-from utils import log, vlog, vvlog
+from lazy_import import lazy_import
+from audio_mixer import AudioMixer, decode_wav
+from utils import log, vlog, vvlog, log_enabled
+
+np = lazy_import("numpy")
 
 
 class AudioManager:
-    def __init__(self):
-        self.playback_queue = Queue()
-        self.playback_thread = threading.Thread(target=self._playback_worker, daemon=True)
-        self.playback_event = threading.Event()
-        self.playback_thread.start()
-
-    def _playback_worker(self):
-        while True:
-            sound_file, wait_full_sound = self.playback_queue.get()
-            if sound_file is None:
-                break  # Stop the thread if None is enqueued
+    def __init__(self, config):
+        self.config = config
+        self.mixer = AudioMixer(self.config.mixer_sample_rate, self.config.mixer_block_size, self.config.audio_output)
+        self.sounds = {}
+        self.speech_voice = None
+        self.speech_lock = threading.Lock()
+        self._preload_sounds()
+
+    def _preload_sounds(self):
+        # Decode every cue once so playing one is just adding a voice to the mixer
+        for name in sorted(os.listdir(self.config.sounds_directory)):
+            if not name.endswith(".wav"):
+                continue
+            path = os.path.join(self.config.sounds_directory, name)
             try:
-                fs, data = wavfile.read(sound_file)
-                sd.play(data, fs)
-                if wait_full_sound:
-                    sd.wait()
+                self.sounds[path] = decode_wav(path, self.mixer.samplerate)
             except Exception as e:
-                log(f"Error playing sound: {e}", error=True)
-            finally:
-                self.playback_queue.task_done()
-                self.playback_event.set()  # Signal that playback is done
+                log(f"Error loading sound {path}: {e}", error=True)
+        vlog(f"Preloaded {len(self.sounds)} sounds")
+
+    def _decode(self, sound_file):
+        # Sounds are a file path, in-memory WAV bytes, or float32 samples already at the mixer rate
+        if isinstance(sound_file, np.ndarray):
+            return sound_file
+        if isinstance(sound_file, bytes):
+            return decode_wav(io.BytesIO(sound_file), self.mixer.samplerate)
+        data = self.sounds.get(os.path.normpath(sound_file))
+        if data is None:
+            data = decode_wav(sound_file, self.mixer.samplerate)
+        return data
 
     def play_sound(self, sound_file, wait_full_sound=False):
-        vvlog(f"Playing sound: {sound_file}...")
-        self.playback_event.clear()  # Reset the event
-        self.playback_queue.put((sound_file, wait_full_sound))
+        # Play a sound on its own voice, overlapping anything already playing
+        if log_enabled(2):
+            vvlog("Playing sound: %s...", self._describe(sound_file))
+        try:
+            handle = self.mixer.play(self._decode(sound_file))
+        except Exception as e:
+            log("Error playing sound: %s", e, error=True)
+            return None
         if wait_full_sound:
-            self.playback_event.wait()  # Wait for the sound to finish playing
+            handle.wait()  # Wait for the sound to finish playing
+        return handle
+
+    def play_sequence(self, *sound_files):
+        # Play sounds back to back on one voice, without blocking the caller
+        try:
+            sounds = [self._decode(sound_file) for sound_file in sound_files]
+        except Exception as e:
+            log("Error playing sound: %s", e, error=True)
+            return None
+        handle = self.mixer.open_stream(sounds[0])
+        for sound in sounds[1:]:
+            handle.append(sound)
+        handle.close()
+        return handle
+
+    def queue_sound(self, sound_file):
+        # Queue a sound to play right after everything queued before it, without blocking the caller
+        if log_enabled(2):
+            vvlog("Queueing sound: %s...", self._describe(sound_file))
+        try:
+            data = self._decode(sound_file)
+        except Exception as e:
+            log("Error playing sound: %s", e, error=True)
+            return None
+        with self.speech_lock:
+            if self.speech_voice is None or not self.speech_voice.append(data):
+                # The previous queue has drained, so start a new one
+                self.speech_voice = self.mixer.open_stream(data, close_when_drained=True)
+            return self.speech_voice
+
+    def _describe(self, sound_file):
+        if isinstance(sound_file, np.ndarray):
+            return f"<{len(sound_file)} samples of audio>"
+        if isinstance(sound_file, bytes):
+            return f"<{len(sound_file)} bytes of audio>"
+        return sound_file
 
-    def stop_all_sounds(self):
-        sd.stop()
+    def stop_all_sounds(self, fade=0):
+        # fade > 0 ramps everything down over that many seconds instead of cutting it off
+        self.mixer.stop_all(fade)
 
     def shutdown(self):
-        self.playback_queue.put((None, False))  # Enqueue None to stop the thread
-        self.playback_thread.join()
\ No newline at end of file
+        self.mixer.close()
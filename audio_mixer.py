@@ -0,0 +1,292 @@
+import io
+import threading
+import time
+import wave
+from collections import deque
+from math import ceil, gcd
+from lazy_import import lazy_import
+from utils import log, vlog, vvlog
+
+np = lazy_import("numpy")
+sd = lazy_import("sounddevice")
+wavfile = lazy_import("scipy.io.wavfile")
+signal = lazy_import("scipy.signal")
+
+
+def decode_wav(source, samplerate):
+    """
+    Decode a WAV file into a mono float32 array at the given sample rate.
+
+    :param source: A file path or file-like object containing WAV data.
+    :param samplerate: The sample rate the result should be resampled to.
+    :return: A 1-D float32 numpy array with samples in [-1, 1].
+    """
+    fs, data = wavfile.read(source)
+    if data.dtype == np.uint8:
+        data = (data.astype(np.float32) - 128) / 128
+    elif data.dtype.kind == "i":
+        data = data.astype(np.float32) / np.iinfo(data.dtype).max
+    else:
+        data = data.astype(np.float32)
+    if data.ndim > 1:
+        data = data.mean(axis=1)  # The mixer runs in mono
+    if fs != samplerate:
+        divisor = gcd(fs, samplerate)
+        data = signal.resample_poly(data, samplerate // divisor, fs // divisor).astype(np.float32)
+    return np.ascontiguousarray(data)
+
+
+def decode_pcm16(buffer):
+    # Raw little-endian 16-bit mono PCM bytes as float32 samples in [-1, 1]
+    return np.frombuffer(buffer, dtype="<i2").astype(np.float32) / 32767
+
+
+def encode_wav(samples, samplerate):
+    # float32 samples in [-1, 1] as 16-bit mono WAV bytes
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(samplerate)
+        file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+class StreamResampler:
+    """
+    Polyphase resampling of a signal that arrives in chunks.
+
+    Resampling every chunk on its own would leave a click at each boundary, where the filter
+    sees silence. Instead each chunk is resampled together with enough of its neighbours to
+    cover the filter, and only the part whose output no longer depends on later input is
+    returned, so the output matches resampling the whole signal at once. That costs a few
+    milliseconds of look-ahead.
+    """
+    def __init__(self, source_rate, target_rate):
+        divisor = gcd(source_rate, target_rate)
+        self.up = target_rate // divisor
+        self.down = source_rate // divisor
+        # Input samples on either side that the default resample_poly filter reaches, in whole output periods
+        reach = 10 * max(self.up, self.down) // self.up + 2
+        self.context = self.down * ceil(reach / self.down)
+        self.history = np.zeros(self.context, dtype=np.float32)  # Input before the pending part
+        self.pending = np.zeros(0, dtype=np.float32)  # Input not resampled yet
+
+    def feed(self, samples):
+        if self.up == self.down:
+            return samples
+        self.pending = np.concatenate((self.pending, samples))
+        usable = (len(self.pending) - self.context) // self.down * self.down
+        if usable <= 0:
+            return np.zeros(0, dtype=np.float32)
+        return self._resample(usable, self.pending[:usable + self.context])
+
+    def flush(self):
+        # The rest of the signal, with silence after it
+        if self.up == self.down or not len(self.pending):
+            return np.zeros(0, dtype=np.float32)
+        usable = len(self.pending)
+        tail = np.zeros(self.context + (-usable) % self.down, dtype=np.float32)
+        return self._resample(usable, np.concatenate((self.pending, tail)))
+
+    def _resample(self, usable, ahead):
+        block = np.concatenate((self.history, ahead))
+        out = signal.resample_poly(block, self.up, self.down).astype(np.float32)
+        start = self.context * self.up // self.down
+        count = ceil(usable * self.up / self.down)
+        self.history = np.concatenate((self.history, self.pending[:usable]))[-self.context:]
+        self.pending = self.pending[usable:]
+        return out[start:start + count]
+
+
+class PlaybackHandle:
+    # A single voice in the mixer, playing one pre-decoded sound
+    def __init__(self, data, samplerate, gain=1.0):
+        self.data = data
+        self.samplerate = samplerate
+        self.position = 0
+        self.gain = gain
+        self.fade_per_sample = 0.0
+        self.finished = threading.Event()
+
+    def stop(self):
+        self.finished.set()
+
+    def fade(self, duration):
+        # Ramp the gain down to zero over duration seconds, then stop
+        if duration <= 0:
+            self.stop()
+        else:
+            self.fade_per_sample = self.gain / (duration * self.samplerate)
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def is_playing(self):
+        return not self.finished.is_set()
+
+    def _mix_into(self, out):
+        # Add this voice's next len(out) samples into out; return False once the voice is done
+        if self.finished.is_set():
+            return False
+        count = min(len(out), len(self.data) - self.position)
+        self._add(out[:count], self.data[self.position:self.position + count])
+        self.position += count
+        if self.position >= len(self.data) or self.gain <= 0:
+            self.finished.set()
+            return False
+        return True
+
+    def _add(self, out, samples):
+        if self.fade_per_sample:
+            ramp = self.gain - self.fade_per_sample * np.arange(len(samples), dtype=np.float32)
+            np.clip(ramp, 0, None, out=ramp)
+            out += samples * ramp
+            self.gain = float(ramp[-1]) if len(ramp) else self.gain
+        elif self.gain == 1.0:
+            out += samples
+        else:
+            out += samples * self.gain
+
+
+class StreamHandle(PlaybackHandle):
+    # A voice fed with consecutive chunks, played back to back without gaps
+    def __init__(self, samplerate, close_when_drained=False, gain=1.0):
+        super().__init__(None, samplerate, gain)
+        self.chunks = deque()
+        self.closed = False
+        self.close_when_drained = close_when_drained
+        self.lock = threading.Lock()
+
+    def append(self, data):
+        # Returns False if the voice has already finished and can no longer take audio
+        with self.lock:
+            if self.finished.is_set() or self.closed or self.fade_per_sample:
+                return False  # Fading out counts as finished
+            self.chunks.append(data)
+            return True
+
+    def close(self):
+        # No more chunks will follow; the voice finishes once it has played what it has
+        with self.lock:
+            self.closed = True
+
+    def _mix_into(self, out):
+        if self.finished.is_set():
+            return False
+        filled = 0
+        with self.lock:
+            while filled < len(out) and self.chunks:
+                chunk = self.chunks[0]
+                count = min(len(out) - filled, len(chunk) - self.position)
+                self._add(out[filled:filled + count], chunk[self.position:self.position + count])
+                filled += count
+                self.position += count
+                if self.position >= len(chunk):
+                    self.chunks.popleft()
+                    self.position = 0
+            if (not self.chunks and (self.closed or self.close_when_drained)) or self.gain <= 0:
+                # Still under the lock, so append() cannot queue a chunk that would never be played
+                self.finished.set()
+                return False
+        return True
+
+
+class NullOutputStream:
+    # Stand-in for sd.OutputStream that pulls blocks from the callback in real time and discards them
+    def __init__(self, samplerate, blocksize, callback):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.running = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        block = np.zeros((self.blocksize, 1), dtype=np.float32)
+        period = self.blocksize / self.samplerate
+        deadline = time.monotonic()
+        while self.running.is_set():
+            self.callback(block, self.blocksize, None, None)
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+
+    def close(self):
+        self.stop()
+
+
+class AudioMixer:
+    def __init__(self, samplerate=44100, blocksize=256, output="device"):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.volume = 1.0
+        self.voices = ()  # Replaced as a whole so the audio callback never needs the lock
+        self.lock = threading.Lock()
+        if output == "null":
+            self.stream = NullOutputStream(samplerate, blocksize, self._callback)
+        else:
+            self.stream = sd.OutputStream(
+                samplerate=samplerate,
+                blocksize=blocksize,
+                channels=1,
+                dtype="float32",
+                callback=self._callback
+            )
+        self.stream.start()
+        vvlog(f"Mixer {output} output stream started at {samplerate} Hz")
+
+    def play(self, data, gain=1.0):
+        handle = PlaybackHandle(data, self.samplerate, gain)
+        self.add_voice(handle)
+        return handle
+
+    def open_stream(self, data=None, close_when_drained=False, gain=1.0):
+        handle = StreamHandle(self.samplerate, close_when_drained, gain)
+        if data is not None:
+            # Append before the voice is live so a drained-close voice does not finish immediately
+            handle.append(data)
+        self.add_voice(handle)
+        return handle
+
+    def add_voice(self, handle):
+        with self.lock:
+            self.voices = self.voices + (handle,)
+
+    def stop_all(self, fade=0):
+        for voice in self.voices:
+            voice.fade(fade)
+
+    def close(self):
+        self.stop_all()
+        try:
+            self.stream.stop()
+            self.stream.close()
+        except Exception as e:
+            log(f"Error closing mixer stream: {e}", error=True)
+
+    def _callback(self, outdata, frames, time, status):
+        mix = outdata[:, 0]
+        mix.fill(0)
+        voices = self.voices
+        done = False
+        for voice in voices:
+            if not voice._mix_into(mix):
+                done = True
+        if self.volume != 1.0:
+            mix *= self.volume
+        np.clip(mix, -1.0, 1.0, out=mix)
+        if done:
+            with self.lock:
+                self.voices = tuple(voice for voice in self.voices if not voice.finished.is_set())
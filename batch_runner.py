@@ -0,0 +1,241 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tracing import Trace
+from utils import log, vlog, vvlog
+
+
+class Backoff:
+    """
+    Rate limit backoff shared by all batch workers.
+
+    A rate limit hit by one request holds back new attempts from every worker until the wait is
+    over: Retry-After if the API sent one, otherwise exponential with jitter. Any success resets
+    the exponent.
+    """
+    def __init__(self, base=1.0, maximum=60.0):
+        self.base = base
+        self.maximum = maximum
+        self.lock = threading.Lock()
+        self.until = 0.0
+        self.failures = 0
+
+    def wait(self):
+        # Returns the seconds spent waiting
+        waited = 0.0
+        while True:
+            with self.lock:
+                delay = self.until - time.monotonic()
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def rate_limited(self, retry_after=None):
+        with self.lock:
+            self.failures += 1
+            delay = retry_after or min(self.maximum, self.base * 2 ** (self.failures - 1)) * random.uniform(0.5, 1.0)
+            self.until = max(self.until, time.monotonic() + delay)
+        return delay
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+
+
+def read_items(lines):
+    """
+    Parse batch input: one JSON object per line, or plain text lines that are commands.
+
+    Objects take their command from "command", "text" or "body", and their id from "id" or
+    "request_id" (the format of requests.jsonl), else the line number. An object with "say" is
+    only rendered to speech.
+    Blank lines and lines starting with # are skipped. A line that is not valid JSON becomes an
+    item with its line number as the id and the parse error as "error", so it is reported as failed.
+
+    :return: A generator of (index, item dict) tuples.
+    """
+    index = 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                yield index, {"id": str(line_number), "command": None, "say": None, "error": f"malformed JSON on line {line_number}: {e}"}
+                index += 1
+                continue
+        else:
+            entry = {"command": line}
+        item = {
+            "id": str(entry.get("id") or entry.get("request_id") or line_number),
+            "command": entry.get("command") or entry.get("text") or entry.get("body"),
+            "say": entry.get("say"),
+            "error": None,
+        }
+        yield index, item
+        index += 1
+
+
+class BatchRunner:
+    """
+    Sends commands to the assistant without the voice loop, several at a time.
+
+    Every command runs on its own assistant thread, so concurrent runs never share context, and
+    goes through the same client and tool layer as spoken commands. With a TextToSpeech the
+    reply (or an item's "say" text) is also rendered to a WAV file. Results are written as JSON
+    lines in the order they finish, each with its per-stage timings in milliseconds.
+    """
+    def __init__(self, config, openai_client, assistant_id, text_to_speech=None, concurrency=4,
+                 retries=3, audio_directory=None, backoff=None):
+        self.config = config
+        self.openai_client = openai_client
+        self.assistant_id = assistant_id
+        self.text_to_speech = text_to_speech
+        self.concurrency = concurrency
+        self.retries = retries
+        self.audio_directory = audio_directory or os.path.join(self.config.outputs_directory, "batch")
+        self.backoff = backoff or Backoff()
+        self.lock = threading.Lock()
+        self.counters = {"items": 0, "ok": 0, "failed": 0, "retries": 0}
+
+    def run(self, lines, output):
+        # Process every item read from lines, with at most concurrency in flight, writing results to output
+        started = time.perf_counter()
+        slots = threading.BoundedSemaphore(self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as pool:
+            for index, item in read_items(lines):
+                slots.acquire()  # Read input only as fast as it is processed
+                future = pool.submit(self._process, index, item)
+                future.add_done_callback(lambda done: self._finished(done, output, slots))
+        elapsed = time.perf_counter() - started
+        log(f"Batch finished: {self.counters['ok']} ok, {self.counters['failed']} failed, "
+            f"{self.counters['retries']} retries in {elapsed:.1f}s")
+        return self.counters["failed"] == 0
+
+    def _process(self, index, item):
+        trace = Trace(item["id"])
+        result = {"id": item["id"], "index": index, "command": item["command"], "ok": False, "attempts": 0}
+        try:
+            if item["error"]:
+                raise ValueError(item["error"])
+            text = item["say"]
+            if text is not None and self.text_to_speech is None:
+                raise ValueError("say item needs --tts")
+            if text is None:
+                if not item["command"]:
+                    raise ValueError("no command in batch item")
+                text = self._ask(item["command"], trace, result)
+                result["reply"] = text
+            if text and self.text_to_speech:
+                with trace.span("tts"):
+                    result["audio"] = self._render(item["id"], text)
+            result["ok"] = bool(text) and (self.text_to_speech is None or result.get("audio") is not None)
+        except Exception as e:
+            result["error"] = str(e)
+        record = trace.record()
+        result["timings"] = dict(record["spans"], total=record["total_ms"])
+        return result
+
+    def _ask(self, command, trace, result):
+        # One command, retried when rate limited; every attempt gets a fresh thread so a failed run leaves nothing behind
+        for attempt in range(self.retries + 1):
+            with trace.span("backoff"):
+                self.backoff.wait()
+            result["attempts"] = attempt + 1
+            stats = {}
+            with trace.span("thread"):
+                thread_id = self.openai_client.create_thread()
+            if not thread_id:
+                raise RuntimeError("could not create a thread")
+            try:
+                with trace.span("assistant"):
+                    reply = self.openai_client.process_command_with_assistant(thread_id, command, self.assistant_id, stats, trace=trace)
+            finally:
+                self.openai_client.delete_thread(thread_id)
+            if reply is not None:
+                self.backoff.succeeded()
+                result.pop("error", None)
+                result["payload_bytes"] = stats.get("payload_bytes")
+                return reply
+            result["error"] = stats.get("error") or stats.get("status")
+            if not stats.get("rate_limited") or attempt == self.retries:
+                break
+            delay = self.backoff.rate_limited(stats.get("retry_after"))
+            with self.lock:
+                self.counters["retries"] += 1
+            vlog(f"Rate limited, retrying '{command}' in {delay:.1f}s")
+        raise RuntimeError(result.get("error") or "no reply")
+
+    def _render(self, item_id, text):
+        audio = self.text_to_speech.synthesize_audio(text)
+        if audio is None:
+            return None
+        os.makedirs(self.audio_directory, exist_ok=True)
+        path = os.path.join(self.audio_directory, re.sub(r"[^\w.-]", "_", item_id) + ".wav")
+        with open(path, "wb") as file:
+            file.write(audio)
+        return path
+
+    def _finished(self, future, output, slots):
+        try:
+            result = future.result()
+            with self.lock:
+                self.counters["items"] += 1
+                self.counters["ok" if result["ok"] else "failed"] += 1
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+        finally:
+            slots.release()  # Even if the result could not be written, or run() would wait forever
+
+
+def run_batch(args, config=None, openai_client=None, text_to_speech=None):
+    """
+    Entry point of "main.py batch": set up the clients, run the batch and clean up.
+
+    :return: The process exit code, 0 if every item succeeded.
+    """
+    from config import Config
+    from openai_client import OpenAIClient
+    from text_to_speech import TextToSpeech
+    from utils import configure_logging
+
+    configure_logging(stream=sys.stderr)  # stdout may be the results
+    config = config or Config()
+    config.run_poll_interval = args.poll_interval
+    openai_client = openai_client or OpenAIClient(config)
+    if args.tts and text_to_speech is None:
+        text_to_speech = TextToSpeech(config)
+
+    with open("system-prompt.txt", "r") as file:
+        prompt = file.read()
+    assistant_id = openai_client.get_or_create_assistant(prompt)
+    if not assistant_id:
+        log("No assistant available, giving up", error=True)
+        return 1
+
+    runner = BatchRunner(
+        config, openai_client, assistant_id, text_to_speech,
+        concurrency=args.concurrency, retries=args.retries, audio_directory=args.audio_dir,
+        backoff=Backoff(args.backoff, args.max_backoff)
+    )
+    source = sys.stdin if args.input == "-" else open(args.input, "r")
+    output = sys.stdout if args.output == "-" else open(args.output, "a")
+    try:
+        ok = runner.run(source, output)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        if not config.warm_start:
+            openai_client.delete_assistant(assistant_id)
+        openai_client.shutdown()
+    return 0 if ok else 1
@@ -0,0 +1,333 @@
+import argparse
+import glob
+import json
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from queue import Queue, Empty
+import numpy as np
+from config import Config
+from endpointer_eval import synthetic_case, load_recording
+from fake_backends import LatencyModel, FakeOpenAI, FakeTextToSpeech, ScriptedPorcupine, fake_get_weather
+from interaction import State
+from openai_client import OpenAIClient
+from tool_registry import registry
+from tracing import percentile
+from voice_assistant import VoiceAssistant
+from wake_word_detector import WakeWordDetector
+from utils import log, set_verbosity, flush
+
+NOISE_AMPLITUDE = 30  # about -60 dBFS of room noise between utterances
+
+
+class AudioFeeder:
+    # Plays queued utterances into the capture ring at (a multiple of) real time, with room noise in between
+    def __init__(self, capture, speed, seed):
+        self.capture = capture
+        self.block = capture.block_size
+        self.period = self.block / capture.sample_rate / speed
+        self.rng = np.random.default_rng(seed)
+        self.segments = Queue()
+        self.running = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.running.set()
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        self.thread.join()
+
+    def play(self, samples, mark_offset=None):
+        """
+        Queue samples to be fed after what is already queued.
+
+        :param mark_offset: Optional offset into samples whose feed time should be recorded.
+        :return: A dict that receives "start" (absolute sample index) and "mark_time" (perf_counter).
+        """
+        result = {"done": threading.Event()}
+        self.segments.put((samples, mark_offset, result))
+        return result
+
+    def _run(self):
+        deadline = time.perf_counter()
+        segment, mark_offset, result, offset = None, None, None, 0
+        while self.running.is_set():
+            if segment is None:
+                try:
+                    segment, mark_offset, result = self.segments.get_nowait()
+                    offset = 0
+                    result["start"] = self.capture.now()
+                except Empty:
+                    pass
+            if segment is None:
+                block = self.rng.normal(0, NOISE_AMPLITUDE, self.block).astype(np.int16)
+            else:
+                block = segment[offset:offset + self.block]
+                if len(block) < self.block:
+                    block = np.concatenate((block, self.rng.normal(0, NOISE_AMPLITUDE, self.block - len(block)).astype(np.int16)))
+            self.capture.feed(block)
+            if segment is not None:
+                if mark_offset is not None and offset <= mark_offset < offset + self.block:
+                    result["mark_time"] = time.perf_counter()
+                offset += self.block
+                if offset >= len(segment):
+                    result["done"].set()
+                    segment = None
+            deadline += self.period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+class BenchmarkAssistant(VoiceAssistant):
+    # The real VoiceAssistant with its cloud services, wake word engine and sound card swapped for local fakes
+    def __init__(self, config, latencies, reply_words):
+        self.latencies = latencies
+        self.reply_words = reply_words
+        self.results = Queue()
+        self.porcupine = ScriptedPorcupine(config.capture_sample_rate)
+        super().__init__(config)
+
+    def _create_text_to_speech(self):
+        return FakeTextToSpeech(self.config, self.archive, self.latencies["tts"])
+
+    def _create_openai_client(self):
+        return OpenAIClient(self.config, FakeOpenAI(self.latencies, self.reply_words))
+
+    def _init_wake_word(self):
+        detector = WakeWordDetector(self.config, self.audio_capture)
+        detector.porcupine = self.porcupine
+        return detector
+
+    def process_command(self, event, turn=None):
+        cpu_started = time.process_time()
+        try:
+            super().process_command(event, turn)
+        finally:
+            self.results.put({
+                "trace": turn.trace if turn else None,
+                "cancelled": bool(turn and turn.cancelled),
+                "cpu_ms": (time.process_time() - cpu_started) * 1000,
+                "rss_mb": resident_memory_mb(),
+            })
+
+
+def resident_memory_mb():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Peak, in KiB on Linux
+
+
+def load_utterances(paths, transcript, seed):
+    # (name, int16 samples with a quiet tail, offset where speech ends, transcript) per input file
+    transcripts = {}
+    for index_path in {os.path.join(os.path.dirname(path), "index.jsonl") for path in paths}:
+        if os.path.exists(index_path):
+            with open(index_path) as file:
+                for line in file:
+                    entry = json.loads(line)
+                    transcripts[entry["file"]] = entry["transcript"]
+    utterances = []
+    for path in paths:
+        audio, true_end = load_recording(path)
+        if audio is not None:
+            utterances.append((os.path.basename(path), audio, true_end, transcripts.get(os.path.basename(path), transcript)))
+    if not utterances:
+        # Nothing recorded yet: a synthetic four-word utterance over the same noise bed
+        audio, true_end = synthetic_case(np.random.default_rng(seed), [0.3, 0.25, 0.35, 0.3], 0.12, -60, -25)
+        utterances.append(("synthetic", audio, true_end, transcript))
+    return utterances
+
+
+def add_stand_in_arguments(parser):
+    # Options shared with load_test.py: what the stand-in services do and how slowly
+    parser.add_argument('--transcript', default="what's the weather in Paris", help='What the offline recognizer "hears" for files without an index.jsonl entry')
+    parser.add_argument('--polling', action='store_true', help='Use the polling assistant path instead of streaming')
+    parser.add_argument('--speculation', action='store_true', help='Send the question on a stable partial transcript')
+    parser.add_argument('--caches', action='store_true', help='Enable the response and speech caches (off by default to measure the cold path)')
+    parser.add_argument('--tts-streaming', action='store_true', help='Use streaming synthesis instead of one request per sentence')
+    parser.add_argument('--reply-words', type=int, default=30, help='Words in every assistant reply')
+    parser.add_argument('--api-request', default="lognormal:0.08,0.3", help='Latency of every assistant API request')
+    parser.add_argument('--llm-queue', default="lognormal:0.4,0.5", help='Time an assistant run is queued')
+    parser.add_argument('--llm-run', default="lognormal:1.5,0.4", help='Time an assistant run generates its reply')
+    parser.add_argument('--asr', default="lognormal:0.3,0.3", help='Final recognition latency')
+    parser.add_argument('--tts', default="lognormal:0.25,0.3", help='Latency of every synthesis request')
+    parser.add_argument('--weather', default="lognormal:0.3,0.5", help='Latency of get_weather')
+    parser.add_argument('--traces', default=None, help='Also keep the trace JSONL here')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-v', '--verbose', action='count', default=0)
+
+
+def install_stand_ins(args):
+    """
+    Build the latency models from the add_stand_in_arguments() options and swap in the fake get_weather.
+
+    :return: LatencyModels by name, for FakeOpenAI ("request", "queue", "run"), the offline
+        recognizer ("asr"), FakeTextToSpeech ("tts") and get_weather ("weather").
+    """
+    latencies = {
+        name: LatencyModel(spec, random.Random(args.seed + index))
+        for index, (name, spec) in enumerate((
+            ("request", args.api_request), ("queue", args.llm_queue), ("run", args.llm_run),
+            ("asr", args.asr), ("tts", args.tts), ("weather", args.weather),
+        ))
+    }
+    registry.tools["get_weather"].function = fake_get_weather(latencies["weather"])
+    return latencies
+
+
+def make_config(args, directory):
+    config = Config()
+    config.capture_input = "external"
+    config.audio_output = "null"
+    config.asr_backend = "offline"
+    config.stream_responses = not args.polling
+    config.warm_start = False
+    config.assistant_fingerprint_file = os.path.join(directory, "active.assistant.json")
+    config.resource_journal_file = os.path.join(directory, "resources.journal")
+    config.recordings_directory = os.path.join(directory, "recordings")
+    config.outputs_directory = os.path.join(directory, "outputs")
+    config.tts_cache_directory = os.path.join(directory, "tts_cache")
+    config.trace_file = args.traces or os.path.join(directory, "traces.jsonl")
+    config.response_cache_file = None
+    config.response_cache_enabled = args.caches
+    config.tts_cache_enabled = args.caches
+    config.tts_streaming = args.tts_streaming
+    config.speculation_enabled = args.speculation
+    config.tts_warmup_phrases = config.tts_warmup_phrases if args.caches else []
+    for path in (config.recordings_directory, config.outputs_directory, config.tts_cache_directory):
+        os.makedirs(path, exist_ok=True)
+    return config
+
+
+def run_turn(assistant, feeder, utterance, timeout):
+    name, audio, true_end, transcript = utterance
+    assistant.current_transcript = transcript
+    backend = assistant.speech_recognizer.backend
+    backend.latency = assistant.latencies["asr"].sample()
+    # Partial transcripts keep pace with the speech, so the last word is heard as the speaker stops
+    backend.words_per_second = len(transcript.split()) / max(true_end / assistant.config.capture_sample_rate, 0.1)
+
+    # Half a second of noise for the wake word, which "fires" at its end, then the command
+    wake = feeder.play(np.random.default_rng().normal(0, NOISE_AMPLITUDE, assistant.config.capture_sample_rate // 2).astype(np.int16))
+    spoken = feeder.play(audio, mark_offset=true_end)
+    while "start" not in wake:
+        time.sleep(0.001)
+    assistant.porcupine.schedule(wake["start"] + assistant.config.capture_sample_rate // 2)
+
+    result = assistant.results.get(timeout=timeout)
+    while assistant.interaction.state != State.IDLE:
+        time.sleep(0.005)
+    spoken["done"].wait(timeout)
+
+    record = result["trace"].record() if result["trace"] else {"spans": {}, "marks": {}, "total_ms": None}
+    first_audio = result["trace"].marks.get("first_audio") if result["trace"] else None
+    end_to_end = None
+    if first_audio is not None and "mark_time" in spoken:
+        end_to_end = (result["trace"].started + first_audio - spoken["mark_time"]) * 1000
+    return {
+        "input": name,
+        "transcript": transcript,
+        "outcome": record.get("attributes", {}).get("outcome"),
+        "speculation": record.get("attributes", {}).get("speculation"),
+        "end_to_end_ms": end_to_end,
+        "total_ms": record["total_ms"],
+        "spans": record["spans"],
+        "marks": record["marks"],
+        "cpu_ms": result["cpu_ms"],
+        "rss_mb": result["rss_mb"],
+    }
+
+
+def report(results, elapsed, output_path):
+    stages = {}
+    for result in results:
+        for name, value in result["spans"].items():
+            stages.setdefault(name, []).append(value)
+        for name, value in result["marks"].items():
+            stages.setdefault(f"@{name}", []).append(value)
+        for name in ("end_to_end_ms", "total_ms", "cpu_ms", "rss_mb"):
+            if result[name] is not None:
+                stages.setdefault(name, []).append(result[name])
+
+    flush()
+    print()
+    print(f"turns: {len(results)}  elapsed: {elapsed:.1f}s  throughput: {len(results) / elapsed * 60:.1f} turns/min")
+    print(f"  {'stage':<16s} {'count':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s}  (ms; rss in MB; @ = since the wake word)")
+    summary = {}
+    for name in sorted(stages, key=lambda name: (name.endswith(("_ms", "_mb")), name.startswith("@"), name)):
+        values = sorted(stages[name])
+        summary[name] = {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "p99": percentile(values, 0.99)}
+        print(f"  {name:<16s} {len(values):6d} {summary[name]['p50']:9.1f} {summary[name]['p95']:9.1f} {summary[name]['p99']:9.1f}")
+
+    if output_path:
+        with open(output_path, "w") as file:
+            json.dump({"timestamp": time.time(), "elapsed": elapsed, "summary": summary, "turns": results}, file, indent=2)
+        print(f"Results written to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay WAV files through the voice assistant with local stand-ins for every cloud service")
+    parser.add_argument('wavs', nargs='*', help='Utterances to replay (default: Config.recordings_directory/*.wav, or a synthetic one)')
+    parser.add_argument('--turns', type=int, default=None, help='Turns to run back to back (default: one per input)')
+    parser.add_argument('--speed', type=float, default=1.0, help='Feed audio this many times faster than real time')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for a turn before giving up')
+    parser.add_argument('--output', default='benchmark-results.json', help='Where to write the per-turn results')
+    add_stand_in_arguments(parser)
+    args = parser.parse_args()
+    set_verbosity(args.verbose)
+
+    latencies = install_stand_ins(args)
+
+    with tempfile.TemporaryDirectory(prefix="assistant-benchmark-") as directory:
+        config = make_config(args, directory)
+        paths = args.wavs or sorted(glob.glob(os.path.join(Config().recordings_directory, "*.wav")))
+        utterances = load_utterances(paths, args.transcript, args.seed)
+
+        # The offline recognizer "hears" whatever the current turn's transcript is
+        config.asr_offline_transcript = lambda: assistant.current_transcript
+        assistant = BenchmarkAssistant(config, latencies, args.reply_words)
+        feeder = AudioFeeder(assistant.audio_capture, args.speed, args.seed)
+        feeder.start()
+        assistant.start()
+        dispatcher = threading.Thread(target=assistant.interaction.run, daemon=True)
+        dispatcher.start()
+
+        # Let the noise floor estimate settle before the first turn
+        time.sleep((config.noise_update_interval * 2 + 0.5) / args.speed)
+
+        turns = args.turns or len(utterances)
+        results = []
+        started = time.perf_counter()
+        try:
+            for index in range(turns):
+                utterance = utterances[index % len(utterances)]
+                try:
+                    result = run_turn(assistant, feeder, utterance, args.timeout)
+                except Empty:
+                    log(f"Turn {index + 1} timed out after {args.timeout}s", error=True)
+                    break
+                results.append(result)
+                flush()  # Keep the turn line after the log lines of its turn
+                e2e = f"{result['end_to_end_ms']:.0f} ms" if result["end_to_end_ms"] is not None else "n/a"
+                print(f"turn {index + 1:4d} {result['input']:<28s} {result['outcome'] or '?':<10s} speech end -> first audio {e2e:>9s}  cpu {result['cpu_ms']:.0f} ms")
+        finally:
+            elapsed = time.perf_counter() - started
+            assistant.interaction.post("stop")
+            dispatcher.join()
+            feeder.stop()
+            assistant.cleanup()
+
+        if results:
+            report(results, elapsed, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,21 +21,167 @@ class Config:
         self.pitch = -5.0
         self.output_audio_file = 'output.wav'
 
+        # Audio output configurations
+        self.audio_output = "device"  # "device", or "null" to mix in real time and discard the result
+        self.mixer_sample_rate = 44100
+        self.mixer_block_size = 256
+
+        # Speech synthesis configurations
+        self.tts_streaming = False  # receive audio while it is synthesized; needs a voice that supports it
+        self.tts_streaming_voice = "en-US-Chirp3-HD-Charon"  # None to try voice_name; pitch does not apply
+        self.tts_transfer_encoding = "LINEAR16"  # or "OGG_OPUS" (smaller replies, needs the soundfile package)
+
+        # Speech cache configurations
+        self.tts_cache_enabled = True
+        self.tts_cache_directory = os.path.join('outputs', 'tts_cache')
+        self.tts_cache_memory_budget = 16 * 1024 * 1024  # bytes
+        self.tts_cache_disk_budget = 256 * 1024 * 1024  # bytes
+        self.tts_warmup_phrases = [
+            "I'm sorry, I can't process your request right now.",
+            "Okay.",
+            "Sure.",
+            "Done.",
+        ]
+
+        # Response cache configurations
+        self.response_cache_enabled = True
+        self.response_cache_file = "response_cache.json"
+        self.response_cache_max_entries = 512
+        self.response_cache_similarity = 0.9  # trigram cosine similarity for near-duplicate questions
+        self.response_cache_default_ttl = 7 * 24 * 3600  # seconds
+        # (name, words, ttl in seconds); the first rule with a word in the question decides, a ttl of 0 disables caching
+        self.response_cache_rules = [
+            ("contextual", ("that", "this", "it", "those", "them", "again", "more", "else", "previous", "last", "earlier"), 0),
+            ("varied", ("joke", "story", "poem", "random", "riddle"), 0),
+            ("weather", ("weather", "temperature", "forecast", "rain", "raining", "snow", "snowing", "wind", "windy", "sunny", "humidity", "cold", "hot"), 600),
+            ("current", ("today", "tonight", "tomorrow", "now", "current", "currently", "latest", "news", "score", "price", "stock", "open"), 1800),
+        ]
+
+        # Assistant configurations
+        self.assistant_model = "gpt-3.5-turbo-1106"
+        self.warm_start = True  # reuse the assistant from the last run when its definition is unchanged
+        self.assistant_fingerprint_file = "active.assistant.json"
+        self.cleanup_max_workers = 8
+        self.cleanup_retries = 2
+        self.resource_journal_file = "resources.journal"
+        self.resource_journal_fsync_interval = 1.0  # seconds between batched fsyncs of delete records
+        self.resource_journal_compact_threshold = 256  # dead records before the journal is rewritten
+        self.message_fetch_limit = 10  # newest messages fetched after each command
+        self.run_poll_interval = 1.0  # seconds between run status checks when responses are not streamed
+
+        # Conversation context configurations
+        self.conversation_max_messages = 40  # start a fresh thread after this many messages
+        self.conversation_max_tokens = 6000  # or after roughly this many tokens
+        self.conversation_recent_turns = 6  # turns folded into the summary carried to the new thread
+        self.conversation_turn_summary_chars = 200
+        self.conversation_summary_chars = 1500
+        self.conversation_drain_timeout = 120  # seconds rotation waits for turns on the old thread before deleting it
+
+        # Assistant function configurations
+        self.tool_max_workers = 4
+        self.tool_timeout = 10  # seconds
+        self.http_connect_timeout = 3.05
+        self.http_read_timeout = 8
+        self.http_retries = 2
+        self.weather_cache_ttl = 600  # seconds
+        self.openweathermap_url = "http://api.openweathermap.org/data/2.5/weather"  # e.g. a local stand-in for tests
+
+        # Tracing configurations
+        self.tracing_enabled = True
+        self.trace_file = "traces.jsonl"  # one JSON line of per-stage timings per voice turn
+        self.trace_queue_size = 256
+
+        # Logging configurations
+        self.log_json = False  # one JSON object per log line instead of colored text
+        self.log_rate_limit_burst = 5  # identical errors shown per interval before further repeats are counted instead
+        self.log_rate_limit_interval = 10.0  # seconds
+
+        # Interaction configurations
+        self.wake_debounce_seconds = 1.0  # repeated wake words this soon after one that started listening are ignored
+        self.barge_in_fade_seconds = 0.05  # how quickly playback fades out when the wake word interrupts a reply
+
+        # Speculative execution configurations (streamed responses only)
+        self.speculation_enabled = False  # send the question while the user may still be talking
+        self.speculation_stable_ms = 350  # how long a partial transcript must stay unchanged to be sent
+        # Regular expressions over the normalized partial transcript that mark a question as complete right away
+        self.speculation_complete_patterns = [
+            r"\b(weather|forecast|temperature) (in|for) \w+$",
+            r"\b(thanks|thank you|please)$",
+        ]
+        self.speculation_discard_timeout = 5  # seconds to wait for a cancelled speculative run to stop
+
+        # Server mode configurations ("main.py serve")
+        self.server_sessions = []  # used when none are given on the command line, e.g. ["kitchen=device:2", "hall=socket:/tmp/hall.sock"]
+        self.server_detector_processes = None  # wake word and endpointing worker processes; None for one per core
+        self.server_detector_batch_frames = 2  # wake word frames sent to a worker at a time
+        self.server_detector_timeout = 5  # seconds to wait for a worker to answer
+        self.server_wav_gap_seconds = 2.0  # silence fed after a WAV source, before it repeats with --loop
+
+        # Local intent configurations
+        self.intent_confidence_threshold = 0.85  # below this, commands go to the assistant
+        self.volume_step = 0.1
+
+        # Response streaming configurations
+        self.stream_responses = True
+        self.segment_min_chars = 20
+        self.segment_clause_min_chars = 80
+
+        # Microphone capture configurations
+        self.capture_input = "microphone"  # or "external" when audio is pushed in with AudioCapture.feed()
+        self.capture_device = None  # sounddevice input device index or name; None for the system default
+        self.capture_sample_rate = 16000  # Porcupine requires 16 kHz
+        self.capture_block_size = 512
+        self.capture_buffer_seconds = 30
+        self.command_preroll_seconds = 0.1  # audio kept from just before the wake word ended
+
+        # Noise floor tracking configurations
+        self.noise_update_interval = 0.5  # seconds of idle audio per estimate
+        self.noise_window_seconds = 10  # recent idle audio the estimate is taken over
+        self.noise_percentile = 20  # frame level percentile taken as the floor; low enough to ignore speech
+        self.noise_min_change_db = 1.0  # smaller moves of the estimate are not applied
+        self.noise_history_size = 500  # threshold updates kept for diagnostics
+
         # Recognition configurations
-        self.noise_calibration_time = 3
         self.command_await_timeout = 5
         self.recognizer_pause_threshold = 0.3
         self.recognizer_phrase_threshold = 0.3
         self.recognizer_non_speaking_duration = 0.2
 
+        # Speech recognition backend configurations
+        self.asr_backend = "google"  # "google" or "offline"
+        self.asr_offline_transcript = ""  # what the offline stand-in backend "hears"
+        self.asr_pause_hint_ms = 160  # silence after which the backend starts transcribing speculatively
+
+        # Voice activity endpointing configurations
+        self.vad_frame_ms = 20
+        self.vad_threshold_db = 9.0  # how far above the noise floor a frame must be to count as speech
+        self.vad_hangover_ms = 100
+        self.vad_min_speech_ms = 60
+        self.vad_trailing_silence = 0.5  # seconds of silence that end an utterance
+        self.vad_padding_seconds = 0.15
+        self.vad_max_utterance_seconds = 15
+
         # Wake word configurations
         self.key_word = "Hey Magi"
         self.custom_wake_word_file = "wake-word.ppn"
 
         # Directories
+        self.sounds_directory = 'sounds'
         self.recordings_directory = 'recordings'
         self.outputs_directory = 'outputs'
 
+        # Archive configurations
+        self.archive_queue_size = 32
+        self.archive_compress = False  # store recordings as FLAC instead of WAV
+        self.archive_tts_replies = True  # keep a copy of every newly synthesized reply in the outputs directory
+        self.archive_index_file = 'index.jsonl'
+        self.archive_max_bytes = {
+            self.recordings_directory: 500 * 1024 * 1024,
+            self.outputs_directory: 200 * 1024 * 1024,
+        }
+        self.archive_max_age_days = 30
+        self.archive_prune_interval = 60  # seconds
+
         # Ensure necessary directories exist
         if not os.path.exists(self.recordings_directory):
             os.makedirs(self.recordings_directory)
\ No newline at end of file
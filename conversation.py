@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import deque
+from utils import log, vlog, vvlog
+
+
+class Conversation:
+    """
+    Owns the assistant thread for a session and keeps it bounded.
+
+    Once the thread passes Config.conversation_max_messages or Config.conversation_max_tokens
+    (estimated at four characters per token), a fresh thread is started that carries a compact
+    rolling summary of the recent turns, and the old thread is deleted in the background once the
+    turns still running on it have finished.
+    """
+    def __init__(self, config, openai_client, thread_id):
+        self.config = config
+        self.openai_client = openai_client
+        self.thread_id = thread_id
+        self.lock = threading.Lock()
+        self.turns_finished = threading.Condition(self.lock)
+        self.in_flight = {}  # thread id -> turns running on it
+        self.message_count = 0
+        self.token_estimate = 0
+        self.summary = ""
+        self.recent_turns = deque(maxlen=self.config.conversation_recent_turns)
+        self.turn_stats = deque(maxlen=100)
+        self.rotating = False
+
+    def ask(self, command, assistant_id, cancel=None, trace=None):
+        # Run one turn and wait for the whole reply
+        stats = {}
+        started = time.perf_counter()
+        thread_id = self._begin_turn()
+        try:
+            reply = self.openai_client.process_command_with_assistant(thread_id, command, assistant_id, stats, cancel, trace)
+        finally:
+            self._end_turn(thread_id)
+        stats["latency"] = time.perf_counter() - started
+        if reply and not (cancel is not None and cancel.is_set()):
+            self._record_turn(command, reply, stats)
+        return reply
+
+    def stream(self, command, assistant_id, cancel=None, trace=None, created=None, record=True):
+        # Run one turn, yielding the reply as it is generated; created receives the ids for discard()
+        # With record=False the finished turn is only counted once it is passed to keep()
+        started = time.perf_counter()
+        first_token = None
+        parts = []
+        thread_id = self._begin_turn()
+        tokens = self.openai_client.stream_command_with_assistant(thread_id, command, assistant_id, cancel, trace, created)
+        try:
+            for token in tokens:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                    if trace:
+                        trace.mark("first_token")
+                parts.append(token)
+                yield token
+        finally:
+            tokens.close()  # Cancels the run if we stopped early
+            self._end_turn(thread_id)
+        reply = "".join(parts)
+        if reply and not (cancel is not None and cancel.is_set()):
+            stats = {"latency": time.perf_counter() - started, "first_token": first_token, "payload_bytes": len(reply.encode("utf-8"))}
+            if record:
+                self._record_turn(command, reply, stats)
+            elif created is not None:
+                created["turn"] = (command, reply, stats)
+
+    def keep(self, created):
+        # Count a turn streamed with record=False, once it is known to stay in the thread
+        turn = created.pop("turn", None)
+        if turn is not None:
+            self._record_turn(*turn)
+
+    def discard(self, created, timeout=5):
+        # Remove a cancelled turn from the thread it ran on, even if the conversation has rotated since
+        created.pop("turn", None)  # Never counted, so there is nothing to undo
+        self.openai_client.discard_turn(created, timeout)
+
+    def _begin_turn(self):
+        # The thread a new turn runs on; rotate() does not delete it until _end_turn()
+        with self.lock:
+            self.in_flight[self.thread_id] = self.in_flight.get(self.thread_id, 0) + 1
+            return self.thread_id
+
+    def _end_turn(self, thread_id):
+        with self.lock:
+            self.in_flight[thread_id] -= 1
+            if not self.in_flight[thread_id]:
+                del self.in_flight[thread_id]
+                self.turns_finished.notify_all()
+
+    def _record_turn(self, command, reply, stats):
+        with self.lock:
+            self.message_count += 2
+            self.token_estimate += (len(command) + len(reply)) // 4
+            self.recent_turns.append((command, reply))
+            stats.update(messages=self.message_count, tokens=self.token_estimate)
+            self.turn_stats.append(stats)
+            rotate = not self.rotating and (
+                self.message_count >= self.config.conversation_max_messages
+                or self.token_estimate >= self.config.conversation_max_tokens
+            )
+            if rotate:
+                self.rotating = True
+        vvlog("Turn stats: %s", stats)
+        if rotate:
+            # Rotate between turns so the next question does not wait for it
+            threading.Thread(target=self.rotate, daemon=True).start()
+
+    def rotate(self):
+        summary = self._build_summary()
+        vlog(f"Rotating conversation thread after {self.message_count} messages (~{self.token_estimate} tokens)...")
+        messages = [{"role": "user", "content": f"(Context from earlier in our conversation: {summary})"}] if summary else []
+        new_thread_id = self.openai_client.create_thread(messages)
+        if not new_thread_id:
+            with self.lock:
+                self.rotating = False
+            return
+
+        with self.lock:
+            old_thread_id = self.thread_id
+            self.thread_id = new_thread_id
+            self.summary = summary
+            self.message_count = len(messages)
+            self.token_estimate = len(summary) // 4
+            self.recent_turns.clear()
+            self.rotating = False
+            # Turns and speculative runs that started before the swap are still using the old thread
+            drained = self.turns_finished.wait_for(
+                lambda: old_thread_id not in self.in_flight, self.config.conversation_drain_timeout
+            )
+        if not drained:
+            log("Turns on thread %s did not finish within %ss; leaving it for cleanup at exit",
+                old_thread_id, self.config.conversation_drain_timeout, error=True)
+            return
+        self.openai_client.delete_thread(old_thread_id, retries=self.config.cleanup_retries)
+
+    def _build_summary(self):
+        # Fold the recent turns into the previous summary, keeping the newest text within the budget
+        limit = self.config.conversation_turn_summary_chars
+        with self.lock:
+            lines = [self.summary] if self.summary else []
+            for command, reply in self.recent_turns:
+                lines.append(f"I asked: {command[:limit]} You said: {reply[:limit]}")
+        summary = " ".join(lines)
+        return summary[-self.config.conversation_summary_chars:]
+
+    def stats(self):
+        with self.lock:
+            turns = list(self.turn_stats)
+        if not turns:
+            return {"turns": 0}
+        return {
+            "turns": len(turns),
+            "messages": self.message_count,
+            "tokens": self.token_estimate,
+            "avg_latency": sum(turn["latency"] for turn in turns) / len(turns),
+            "avg_payload_bytes": sum(turn.get("payload_bytes", 0) for turn in turns) / len(turns),
+        }
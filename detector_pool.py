@@ -0,0 +1,316 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from queue import Queue, Empty
+from lazy_import import lazy_import
+from wake_word_detector import WakeWordDetector, WakeWordEvent
+from utils import log, vlog, vvlog
+
+np = lazy_import("numpy")
+pvporcupine = lazy_import("pvporcupine")
+
+
+def create_porcupine(access_key, keyword_path):
+    # Default wake word engine factory; runs inside the worker process
+    return pvporcupine.create(access_key=access_key, keyword_paths=[keyword_path])
+
+
+def _endpoint_state(endpointer):
+    return {
+        "ended": endpointer.ended,
+        "speech_start": endpointer.speech_start,
+        "speech_end": endpointer.speech_end,
+        "silence_run": endpointer.silence_run,
+        "noise_floor_db": endpointer.noise_floor_db,
+    }
+
+
+def _shard_main(shard, inbox, outbox, stats_interval):
+    # Worker process: runs the wake word engine and the endpointer of every session assigned to this shard
+    engines = {}
+    endpointers = {}
+    stats = {"sessions": 0, "frames": 0, "busy_seconds": 0.0, "max_delay_ms": 0.0}
+    next_report = time.monotonic() + stats_interval
+    while True:
+        try:
+            message = inbox.get(timeout=stats_interval)
+        except Empty:
+            message = ()
+        if message is None:
+            break
+        started = time.perf_counter()
+        if message:
+            kind, session_id = message[0], message[1]
+            try:
+                if kind == "audio":
+                    _, _, position, data, sent = message
+                    # How far behind real time this shard is running
+                    stats["max_delay_ms"] = max(stats["max_delay_ms"], (time.time() - sent) * 1000)
+                    engine = engines.get(session_id)
+                    if engine is not None:
+                        samples = np.frombuffer(data, dtype=np.int16)
+                        length = engine.frame_length
+                        for offset in range(0, len(samples) - length + 1, length):
+                            stats["frames"] += 1
+                            keyword_index = engine.process(samples[offset:offset + length])
+                            if keyword_index >= 0:
+                                outbox.put(("wake", session_id, keyword_index, position + offset + length, time.time()))
+                elif kind == "vad":
+                    _, _, call_id, data, reset = message
+                    endpointer = endpointers[session_id]
+                    if reset:
+                        endpointer.reset()
+                    endpointer.process(np.frombuffer(data, dtype=np.int16))
+                    outbox.put(("reply", call_id, _endpoint_state(endpointer), None))
+                elif kind == "seed":
+                    endpointers[session_id].seed_noise_floor(message[2])
+                elif kind == "open_wake":
+                    _, _, call_id, factory, arguments = message
+                    engine = factory(**arguments)
+                    engines[session_id] = engine
+                    outbox.put(("reply", call_id, (engine.sample_rate, engine.frame_length), None))
+                elif kind == "open_vad":
+                    _, _, call_id, endpointer = message
+                    endpointers[session_id] = endpointer
+                    outbox.put(("reply", call_id, None, None))
+                elif kind == "close":
+                    engine = engines.pop(session_id, None)
+                    if engine is not None:
+                        engine.delete()
+                    endpointers.pop(session_id, None)
+                stats["sessions"] = len(engines.keys() | endpointers.keys())
+            except Exception as e:
+                if kind in ("vad", "open_wake", "open_vad"):
+                    outbox.put(("reply", message[2], None, f"{type(e).__name__}: {e}"))
+                else:
+                    outbox.put(("error", session_id, f"{kind} failed: {e}"))
+        stats["busy_seconds"] += time.perf_counter() - started
+        if time.monotonic() >= next_report:
+            outbox.put(("stats", shard, dict(stats, cpu_seconds=time.process_time())))
+            stats["max_delay_ms"] = 0.0
+            next_report = time.monotonic() + stats_interval
+    for engine in engines.values():
+        engine.delete()
+
+
+class DetectorPool:
+    """
+    Worker processes that run wake word detection and voice activity endpointing for server sessions.
+
+    Each session is assigned to the shard with the fewest sessions and stays there, so its wake
+    word engine and endpointer keep their state in one process. Audio goes to the workers as raw
+    int16 bytes; wake words come back as events, endpointing as a reply to each block. This keeps
+    the per-frame work of many sessions off the main process, where it would compete for the GIL
+    with the rest of the assistant.
+    """
+    def __init__(self, config, processes=None):
+        self.config = config
+        self.processes = processes or self.config.server_detector_processes or os.cpu_count() or 1
+        self.timeout = self.config.server_detector_timeout
+        self.context = multiprocessing.get_context("spawn")  # Workers must not inherit the parent's threads
+        self.outbox = None
+        self.shards = []
+        self.collector = None
+        self.lock = threading.Lock()
+        self.sessions = {}  # session id -> (shard index, wake callback)
+        self.calls = {}  # call id -> queue for the reply
+        self.call_ids = itertools.count()
+        self.shard_stats = {}
+
+    def start(self):
+        self.outbox = self.context.Queue()
+        for shard in range(self.processes):
+            inbox = self.context.Queue()
+            process = self.context.Process(
+                target=_shard_main, args=(shard, inbox, self.outbox, 1.0), name=f"detector-{shard}", daemon=True
+            )
+            process.start()
+            self.shards.append((process, inbox))
+        self.collector = threading.Thread(target=self._collect, name="detector-collector", daemon=True)
+        self.collector.start()
+        vlog(f"Started {self.processes} detector processes")
+
+    def _collect(self):
+        # Route what the workers send back to the sessions, until shutdown() sends None
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                break
+            kind = message[0]
+            if kind == "stats":
+                self.shard_stats[message[1]] = message[2]
+                continue
+            if kind == "reply":
+                replies = self.calls.get(message[1])
+                if replies is not None:
+                    replies.put((message[2], message[3]))
+                continue
+            slot = self.sessions.get(message[1])
+            if slot is None:
+                continue
+            if kind == "wake":
+                _, _, keyword_index, sample_index, timestamp = message
+                if slot[1] is not None:
+                    slot[1](WakeWordEvent(keyword_index, sample_index, timestamp))
+            elif kind == "error":
+                log("Detector worker error for session %s: %s", message[1], message[2], error=True)
+
+    def _slot(self, session_id):
+        with self.lock:
+            slot = self.sessions.get(session_id)
+            if slot is None:
+                counts = [0] * len(self.shards)
+                for shard, _ in self.sessions.values():
+                    counts[shard] += 1
+                slot = (counts.index(min(counts)), None)
+                self.sessions[session_id] = slot
+            return slot
+
+    def _send(self, session_id, message):
+        self.shards[self._slot(session_id)[0]][1].put(message)
+
+    def _call(self, session_id, kind, *arguments):
+        # One request to the session's worker, waiting for its reply
+        call_id = next(self.call_ids)
+        replies = self.calls[call_id] = Queue(maxsize=1)
+        self._send(session_id, (kind, session_id, call_id) + arguments)
+        try:
+            result, error = replies.get(timeout=self.timeout)
+        except Empty:
+            raise RuntimeError(f"Detector worker did not answer within {self.timeout}s") from None
+        finally:
+            del self.calls[call_id]
+        if error is not None:
+            raise RuntimeError(f"Detector worker failed: {error}")
+        return result
+
+    def open_wake_word(self, session_id, factory, arguments, on_wake):
+        """
+        Create a wake word engine for a session in its worker process.
+
+        :param factory: A picklable module-level callable that builds the engine from arguments.
+        :param on_wake: Called with a WakeWordEvent, on the collector thread, for every detection.
+        :return: The engine's (sample_rate, frame_length).
+        """
+        shard, _ = self._slot(session_id)
+        with self.lock:
+            self.sessions[session_id] = (shard, on_wake)
+        return self._call(session_id, "open_wake", factory, arguments)
+
+    def open_endpointer(self, session_id, endpointer):
+        # The worker keeps its own copy of the endpointer, settings and noise floor included
+        self._call(session_id, "open_vad", endpointer)
+
+    def feed(self, session_id, position, samples):
+        # Queue whole wake word frames starting at absolute capture index position
+        self._send(session_id, ("audio", session_id, position, samples.tobytes(), time.time()))
+
+    def endpoint(self, session_id, samples, reset=False):
+        return self._call(session_id, "vad", samples.tobytes(), reset)
+
+    def seed_noise_floor(self, session_id, level_db):
+        self._send(session_id, ("seed", session_id, level_db))
+
+    def close(self, session_id):
+        with self.lock:
+            slot = self.sessions.pop(session_id, None)
+        if slot is not None:
+            self.shards[slot[0]][1].put(("close", session_id))
+
+    def stats(self):
+        with self.lock:
+            assigned = [0] * len(self.shards)
+            for shard, _ in self.sessions.values():
+                assigned[shard] += 1
+        return [dict(self.shard_stats.get(shard, {}), shard=shard, assigned=assigned[shard]) for shard in range(len(self.shards))]
+
+    def shutdown(self, timeout=5):
+        for _, inbox in self.shards:
+            inbox.put(None)
+        for process, _ in self.shards:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        if self.collector is not None:
+            self.outbox.put(None)
+            self.collector.join(timeout)
+        vlog(f"Detector pool stats: {self.stats()}")
+
+
+class RemoteWakeWordDetector(WakeWordDetector):
+    # WakeWordDetector for a server session: frames are sent to a DetectorPool worker instead of a local Porcupine
+    def __init__(self, config, capture, pool, session_id, engine):
+        super().__init__(config, capture)
+        self.pool = pool
+        self.session_id = session_id
+        self.engine = engine  # (factory, arguments) for DetectorPool.open_wake_word
+        self.frame_length = None
+        self.batch_frames = self.config.server_detector_batch_frames
+
+    def init_porcupine(self):
+        if self.frame_length is not None:
+            return
+        factory, arguments = self.engine
+        sample_rate, self.frame_length = self.pool.open_wake_word(self.session_id, factory, arguments, self.events.put)
+        if sample_rate != self.capture.sample_rate:
+            raise ValueError(f"The wake word engine expects {sample_rate} Hz audio, capture runs at {self.capture.sample_rate} Hz")
+
+    def _process_frames(self):
+        # Forward the capture ring to the worker a few frames at a time; detections arrive on self.events
+        count = self.frame_length * self.batch_frames
+        while self.running.is_set():
+            samples = self.reader.read(count, timeout=0.1)
+            if samples is None:
+                continue
+            self.pool.feed(self.session_id, self.reader.position - len(samples), samples)
+
+    def shutdown(self):
+        super().shutdown()
+        self.pool.close(self.session_id)
+
+
+class RemoteEndpointer:
+    """
+    Stand-in for the Endpointer of a SpeechRecognizer whose frames are processed in a DetectorPool worker.
+
+    Takes a configured Endpointer as the template and mirrors the state SpeechRecognizer reads
+    after every process() call, which is one round trip to the worker.
+    """
+    def __init__(self, pool, session_id, endpointer):
+        self.pool = pool
+        self.session_id = session_id
+        self.sample_rate = endpointer.sample_rate
+        self.frame_length = endpointer.frame_length
+        self.noise_floor_db = endpointer.noise_floor_db
+        self.pool.open_endpointer(session_id, endpointer)
+        self.reset()
+
+    def reset(self):
+        # Sent along with the next block, which saves a round trip
+        self.pending_reset = True
+        self.speech_start = None
+        self.speech_end = None
+        self.silence_run = 0
+        self.ended = False
+
+    def seed_noise_floor(self, level_db):
+        self.noise_floor_db = level_db
+        self.pool.seed_noise_floor(self.session_id, level_db)
+
+    @property
+    def in_speech(self):
+        return self.speech_start is not None and not self.ended
+
+    def process(self, samples):
+        if self.ended:
+            return True
+        state = self.pool.endpoint(self.session_id, samples, self.pending_reset)
+        self.pending_reset = False
+        self.ended = state["ended"]
+        self.speech_start = state["speech_start"]
+        self.speech_end = state["speech_end"]
+        self.silence_run = state["silence_run"]
+        self.noise_floor_db = state["noise_floor_db"]
+        return self.ended
@@ -0,0 +1,110 @@
+from lazy_import import lazy_import
+from utils import log, vlog, vvlog
+
+np = lazy_import("numpy")
+
+
+def frame_energies_db(samples, frame_length):
+    # RMS level in dBFS of every complete frame, computed in one vectorized pass
+    count = len(samples) // frame_length
+    frames = samples[:count * frame_length].reshape(count, frame_length).astype(np.float32) / 32768
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-6))
+
+
+class Endpointer:
+    """
+    Incremental voice-activity detector that decides when an utterance has ended.
+
+    Frames louder than the tracked noise floor by threshold_db count as speech. Speech must last
+    min_speech_ms to start an utterance, short dips are bridged by hangover_ms, and the utterance
+    ends once trailing_silence seconds pass without speech.
+    """
+    def __init__(self, sample_rate, frame_ms=20, threshold_db=9.0, hangover_ms=100, min_speech_ms=60,
+                 trailing_silence=0.5, noise_rise_rate=0.02, noise_fall_rate=0.3):
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.threshold_db = threshold_db
+        self.hangover_frames = max(1, round(hangover_ms / frame_ms))
+        self.min_speech_frames = max(1, round(min_speech_ms / frame_ms))
+        self.trailing_frames = max(1, round(trailing_silence * 1000 / frame_ms))
+        # The floor follows quiet frames quickly and loud frames slowly, so speech barely lifts it
+        self.noise_rise_rate = noise_rise_rate
+        self.noise_fall_rate = noise_fall_rate
+        self.noise_floor_db = None
+        self.reset()
+
+    def reset(self):
+        # Start a new utterance; the noise floor is kept
+        self.pending = np.zeros(0, dtype=np.int16)
+        self.frames_seen = 0
+        self.speech_run = 0
+        self.hangover = 0
+        self.silence_run = 0
+        self.speech_start = None  # Sample offsets relative to the first sample given after reset()
+        self.speech_end = None
+        self.ended = False
+
+    def seed_noise_floor(self, level_db):
+        self.noise_floor_db = level_db
+
+    def set_trailing_silence(self, seconds):
+        self.trailing_frames = max(1, round(seconds * self.sample_rate / self.frame_length))
+
+    @property
+    def in_speech(self):
+        return self.speech_start is not None and not self.ended
+
+    def process(self, samples):
+        """
+        Feed the next block of int16 samples.
+
+        :return: True once the end of the utterance has been detected.
+        """
+        if self.ended:
+            return True
+        if len(self.pending):
+            samples = np.concatenate((self.pending, samples))
+        usable = len(samples) - len(samples) % self.frame_length
+        self.pending = samples[usable:].copy()
+        if usable == 0:
+            return False
+
+        for level in frame_energies_db(samples[:usable], self.frame_length):
+            self._process_frame(float(level))
+            self.frames_seen += 1
+            if self.ended:
+                break
+        return self.ended
+
+    def _process_frame(self, level):
+        if self.noise_floor_db is None:
+            self.noise_floor_db = level
+        is_speech = level > self.noise_floor_db + self.threshold_db
+
+        if is_speech:
+            # Let the floor creep up even during speech so a room that gets louder is not stuck as "speech"
+            self.noise_floor_db += self.noise_rise_rate * 0.1 * (level - self.noise_floor_db)
+            self.speech_run += 1
+            self.hangover = self.hangover_frames
+            self.silence_run = 0
+            if self.speech_start is None and self.speech_run >= self.min_speech_frames:
+                self.speech_start = (self.frames_seen + 1 - self.speech_run) * self.frame_length
+            if self.speech_start is not None:
+                self.speech_end = (self.frames_seen + 1) * self.frame_length
+            return
+
+        # Track the floor on non-speech frames only
+        rate = self.noise_fall_rate if level < self.noise_floor_db else self.noise_rise_rate
+        self.noise_floor_db += rate * (level - self.noise_floor_db)
+
+        # Short dips inside a word do not break a run of speech frames
+        if self.hangover > 0:
+            self.hangover -= 1
+        else:
+            self.speech_run = 0
+
+        if self.speech_start is not None:
+            self.silence_run += 1
+            if self.silence_run >= self.trailing_frames:
+                self.ended = True
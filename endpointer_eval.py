@@ -0,0 +1,119 @@
+import argparse
+import glob
+import os
+from math import gcd
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+from config import Config
+from endpointer import Endpointer, frame_energies_db
+
+SAMPLE_RATE = 16000
+CHUNK = 1024
+
+
+def synthetic_case(rng, words, pause, noise_db, speech_db, tail=1.5):
+    """
+    Build an utterance of noise-like "words" separated by pauses over a constant noise bed.
+
+    :return: A tuple of (int16 samples, sample index where speech truly ends).
+    """
+    segments = [rng.normal(0, 1, int(0.4 * SAMPLE_RATE))]  # Leading silence
+    for index, duration in enumerate(words):
+        if index:
+            segments.append(rng.normal(0, 1, int(pause * SAMPLE_RATE)))
+        envelope = np.sin(np.linspace(0, np.pi, int(duration * SAMPLE_RATE))) ** 0.3
+        segments.append(rng.normal(0, 1, len(envelope)) * envelope * 10 ** ((speech_db - noise_db) / 20))
+    segments.append(rng.normal(0, 1, int(tail * SAMPLE_RATE)))
+
+    true_end = sum(len(segment) for segment in segments[:-1])
+    audio = np.concatenate(segments) * 32768 * 10 ** (noise_db / 20)
+    return np.clip(audio, -32768, 32767).astype(np.int16), true_end
+
+
+def load_recording(path, tail=1.5):
+    # Recordings only hold the utterance; append a copy of their quietest stretch so the endpoint can fire
+    fs, data = wavfile.read(path)
+    if data.ndim > 1:
+        data = data.mean(axis=1)
+    if fs != SAMPLE_RATE:
+        divisor = gcd(fs, SAMPLE_RATE)
+        data = resample_poly(data.astype(np.float32), SAMPLE_RATE // divisor, fs // divisor)
+    data = data.astype(np.int16)
+
+    frame = SAMPLE_RATE // 50
+    levels = frame_energies_db(data, frame)
+    if not len(levels):
+        return None, None
+    quiet = int(np.argmin(levels))
+    noise = np.resize(data[quiet * frame:(quiet + 1) * frame], int(tail * SAMPLE_RATE))
+
+    # Without labels, treat the last frame well above the quietest level as the end of speech
+    loud = np.nonzero(levels > levels.min() + 15)[0]
+    true_end = (int(loud[-1]) + 1) * frame if len(loud) else len(data)
+    return np.concatenate((data, noise)), true_end
+
+
+def run_case(endpointer, audio):
+    # Feed audio in capture-sized chunks and return the sample at which the endpoint fired
+    endpointer.noise_floor_db = None
+    endpointer.reset()
+    for start in range(0, len(audio), CHUNK):
+        if endpointer.process(audio[start:start + CHUNK]):
+            return min(len(audio), start + CHUNK)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure endpoint latency and false cuts")
+    parser.add_argument('--recordings', default=None, help='Directory of recorded utterances (default: Config.recordings_directory)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config = Config()
+    endpointer = Endpointer(
+        SAMPLE_RATE,
+        frame_ms=config.vad_frame_ms,
+        threshold_db=config.vad_threshold_db,
+        hangover_ms=config.vad_hangover_ms,
+        min_speech_ms=config.vad_min_speech_ms,
+        trailing_silence=config.vad_trailing_silence
+    )
+
+    rng = np.random.default_rng(args.seed)
+    cases = []
+    for noise_db in (-60, -45, -35):
+        for pause in (0.15, 0.3, 0.45):
+            name = f"synthetic noise={noise_db}dB pause={pause}s"
+            cases.append((name, *synthetic_case(rng, [0.3, 0.5, 0.25], pause, noise_db, -18)))
+    recordings = args.recordings or config.recordings_directory
+    for path in sorted(glob.glob(os.path.join(recordings, "*.wav"))):
+        audio, true_end = load_recording(path)
+        if audio is not None:
+            cases.append((os.path.basename(path), audio, true_end))
+
+    latencies = []
+    false_cuts = 0
+    missed = 0
+    for name, audio, true_end in cases:
+        endpoint = run_case(endpointer, audio)
+        if endpoint is None:
+            missed += 1
+            print(f"{name:45s} no endpoint")
+        elif endpoint < true_end:
+            false_cuts += 1
+            print(f"{name:45s} FALSE CUT {(true_end - endpoint) / SAMPLE_RATE * 1000:7.0f} ms early")
+        else:
+            latency = (endpoint - true_end) / SAMPLE_RATE * 1000
+            latencies.append(latency)
+            print(f"{name:45s} latency {latency:7.0f} ms")
+
+    print()
+    print(f"cases: {len(cases)}  false cuts: {false_cuts} ({false_cuts / max(len(cases), 1):.0%})  missed: {missed}")
+    if latencies:
+        print(f"endpoint latency ms  p50: {np.percentile(latencies, 50):.0f}  "
+              f"p95: {np.percentile(latencies, 95):.0f}  max: {max(latencies):.0f}")
+
+
+if __name__ == "__main__":
+    main()
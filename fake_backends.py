@@ -0,0 +1,401 @@
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import wave
+from types import SimpleNamespace
+from lazy_import import lazy_import
+from text_to_speech import TextToSpeech
+from utils import log, vlog, vvlog
+
+np = lazy_import("numpy")
+
+
+class LatencyModel:
+    """
+    A latency distribution parsed from a short spec, in seconds:
+    "0.4" (constant), "uniform:0.2,0.6", "normal:0.5,0.1" or "lognormal:0.5,0.4" (median, sigma).
+    """
+    def __init__(self, spec, rng=None):
+        self.spec = str(spec)
+        self.rng = rng or random.Random()
+        kind, _, arguments = self.spec.partition(":")
+        if not arguments:
+            kind, arguments = "const", kind
+        self.kind = kind
+        self.arguments = [float(value) for value in arguments.split(",")]
+        if self.kind not in ("const", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {self.spec}")
+
+    def sample(self):
+        if self.kind == "const":
+            value = self.arguments[0]
+        elif self.kind == "uniform":
+            value = self.rng.uniform(*self.arguments)
+        elif self.kind == "normal":
+            value = self.rng.gauss(*self.arguments)
+        else:
+            median, sigma = self.arguments
+            value = self.rng.lognormvariate(0, sigma) * median
+        return max(0.0, value)
+
+    def sleep(self, cancel=None):
+        delay = self.sample()
+        if cancel is not None:
+            cancel.wait(delay)
+        else:
+            time.sleep(delay)
+        return delay
+
+
+def _object(**fields):
+    return SimpleNamespace(**fields)
+
+
+class _Message(SimpleNamespace):
+    def model_dump_json(self):
+        return json.dumps({"id": self.id, "role": self.role, "text": self.content[-1].text.value})
+
+
+class FakeRun:
+    # One assistant run with a scripted timeline: queued, in_progress, maybe requires_action, completed
+    def __init__(self, run_id, thread, reply, tool_call, latencies):
+        self.id = run_id
+        self.thread = thread
+        self.reply = reply
+        self.tool_call = tool_call
+        self.latencies = latencies
+        self.created = time.monotonic()
+        self.queue_delay = latencies["queue"].sample()
+        self.execution = latencies["run"].sample()
+        self.resumed = None
+        self.status = "queued"
+        self.cancelled = threading.Event()
+
+    def poll(self):
+        # Status for the polling API, derived from the elapsed time
+        if self.status in ("completed", "cancelled", "requires_action"):
+            return self.status
+        started = self.resumed or self.created + self.queue_delay
+        now = time.monotonic()
+        if now < started:
+            self.status = "queued"
+        elif self.tool_call is not None and self.resumed is None and now >= started + self.execution / 2:
+            self.status = "requires_action"
+        elif now >= started + self.execution:
+            self.thread.add_message("assistant", self.reply)
+            self.status = "completed"
+        else:
+            self.status = "in_progress"
+        return self.status
+
+    def snapshot(self):
+        required_action = None
+        if self.status == "requires_action":
+            required_action = _object(submit_tool_outputs=_object(tool_calls=[self.tool_call]))
+        return _object(id=self.id, status=self.status, required_action=required_action)
+
+    def events(self, resumed=False):
+        # Server-sent events for the streaming API, paced like the real service
+        if not resumed:
+            yield _object(event="thread.run.created", data=self.snapshot())
+            if self.cancelled.wait(self.queue_delay):
+                return
+        self.status = "in_progress"
+        yield _object(event="thread.run.in_progress", data=self.snapshot())
+        if self.tool_call is not None and not resumed:
+            if self.cancelled.wait(self.execution / 2):
+                return
+            self.status = "requires_action"
+            yield _object(event="thread.run.requires_action", data=self.snapshot())
+            return
+        words = self.reply.split(" ")
+        per_token = self.execution / max(1, len(words))
+        for index, word in enumerate(words):
+            if self.cancelled.wait(per_token):
+                return
+            text = word if index == 0 else " " + word
+            delta = _object(content=[_object(type="text", text=_object(value=text))])
+            yield _object(event="thread.message.delta", data=_object(delta=delta))
+        self.thread.add_message("assistant", self.reply)
+        self.status = "completed"
+        yield _object(event="thread.run.completed", data=self.snapshot())
+
+
+class _EventStream:
+    def __init__(self, events):
+        self.events = events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.events.close()
+
+    def __iter__(self):
+        return self.events
+
+
+class FakeThread:
+    def __init__(self, thread_id):
+        self.id = thread_id
+        self.messages = []  # oldest first
+        self.message_ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def add_message(self, role, text):
+        with self.lock:
+            message = _Message(
+                id=f"msg_{next(self.message_ids):06d}_{self.id}", role=role, created_at=time.time(),
+                content=[_object(type="text", text=_object(value=text))]
+            )
+            self.messages.append(message)
+            return message
+
+
+class FakeOpenAI:
+    """
+    Local stand-in for the parts of the OpenAI SDK client that OpenAIClient uses.
+
+    Replies echo the command, padded to reply_words words; a command mentioning the weather
+    first requires a get_weather tool call. Run queueing and execution times are drawn
+    from the given LatencyModels ("request", "queue", "run").
+    """
+    def __init__(self, latencies, reply_words=30):
+        self.latencies = latencies
+        self.reply_words = reply_words
+        self.threads = {}
+        self.runs = {}
+        self.ids = itertools.count(1)
+        self.calls = 0
+        self.beta = _object(
+            threads=_object(
+                create=self._create_thread,
+                delete=self._delete_thread,
+                messages=_object(create=self._create_message, list=self._list_messages, delete=self._delete_message),
+                runs=_object(
+                    create=self._create_run,
+                    retrieve=self._retrieve_run,
+                    submit_tool_outputs=self._submit_tool_outputs,
+                    cancel=self._cancel_run,
+                ),
+            ),
+            assistants=_object(create=self._create_assistant, retrieve=self._retrieve_assistant, delete=self._delete_assistant),
+        )
+
+    def _request(self):
+        self.calls += 1
+        self.latencies["request"].sleep()
+
+    def _create_thread(self, messages=None):
+        self._request()
+        thread = FakeThread(f"thread_fake{next(self.ids)}")
+        for message in messages or []:
+            thread.add_message(message["role"], message["content"])
+        self.threads[thread.id] = thread
+        return _object(id=thread.id)
+
+    def _delete_thread(self, thread_id):
+        self._request()
+        self.threads.pop(thread_id, None)
+
+    def _create_assistant(self, **definition):
+        self._request()
+        return _object(id=f"asst_fake{next(self.ids)}")
+
+    def _retrieve_assistant(self, assistant_id):
+        self._request()
+        return _object(id=assistant_id)
+
+    def _delete_assistant(self, assistant_id):
+        self._request()
+
+    def _create_message(self, thread_id, role, content):
+        self._request()
+        return self.threads[thread_id].add_message(role, content)
+
+    def _delete_message(self, message_id, thread_id):
+        self._request()
+        thread = self.threads[thread_id]
+        with thread.lock:
+            thread.messages = [message for message in thread.messages if message.id != message_id]
+
+    def _list_messages(self, thread_id, order="asc", before=None, limit=20):
+        self._request()
+        thread = self.threads[thread_id]
+        with thread.lock:
+            messages = list(thread.messages)
+        if before is not None:
+            position = next(index for index, message in enumerate(messages) if message.id == before)
+            messages = messages[position + 1:]
+        if order == "desc":
+            messages.reverse()
+        return _object(data=messages[:limit])
+
+    def _create_run(self, thread_id, assistant_id, stream=False):
+        self._request()
+        thread = self.threads[thread_id]
+        command = thread.messages[-1].content[-1].text.value
+        run = FakeRun(f"run_fake{next(self.ids)}", thread, self._reply(command), self._tool_call(command), self.latencies)
+        self.runs[run.id] = run
+        if stream:
+            return _EventStream(run.events())
+        return run.snapshot()
+
+    def _retrieve_run(self, thread_id, run_id):
+        self._request()
+        run = self.runs[run_id]
+        run.poll()
+        return run.snapshot()
+
+    def _submit_tool_outputs(self, thread_id, run_id, tool_outputs, stream=False):
+        self._request()
+        run = self.runs[run_id]
+        run.reply = f"{tool_outputs[0]['output']} {run.reply}"
+        run.resumed = time.monotonic()
+        run.status = "in_progress"
+        if stream:
+            return _EventStream(run.events(resumed=True))
+        return run.snapshot()
+
+    def _cancel_run(self, thread_id, run_id):
+        self._request()
+        run = self.runs[run_id]
+        run.cancelled.set()
+        run.status = "cancelled"
+
+    def _reply(self, command):
+        filler = "This is a simulated answer from the benchmark backend with a typical length for a spoken reply".split()
+        words = f"You asked: {command}.".split()
+        while len(words) < self.reply_words:
+            words.extend(filler)
+        return " ".join(words[:max(self.reply_words, 1)]).rstrip(".") + "."
+
+    def _tool_call(self, command):
+        match = re.search(r"weather\b(?:.*\bin\s+([a-zA-Z ]+))?", command, re.IGNORECASE)
+        if not match:
+            return None
+        location = (match.group(1) or "London").strip()
+        function = _object(name="get_weather", arguments=json.dumps({"location": location}))
+        return _object(id=f"call_fake{next(self.ids)}", type="function", function=function)
+
+
+class FakeTextToSpeech(TextToSpeech):
+    """
+    TextToSpeech with the Google requests replaced by a delay and a generated tone of speech-like length.
+
+    Single requests return a 24 kHz WAV after the latency. Streaming requests send the first
+    0.1s chunk after the latency and the rest at generation_speed times real time.
+    """
+    def __init__(self, config, archive=None, latency=None, words_per_second=2.7, tone_rate=24000, generation_speed=4.0):
+        self.latency = latency or LatencyModel("0")
+        self.words_per_second = words_per_second
+        self.tone_rate = tone_rate
+        self.generation_speed = generation_speed
+        self.requests = 0
+        super().__init__(config, archive)
+
+    def _create_client(self):
+        return None
+
+    def _request_synthesis(self, text):
+        self.requests += 1
+        self.latency.sleep()
+        samples = self._tone(text, self.tone_rate)
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(self.tone_rate)
+            file.writeframes(samples.tobytes())
+        return buffer.getvalue()
+
+    def _stream_synthesis(self, text):
+        self.requests += 1
+        self.latency.sleep()
+        samples = self._tone(text, self.sample_rate).astype(np.float32) / 32767
+        step = self.sample_rate // 10
+        for start in range(0, len(samples), step):
+            if start:
+                time.sleep(0.1 / self.generation_speed)
+            yield samples[start:start + step]
+
+    def _tone(self, text, rate):
+        seconds = max(0.2, len(text.split()) / self.words_per_second)
+        t = np.arange(int(seconds * rate)) / rate
+        return (0.05 * np.sin(2 * np.pi * 220 * t) * 32767).astype(np.int16)
+
+
+class ScriptedPorcupine:
+    # Porcupine stand-in that "detects" the wake word at scheduled absolute sample positions
+    def __init__(self, sample_rate=16000, frame_length=512):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.position = 0
+        self.scheduled = []
+        self.lock = threading.Lock()
+
+    def schedule(self, sample_index):
+        with self.lock:
+            self.scheduled.append(sample_index)
+            self.scheduled.sort()
+
+    def process(self, frame):
+        self.position += len(frame)
+        with self.lock:
+            if self.scheduled and self.position >= self.scheduled[0]:
+                self.scheduled.pop(0)
+                return 0
+        return -1
+
+    def delete(self):
+        pass
+
+
+class ToneWakeWord:
+    """
+    Wake word engine stand-in that works across processes: it "hears" the wake word at the end of
+    a burst of a pure tone (see wake_tone()). burn_ms spends that much CPU on every frame, to load
+    the detector workers roughly like a real keyword model does.
+    """
+    def __init__(self, sample_rate=16000, frame_length=512, frequency=1000, min_seconds=0.2, burn_ms=0.0):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.bin = round(frequency * frame_length / sample_rate)
+        self.min_frames = max(1, int(min_seconds * sample_rate / frame_length))
+        self.burn_ms = burn_ms
+        self.run = 0
+
+    def process(self, frame):
+        if self.burn_ms:
+            deadline = time.perf_counter() + self.burn_ms / 1000
+            while time.perf_counter() < deadline:
+                pass
+        power = np.abs(np.fft.rfft(frame.astype(np.float32))) ** 2
+        tonal = power[self.bin - 1:self.bin + 2].sum() > 0.5 * (power.sum() + 1e-9)
+        if tonal:
+            self.run += 1
+            return -1
+        detected = self.run >= self.min_frames
+        self.run = 0
+        return 0 if detected else -1
+
+    def delete(self):
+        pass
+
+
+def wake_tone(sample_rate=16000, seconds=0.3, frequency=1000, amplitude=8000):
+    # What ToneWakeWord detects, as int16 samples
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+
+def fake_get_weather(latency):
+    # A get_weather replacement with the real signature and a simulated API delay
+    def get_weather(api_key, location, cache_ttl=600, url=None):
+        latency.sleep()
+        return f"Weather in {location}: scattered clouds. Temperature: 64°F, Humidity: 58%, Wind Speed: 7 mph."
+    return get_weather
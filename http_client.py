@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from lazy_import import lazy_import
+from utils import log, vlog, vvlog
+
+requests = lazy_import("requests")
+
+
+class CacheEntry:
+    def __init__(self, value, ttl, stale_ttl):
+        now = time.monotonic()
+        self.value = value
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + stale_ttl
+
+
+class HttpClient:
+    """
+    Shared HTTP layer for assistant functions.
+
+    One pooled requests.Session with strict timeouts and jittered retries, plus a response cache.
+    Cached entries are served directly while fresh; once stale they are still served, but a
+    background refresh is started so the next caller gets new data (stale-while-revalidate).
+    """
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.3, pool_size=10):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.session = None  # Created on first request so importing this module stays cheap
+
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.refreshing = set()
+        self.refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="http-refresh")
+        self.metrics = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+
+    def configure(self, config):
+        self.timeout = (config.http_connect_timeout, config.http_read_timeout)
+        self.retries = config.http_retries
+
+    def get_json(self, url, params=None, cache_key=None, ttl=0, stale_ttl=0):
+        """
+        GET a URL and return the decoded JSON body.
+
+        :param cache_key: Key to cache the response under; None disables caching.
+        :param ttl: Seconds the cached response is fresh.
+        :param stale_ttl: Further seconds a stale response may be served while it is refreshed.
+        :raises requests.RequestException: If the request fails and nothing usable is cached.
+        """
+        if cache_key is None or ttl <= 0:
+            return self._fetch(url, params)
+
+        now = time.monotonic()
+        with self.lock:
+            entry = self.cache.get(cache_key)
+            if entry and now < entry.fresh_until:
+                self.metrics["hits"] += 1
+                return entry.value
+            if entry and now < entry.stale_until:
+                self.metrics["stale_hits"] += 1
+                if cache_key not in self.refreshing:
+                    self.refreshing.add(cache_key)
+                    self.refresher.submit(self._refresh, url, params, cache_key, ttl, stale_ttl)
+                return entry.value
+            self.metrics["misses"] += 1
+
+        value = self._fetch(url, params)
+        with self.lock:
+            self.cache[cache_key] = CacheEntry(value, ttl, stale_ttl)
+        return value
+
+    def _refresh(self, url, params, cache_key, ttl, stale_ttl):
+        try:
+            value = self._fetch(url, params)
+            with self.lock:
+                self.cache[cache_key] = CacheEntry(value, ttl, stale_ttl)
+                self.metrics["refreshes"] += 1
+            vvlog("Refreshed cached response for %s", cache_key)
+        except requests.RequestException as e:
+            log(f"Background refresh of {cache_key} failed: {e}", error=True)
+        finally:
+            with self.lock:
+                self.refreshing.discard(cache_key)
+
+    def _fetch(self, url, params):
+        # Retry connection problems and 5xx responses with exponential backoff and full jitter
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._session().get(url, params=params, timeout=self.timeout)
+                if response.status_code < 500 or attempt == self.retries:
+                    response.raise_for_status()
+                    return response.json()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    with self.lock:
+                        self.metrics["errors"] += 1
+                    raise
+            except requests.RequestException:
+                with self.lock:
+                    self.metrics["errors"] += 1
+                raise
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def _session(self):
+        with self.lock:
+            if self.session is None:
+                self.session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                self.session.mount("http://", adapter)
+                self.session.mount("https://", adapter)
+            return self.session
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["stale_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+
+http_client = HttpClient()
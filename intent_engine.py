@@ -0,0 +1,191 @@
+import re
+from collections import namedtuple
+from difflib import SequenceMatcher
+from utils import log, vlog, vvlog
+
+Intent = namedtuple("Intent", ["name", "handler"])
+IntentMatch = namedtuple("IntentMatch", ["intent", "confidence", "slots"])
+
+CONTRACTIONS = {
+    "what's": "what is", "whats": "what is", "it's": "it is", "i'm": "i am",
+    "don't": "do not", "can't": "can not", "cannot": "can not", "let's": "let us",
+}
+# Dropped after slot extraction so "set the timer" and "set a timer" look the same
+STOPWORDS = {"a", "an", "the", "my", "please", "hey", "um", "uh", "okay", "ok", "just"}
+
+UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14,
+    "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+DURATION_UNITS = {
+    "second": 1, "seconds": 1, "sec": 1, "secs": 1,
+    "minute": 60, "minutes": 60, "min": 60, "mins": 60,
+    "hour": 3600, "hours": 3600,
+}
+SLOT_TOKENS = ("{number}", "{duration}")
+# Shorter words must match exactly: "date" is not a typo of "rate", nor "time" of "tide"
+TYPO_MIN_LENGTH = 5
+TYPO_MIN_SIMILARITY = 0.8
+
+
+def normalize(text):
+    # Lowercase, expand contractions and drop punctuation: "What's the time?" -> "what is the time"
+    text = text.lower().replace("’", "'")
+    words = [CONTRACTIONS.get(word, word) for word in text.split()]
+    text = re.sub(r"[^a-z0-9%.' ]+", " ", " ".join(words))
+    text = re.sub(r"(?<!\d)\.|\.(?!\d)|'", " ", text)  # Keep decimal points only
+    return text.replace("%", " percent").split()
+
+
+def _parse_number(tokens, position):
+    # Read a number ("5", "2.5", "twenty five") at position; returns (value, tokens used)
+    token = tokens[position]
+    if re.fullmatch(r"\d+(\.\d+)?", token):
+        return float(token), 1
+    if token in TENS:
+        value = TENS[token]
+        if position + 1 < len(tokens) and tokens[position + 1] in UNITS and 0 < UNITS[tokens[position + 1]] < 10:
+            return value + UNITS[tokens[position + 1]], 2
+        return value, 1
+    if token in UNITS:
+        return UNITS[token], 1
+    return None, 0
+
+
+def _parse_duration(tokens, position):
+    # Read "five minutes", "an hour and a half", "half a minute", "90 seconds"; returns (seconds, tokens used)
+    used = 0
+    if tokens[position] == "half" and position + 2 < len(tokens) and tokens[position + 1] in ("a", "an"):
+        value, used = 0.5, 2
+    elif tokens[position] in ("a", "an"):
+        value, used = 1, 1
+    else:
+        value, used = _parse_number(tokens, position)
+        if value is None:
+            return None, 0
+    if position + used >= len(tokens) or tokens[position + used] not in DURATION_UNITS:
+        return None, 0
+    seconds = value * DURATION_UNITS[tokens[position + used]]
+    used += 1
+    if tokens[position + used:position + used + 3] in (["and", "a", "half"], ["and", "an", "half"]):
+        seconds += DURATION_UNITS[tokens[position + used - 1]] / 2
+        used += 3
+    return seconds, used
+
+
+def extract_slots(tokens):
+    """
+    Replace numbers and durations in a token list with slot placeholders.
+
+    :param tokens: Normalized tokens, see normalize().
+    :return: (templated tokens, slots) where slots maps "number" and "duration" (in seconds) to values.
+    """
+    templated = []
+    slots = {}
+    position = 0
+    while position < len(tokens):
+        seconds, used = _parse_duration(tokens, position)
+        if used:
+            slots["duration"] = slots.get("duration", 0) + seconds
+            # "5 minutes and 30 seconds" is one duration
+            if templated[-2:] == ["{duration}", "and"]:
+                templated.pop()
+            else:
+                templated.append("{duration}")
+            position += used
+            continue
+        value, used = _parse_number(tokens, position)
+        if used:
+            slots["number"] = value
+            templated.append("{number}")
+            position += used
+            continue
+        templated.append(tokens[position])
+        position += 1
+    return [token for token in templated if token not in STOPWORDS], slots
+
+
+def _token_similarity(word, pattern_word):
+    # 1.0 for the same word, the character similarity for a small typo in a longer word, else 0
+    if word == pattern_word:
+        return 1.0
+    if min(len(word), len(pattern_word)) < TYPO_MIN_LENGTH or word in SLOT_TOKENS or pattern_word in SLOT_TOKENS:
+        return 0.0
+    similarity = SequenceMatcher(None, word, pattern_word).ratio()
+    return similarity if similarity >= TYPO_MIN_SIMILARITY else 0.0
+
+
+class IntentEngine:
+    """
+    Matches spoken commands to local handlers without a round trip to the assistant.
+
+    Patterns are normalized and slot-templated once at registration. A command is templated the
+    same way and first looked up exactly in a dict; otherwise the patterns sharing at least one
+    word with it (found through an inverted word index) are compared word by word. Every word
+    must line up with the pattern's word in the same position, either exactly or, for words of
+    TYPO_MIN_LENGTH letters or more, with a small typo; an extra or missing word is no match.
+    The mean word similarity is the confidence, and anything below
+    Config.intent_confidence_threshold is left to the assistant.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.exact = {}  # templated pattern -> intent
+        self.patterns = []  # (templated pattern tokens, slot names, intent)
+        self.word_index = {}  # word -> indices into self.patterns
+
+    def register(self, name, patterns, handler):
+        """
+        Add a local intent.
+
+        :param name: Name of the intent, used for logging.
+        :param patterns: Example phrases; "{number}" and "{duration}" mark slots, e.g. "set a timer for {duration}".
+        :param handler: Called with the extracted slots as keyword arguments; returns the text to say, or None.
+        """
+        intent = Intent(name, handler)
+        for pattern in patterns:
+            templated = []
+            for part in re.split(r"(\{\w+\})", pattern):
+                templated.extend([part] if part in SLOT_TOKENS else normalize(part))
+            templated = [token for token in templated if token not in STOPWORDS]
+            key = " ".join(templated)
+            self.exact[key] = intent
+            index = len(self.patterns)
+            self.patterns.append((templated, {token for token in templated if token in SLOT_TOKENS}, intent))
+            for token in templated:
+                self.word_index.setdefault(token, []).append(index)
+
+    def match(self, command):
+        """
+        Find the local intent for a command.
+
+        :param command: The recognized command text.
+        :return: An IntentMatch, or None if no intent is confident enough.
+        """
+        templated, slots = extract_slots(normalize(command))
+        key = " ".join(templated)
+        if not key:
+            return None
+        if key in self.exact:
+            return IntentMatch(self.exact[key], 1.0, slots)
+
+        candidates = {index for token in templated for index in self.word_index.get(token, ())}
+        present_slots = {token for token in templated if token in SLOT_TOKENS}
+        best = None
+        for index in candidates:
+            pattern, pattern_slots, intent = self.patterns[index]
+            if pattern_slots != present_slots or len(pattern) != len(templated):
+                continue  # A slot the handler needs is missing, or the command says more or less than the pattern
+            similarities = [_token_similarity(word, pattern_word) for word, pattern_word in zip(templated, pattern)]
+            if not all(similarities):
+                continue
+            confidence = sum(similarities) / len(similarities)
+            if best is None or confidence > best.confidence:
+                best = IntentMatch(intent, confidence, slots)
+
+        if best is not None:
+            vvlog("Best local intent for '%s': %s (%.2f)", key, best.intent.name, best.confidence)
+            if best.confidence >= self.config.intent_confidence_threshold:
+                return best
+        return None
@@ -0,0 +1,145 @@
+import enum
+import itertools
+import threading
+import time
+from queue import Queue, Empty
+from utils import log, vlog, vvlog
+
+
+class State(enum.Enum):
+    IDLE = "idle"
+    LISTENING = "listening"
+    THINKING = "thinking"
+    SPEAKING = "speaking"
+
+
+class Turn:
+    """
+    One wake-word-to-reply interaction, run on its own worker thread.
+
+    The worker reports its progress with enter() and checks cancel (a threading.Event) between
+    and inside its stages; everything it starts (recognition, assistant run, tools, synthesis)
+    is handed the same event so a barge-in can stop all of it.
+    """
+    def __init__(self, turn_id, controller):
+        self.id = turn_id
+        self.controller = controller
+        self.cancel = threading.Event()
+        self.started = time.monotonic()
+        self.worker = None
+        self.trace = None  # Set by the worker if the turn is traced
+
+    def enter(self, state):
+        self.controller.post("state", (self, state))
+
+    @property
+    def cancelled(self):
+        return self.cancel.is_set()
+
+
+class InteractionController:
+    """
+    Single dispatcher for the idle -> listening -> thinking -> speaking cycle.
+
+    Wake word detections and worker progress arrive as events on one queue and are applied in
+    order on the dispatcher thread, so there is only ever one current turn. A wake word during
+    a turn cancels it (its audio is faded out and its pending work abandoned) and starts a new
+    turn listening right away; reports from cancelled turns are ignored.
+    """
+    def __init__(self, config, audio_manager, process_command):
+        self.config = config
+        self.audio_manager = audio_manager
+        self.process_command = process_command  # function(event, turn), run on the turn's worker thread
+        self.events = Queue()
+        self.state = State.IDLE
+        self.turn = None
+        self.cancelled_turn = None
+        self.turn_ids = itertools.count(1)
+        self.last_wake = 0.0
+        self.running = False
+        self.counters = {"turns": 0, "barge_ins": 0, "ignored_wakes": 0, "stale_events": 0}
+
+    def post(self, kind, payload=None):
+        # Thread-safe: called from the wake word thread, turn workers and signal handlers
+        self.events.put((kind, payload))
+
+    def run(self):
+        # Dispatch events on the calling thread until "stop" is posted
+        self.running = True
+        while self.running:
+            try:
+                kind, payload = self.events.get(timeout=0.5)
+            except Empty:
+                continue
+            handler = getattr(self, f"_on_{kind}", None)
+            if handler is None:
+                log(f"Unknown interaction event: {kind}", error=True)
+                continue
+            handler(payload)
+
+    def _on_wake(self, event):
+        now = time.monotonic()
+        if self.state == State.LISTENING and now - self.last_wake < self.config.wake_debounce_seconds:
+            # The detector fired twice for one utterance; keep the turn that is already listening
+            self.counters["ignored_wakes"] += 1
+            vvlog("Ignoring repeated wake word")
+            return
+        self.last_wake = now
+        if self.turn is not None:
+            self.counters["barge_ins"] += 1
+            log(f"Barge-in while {self.state.value}, cancelling the current command.")
+            self._cancel_turn()
+
+        turn = Turn(next(self.turn_ids), self)
+        turn.worker = threading.Thread(target=self._run_turn, args=(turn, event), name=f"turn-{turn.id}", daemon=True)
+        self.turn = turn
+        self.counters["turns"] += 1
+        self._set_state(State.LISTENING)
+        turn.worker.start()
+
+    def _on_state(self, payload):
+        turn, state = payload
+        if turn is not self.turn:
+            self.counters["stale_events"] += 1
+            return
+        self._set_state(state)
+
+    def _on_done(self, turn):
+        if turn is not self.turn:
+            self.counters["stale_events"] += 1
+            return
+        vlog("Command finished in %.2fs", time.monotonic() - turn.started)
+        self.turn = None
+        self._set_state(State.IDLE)
+
+    def _on_stop(self, _):
+        if self.turn is not None:
+            self._cancel_turn()
+        self.running = False
+
+    def _run_turn(self, turn, event):
+        try:
+            self.process_command(event, turn)
+        except Exception as e:
+            log(f"Error while processing command: {e}", error=True)
+        finally:
+            self.post("done", turn)
+
+    def _cancel_turn(self):
+        turn, self.turn = self.turn, None
+        turn.cancel.set()
+        self.cancelled_turn = turn
+        self.audio_manager.stop_all_sounds(fade=self.config.barge_in_fade_seconds)
+
+    def _set_state(self, state):
+        if state != self.state:
+            vvlog("Interaction state: %s -> %s", self.state.value, state.value)
+            self.state = state
+
+    def shutdown(self, timeout=2):
+        # Give the last worker a moment to notice its cancellation
+        for turn in (self.turn, self.cancelled_turn):
+            if turn is not None:
+                turn.cancel.set()
+                turn.worker.join(timeout)
+        vlog(f"Interaction stats: {self.counters}")
@@ -0,0 +1,32 @@
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    # Stand-in for a module that is only imported the first time one of its attributes is used
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    """
+    Return a proxy for a heavy dependency so importing our own modules stays cheap.
+
+    Use it in place of "import x as y" for modules that are only touched inside functions.
+    Anything used at class-definition time (e.g. as a base class) still needs a regular import.
+    """
+    return LazyModule(name)
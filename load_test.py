@@ -0,0 +1,232 @@
+import argparse
+import glob
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from queue import Queue, Empty
+import numpy as np
+from benchmark import AudioFeeder, NOISE_AMPLITUDE, add_stand_in_arguments, install_stand_ins, load_utterances, make_config, resident_memory_mb
+from config import Config
+from fake_backends import FakeOpenAI, FakeTextToSpeech, ToneWakeWord, wake_tone
+from interaction import State
+from openai_client import OpenAIClient
+from session_server import Session, SessionServer, SharedServices
+from tracing import percentile
+from utils import log, set_verbosity, flush
+
+
+class FeederSource:
+    # Session audio source played by the load test, with room noise between the scripted turns
+    def __init__(self, seed):
+        self.seed = seed
+        self.feeder = None
+
+    def configure(self, config):
+        config.capture_input = "external"
+        config.audio_output = "null"
+
+    def start(self, capture):
+        self.feeder = AudioFeeder(capture, 1.0, self.seed)
+        self.feeder.start()
+
+    def stop(self):
+        if self.feeder is not None:
+            self.feeder.stop()
+
+    def describe(self):
+        return "load test feeder"
+
+
+class LoadTestServices(SharedServices):
+    # Shared services with local fakes for every cloud service and a tone detector for the wake word
+    def __init__(self, config, processes, latencies, args):
+        self.latencies = latencies
+        self.args = args
+        super().__init__(config, processes)
+
+    def _create_text_to_speech(self):
+        return FakeTextToSpeech(self.config, self.archive, self.latencies["tts"])
+
+    def _create_openai_client(self):
+        return OpenAIClient(self.config, FakeOpenAI(self.latencies, self.args.reply_words))
+
+    def _wake_engine(self):
+        return ToneWakeWord, {
+            "sample_rate": self.config.capture_sample_rate,
+            "frame_length": self.config.capture_block_size,
+            "burn_ms": self.args.wake_cost_ms,
+        }
+
+
+class LoadTestSession(Session):
+    def __init__(self, name, source, services):
+        self.results = Queue()
+        super().__init__(name, source, services)
+
+    def process_command(self, event, turn=None):
+        woke = time.perf_counter()
+        try:
+            super().process_command(event, turn)
+        finally:
+            self.results.put({"woke": woke, "trace": turn.trace if turn else None})
+
+
+class LoadTestServer(SessionServer):
+    session_class = LoadTestSession
+
+
+def drive_session(session, utterances, turns, seed, timeout, records):
+    # Speak turns into one session: wake tone, a short pause, then a command, waiting for each reply
+    rng = random.Random(seed)
+    rate = session.config.capture_sample_rate
+    feeder = session.source.feeder
+    backend = session.speech_recognizer.backend
+    tone = wake_tone(rate)
+    pause = np.random.default_rng(seed).normal(0, NOISE_AMPLITUDE, int(0.15 * rate)).astype(np.int16)
+    for index in range(turns):
+        time.sleep(rng.uniform(0, 2))  # Sessions do not all talk at once
+        name, audio, true_end, transcript = utterances[(seed + index) % len(utterances)]
+        backend.transcript = transcript
+        backend.words_per_second = len(transcript.split()) / max(true_end / rate, 0.1)
+        wake = feeder.play(tone, mark_offset=len(tone) - 1)
+        feeder.play(pause)
+        spoken = feeder.play(audio, mark_offset=true_end)
+        try:
+            result = session.results.get(timeout=timeout)
+        except Empty:
+            records.append({"session": session.name, "outcome": "timeout"})
+            return
+        while session.interaction.state != State.IDLE:
+            time.sleep(0.005)
+        spoken["done"].wait(timeout)
+
+        trace = result["trace"]
+        record = trace.record() if trace else {"attributes": {}}
+        first_audio = trace.marks.get("first_audio") if trace else None
+        records.append({
+            "session": session.name,
+            "input": name,
+            "outcome": record["attributes"].get("outcome"),
+            "wake_ms": (result["woke"] - wake["mark_time"]) * 1000 if "mark_time" in wake else None,
+            "end_to_end_ms": (trace.started + first_audio - spoken["mark_time"]) * 1000
+            if first_audio is not None and "mark_time" in spoken else None,
+        })
+
+
+def _percentiles(values):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return {"p50": None, "p95": None}
+    return {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+
+
+def run_level(args, sessions, latencies, utterances):
+    # Run sessions concurrent sessions on one server for args.turns turns each and summarize the result
+    with tempfile.TemporaryDirectory(prefix="assistant-load-") as directory:
+        config = make_config(args, directory)
+        processes = min(sessions, args.processes or os.cpu_count() or 1)
+        services = LoadTestServices(config, processes, latencies, args)
+        server = LoadTestServer(config, [(f"room{index + 1}", FeederSource(args.seed + index)) for index in range(sessions)], services)
+        records = []
+        try:
+            server.start()
+            time.sleep(config.noise_update_interval * 2 + 0.5)  # Let every session's noise floor estimate settle
+
+            busy_started = {shard["shard"]: shard.get("busy_seconds", 0.0) for shard in services.detectors.stats()}
+            cpu_started = time.process_time()
+            started = time.perf_counter()
+            drivers = [
+                threading.Thread(target=drive_session, args=(session, utterances, args.turns, args.seed + index, args.timeout, records), daemon=True)
+                for index, session in enumerate(server.sessions)
+            ]
+            for driver in drivers:
+                driver.start()
+            detector_delay = 0.0
+            while any(driver.is_alive() for driver in drivers):
+                time.sleep(0.5)
+                detector_delay = max([detector_delay] + [shard.get("max_delay_ms", 0.0) for shard in services.detectors.stats()])
+            elapsed = time.perf_counter() - started
+            main_cpu = (time.process_time() - cpu_started) / elapsed
+            worker_busy = max(
+                (shard.get("busy_seconds", 0.0) - busy_started.get(shard["shard"], 0.0)) / elapsed
+                for shard in services.detectors.stats()
+            )
+            rss_mb = resident_memory_mb()
+        finally:
+            server.shutdown()
+
+    answered = [record for record in records if record["outcome"] == "answered"]
+    summary = {
+        "sessions": sessions,
+        "processes": processes,
+        "turns": len(records),
+        "answered": len(answered),
+        "failed": len(records) - len(answered),
+        "wake_ms": _percentiles(record["wake_ms"] for record in answered),
+        "end_to_end_ms": _percentiles(record["end_to_end_ms"] for record in answered),
+        "main_cpu": main_cpu,
+        "worker_busy": worker_busy,
+        "detector_delay_ms": detector_delay,
+        "rss_mb": rss_mb,
+    }
+    summary["sustained"] = (
+        summary["failed"] == 0 and len(records) == sessions * args.turns
+        and (summary["end_to_end_ms"]["p95"] or 0) <= args.max_latency
+        and detector_delay <= args.max_detector_delay
+    )
+    return summary, records
+
+
+def _ms(value):
+    return f"{value:9.0f}" if value is not None else f"{'n/a':>9s}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find how many concurrent sessions one server process sustains, with local stand-ins for every cloud service")
+    parser.add_argument('wavs', nargs='*', help='Utterances to speak (default: Config.recordings_directory/*.wav, or a synthetic one)')
+    parser.add_argument('--sessions', default="1,2,4,8,16", help='Comma-separated numbers of concurrent sessions to try, in order')
+    parser.add_argument('--turns', type=int, default=3, help='Turns per session at every level')
+    parser.add_argument('--processes', type=int, default=None, help='Detector worker processes (default: one per core, at most one per session)')
+    parser.add_argument('--wake-cost-ms', type=float, default=0.5, help='CPU the stand-in wake word engine burns per 32 ms frame')
+    parser.add_argument('--max-latency', type=float, default=2500, help='p95 speech end -> first audio (ms) a sustained level must stay under')
+    parser.add_argument('--max-detector-delay', type=float, default=250, help='How far (ms) the detector workers may fall behind real time')
+    parser.add_argument('--keep-going', action='store_true', help='Try every level even after one was not sustained')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for a turn before giving up on its session')
+    parser.add_argument('--output', default='load-test-results.json', help='Where to write the per-level results')
+    add_stand_in_arguments(parser)
+    args = parser.parse_args()
+    set_verbosity(args.verbose)
+
+    latencies = install_stand_ins(args)
+    paths = args.wavs or sorted(glob.glob(os.path.join(Config().recordings_directory, "*.wav")))
+    utterances = load_utterances(paths, args.transcript, args.seed)
+
+    levels = []
+    sustained = 0
+    print(f"{'sessions':>8s} {'procs':>5s} {'turns':>7s} {'wake p95':>9s} {'e2e p50':>9s} {'e2e p95':>9s} {'main cpu':>9s} {'worker':>7s} {'lag ms':>7s} {'rss MB':>7s}")
+    for count in (int(value) for value in args.sessions.split(",")):
+        summary, records = run_level(args, count, latencies, utterances)
+        levels.append({"summary": summary, "turns": records})
+        flush()
+        print(f"{count:8d} {summary['processes']:5d} {summary['answered']:3d}/{summary['turns']:<3d} {_ms(summary['wake_ms']['p95'])} "
+              f"{_ms(summary['end_to_end_ms']['p50'])} {_ms(summary['end_to_end_ms']['p95'])} {summary['main_cpu']:8.0%} "
+              f"{summary['worker_busy']:6.0%} {summary['detector_delay_ms']:7.0f} {summary['rss_mb']:7.0f}"
+              + ("" if summary["sustained"] else "  not sustained"))
+        if summary["sustained"]:
+            sustained = max(sustained, count)
+        elif not args.keep_going:
+            break
+
+    print(f"Sustained up to {sustained} concurrent sessions on {os.cpu_count()} cores "
+          f"(p95 speech end -> first audio under {args.max_latency:.0f} ms, detectors under {args.max_detector_delay:.0f} ms behind)")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"timestamp": time.time(), "cores": os.cpu_count(), "sustained_sessions": sustained, "levels": levels}, file, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
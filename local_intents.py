@@ -0,0 +1,96 @@
+import datetime
+import threading
+from utils import log, vlog, vvlog
+
+
+def describe_duration(seconds):
+    # 330 -> "5 minutes and 30 seconds"
+    seconds = int(round(seconds))
+    parts = []
+    for name, size in (("hour", 3600), ("minute", 60), ("second", 1)):
+        count, seconds = divmod(seconds, size)
+        if count:
+            parts.append(f"{count} {name}{'s' if count != 1 else ''}")
+    return " and ".join(parts) if parts else "0 seconds"
+
+
+class LocalIntents:
+    """
+    Built-in commands the voice assistant answers on its own: time, date, timers, volume,
+    repeating the last answer, and the stop/cancel/shutdown controls.
+    """
+    def __init__(self, assistant):
+        self.assistant = assistant
+        self.config = assistant.config
+        self.timers = []
+        self.timers_lock = threading.Lock()
+
+    def register(self, engine):
+        engine.register("stop", ["stop", "stop it", "stop talking", "stop the music", "be quiet", "quiet", "silence"], self.assistant.stop_audio)
+        engine.register("cancel", ["cancel", "nevermind", "never mind", "forget it"], self.assistant.cancel_command)
+        engine.register("shutdown", ["shutdown", "shut down", "turn yourself off", "go to sleep"], self.assistant.shutdown)
+        engine.register("time", ["what time is it", "what is the time", "tell me the time", "time", "current time"], self.tell_time)
+        engine.register("date", ["what is the date", "what is the date today", "what day is it", "what day is it today", "what is today", "today's date"], self.tell_date)
+        engine.register("set_timer", ["set a timer for {duration}", "start a timer for {duration}", "timer for {duration}", "{duration} timer", "set a {duration} timer", "remind me in {duration}"], self.set_timer)
+        engine.register("cancel_timers", ["cancel the timer", "cancel timers", "cancel all timers", "stop the timer", "delete the timer"], self.cancel_timers)
+        engine.register("set_volume", ["set the volume to {number}", "set volume to {number} percent", "volume {number}", "volume to {number} percent", "change the volume to {number}"], self.set_volume)
+        engine.register("volume_up", ["volume up", "turn it up", "turn the volume up", "louder", "speak up", "increase the volume"], self.volume_up)
+        engine.register("volume_down", ["volume down", "turn it down", "turn the volume down", "quieter", "lower the volume", "decrease the volume"], self.volume_down)
+        engine.register("repeat", ["repeat", "repeat that", "say that again", "what did you say", "come again", "repeat the last answer"], self.repeat)
+
+    def tell_time(self):
+        now = datetime.datetime.now()
+        return f"It's {now.hour % 12 or 12}:{now.minute:02d} {'AM' if now.hour < 12 else 'PM'}."
+
+    def tell_date(self):
+        now = datetime.datetime.now()
+        return f"Today is {now:%A, %B} {now.day}, {now.year}."
+
+    def set_timer(self, duration):
+        if duration <= 0:
+            return "That timer would already be done."
+        timer = threading.Timer(duration, self._timer_done, args=(duration,))
+        timer.daemon = True
+        with self.timers_lock:
+            self.timers.append(timer)
+        timer.start()
+        vlog(f"Timer set for {duration:.0f}s")
+        return f"Timer set for {describe_duration(duration)}."
+
+    def _timer_done(self, duration):
+        with self.timers_lock:
+            self.timers = [timer for timer in self.timers if timer.is_alive() and timer is not threading.current_thread()]
+        log(f"Timer for {describe_duration(duration)} is done.")
+        self.assistant.audio_manager.play_sound('sounds/Wake.wav', wait_full_sound=True)
+        self.assistant.say(f"Your {describe_duration(duration)} timer is done.")
+
+    def cancel_timers(self):
+        with self.timers_lock:
+            timers, self.timers = self.timers, []
+        for timer in timers:
+            timer.cancel()
+        if not timers:
+            return "There are no timers running."
+        return "Timer cancelled." if len(timers) == 1 else f"{len(timers)} timers cancelled."
+
+    def set_volume(self, number):
+        # "volume 7" is out of ten, "volume 70" and "volume 70 percent" out of a hundred
+        level = number / 10 if number <= 10 else number / 100
+        return self._change_volume(level)
+
+    def volume_up(self):
+        return self._change_volume(self.assistant.audio_manager.mixer.volume + self.config.volume_step)
+
+    def volume_down(self):
+        return self._change_volume(self.assistant.audio_manager.mixer.volume - self.config.volume_step)
+
+    def _change_volume(self, level):
+        level = min(max(level, 0.0), 1.0)
+        self.assistant.audio_manager.mixer.volume = level
+        return f"Volume {round(level * 100)} percent."
+
+    def repeat(self):
+        return self.assistant.last_response or "I haven't said anything yet."
+
+    def shutdown(self):
+        self.cancel_timers()
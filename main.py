@@ -1,13 +1,55 @@
 import argparse
-from utils import set_verbosity
-from voice_assistant import VoiceAssistant
+import sys
+import time
+from utils import set_verbosity, flush
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Voice Assistant")
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose logging')
     parser.add_argument('-vv', '--very-verbose', action='store_true', help='Enable very verbose logging')
+    parser.add_argument('--profile-startup', action='store_true', help='Print a per-module import and per-phase init breakdown, then exit')
+    parser.add_argument('--profile-output', default='startup-profile.json', help='Where --profile-startup writes its JSON report')
+    parser.add_argument('--trace-summary', action='store_true', help='Print p50/p95/p99 latency per stage from the trace file, then exit')
+    parser.add_argument('--trace-window', type=float, default=None, help='Only summarize traces from the last this many minutes')
+
+    subparsers = parser.add_subparsers(dest='command')
+    batch = subparsers.add_parser('batch', help='Send commands from a JSONL file (or stdin) to the assistant, without the voice loop')
+    batch.add_argument('input', nargs='?', default='-', help='JSONL or plain text commands, one per line; - for stdin')
+    batch.add_argument('-o', '--output', default='-', help='Where to append the JSONL results; - for stdout')
+    batch.add_argument('-j', '--concurrency', type=int, default=4, help='Commands in flight at once, each on its own thread')
+    batch.add_argument('--tts', action='store_true', help='Also render every reply (or "say" text) to a WAV file')
+    batch.add_argument('--audio-dir', default=None, help='Where --tts writes its files (default: outputs/batch)')
+    batch.add_argument('--retries', type=int, default=3, help='Retries per command when rate limited')
+    batch.add_argument('--backoff', type=float, default=1.0, help='First rate limit backoff in seconds, doubled on every further hit')
+    batch.add_argument('--max-backoff', type=float, default=60.0, help='Longest rate limit backoff in seconds, unless the API asks for more with Retry-After')
+    batch.add_argument('--poll-interval', type=float, default=0.25, help='Seconds between run status checks')
+
+    serve = subparsers.add_parser('serve', help='Serve several rooms from one process, each with its own audio source and conversation')
+    serve.add_argument('sessions', nargs='*', help='name=device:INDEX, name=wav:FILE or name=socket:PATH|HOST:PORT (default: Config.server_sessions)')
+    serve.add_argument('-p', '--processes', type=int, default=None, help='Wake word and endpointing worker processes (default: one per core)')
+    serve.add_argument('--loop', action='store_true', help='Repeat WAV sources instead of going silent after them')
+    serve.add_argument('--stats-interval', type=float, default=60, help='Seconds between stats lines with -v')
     return parser.parse_args()
 
+def profile_startup(output_path):
+    from startup_profiler import ImportProfiler, report
+
+    profiler = ImportProfiler()
+    profiler.install()
+    started = time.perf_counter()
+    from voice_assistant import VoiceAssistant
+    imports = time.perf_counter() - started
+
+    assistant = VoiceAssistant()
+    profiler.uninstall()
+
+    phases = {"imports": imports}
+    phases.update(assistant.startup_timings)
+    phases["total"] = time.perf_counter() - started
+    flush()
+    report(profiler, phases, output_path)
+    assistant.cleanup()
+
 def main():
 
     # Manage Verbosity
@@ -20,8 +62,29 @@ def main():
 
     set_verbosity(verbosity)
 
+    if args.profile_startup:
+        profile_startup(args.profile_output)
+        return
+
+    if args.command == 'batch':
+        from batch_runner import run_batch
+        sys.exit(run_batch(args))
+
+    if args.command == 'serve':
+        from session_server import run_server
+        sys.exit(run_server(args))
+
+    if args.trace_summary:
+        from config import Config
+        from tracing import summarize
+        summarize(Config().trace_file, args.trace_window * 60 if args.trace_window else None)
+        return
+
+    # Imported here so argument parsing does not wait on the heavy dependencies
+    from voice_assistant import VoiceAssistant
+
     assistant = VoiceAssistant()
     assistant.run()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import deque
+from lazy_import import lazy_import
+from endpointer import frame_energies_db
+from utils import log, vlog, vvlog
+
+np = lazy_import("numpy")
+
+
+class NoiseFloorEstimator:
+    """
+    Tracks the room's noise floor on the shared capture stream while the assistant is idle.
+
+    Idle audio is read in blocks of Config.noise_update_interval seconds and split into VAD frames,
+    whose levels go into a sliding window of Config.noise_window_seconds. The noise floor is a low
+    percentile of that window, so talking and short bangs barely move it, while a TV or fan that
+    stays on raises it within one window. Whenever the estimate moves by at least
+    Config.noise_min_change_db it is passed to on_update and recorded in the history.
+    """
+    def __init__(self, config, capture, on_update, is_idle=None):
+        self.config = config
+        self.capture = capture
+        self.on_update = on_update  # function(noise_floor_db) -> dict of the thresholds it set
+        self.is_idle = is_idle or (lambda: True)
+        self.frame_length = int(capture.sample_rate * self.config.vad_frame_ms / 1000)
+        frames_per_block = max(1, round(self.config.noise_update_interval * 1000 / self.config.vad_frame_ms))
+        self.block_length = self.frame_length * frames_per_block
+        self.levels = np.zeros(max(frames_per_block, round(self.config.noise_window_seconds * 1000 / self.config.vad_frame_ms)), dtype=np.float32)
+        self.filled = 0
+        self.next_slot = 0
+        self.noise_floor_db = None
+        self.updates = deque(maxlen=self.config.noise_history_size)
+        self.skipped_blocks = 0
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.reader = None
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.reader = self.capture.reader()
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, name="noise-floor", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        block = np.empty(self.block_length, dtype=np.int16)
+        while self.running.is_set():
+            samples = self.reader.read(self.block_length, out=block, timeout=0.5)
+            if samples is None:
+                continue
+            if not self.is_idle():
+                # Commands and the assistant's own replies are not room noise
+                self.skipped_blocks += 1
+                continue
+            self._add(frame_energies_db(samples, self.frame_length))
+            self._update()
+
+    def _add(self, levels):
+        # Write the block's frame levels into the circular window
+        size = len(self.levels)
+        levels = levels[-size:]
+        first = min(len(levels), size - self.next_slot)
+        self.levels[self.next_slot:self.next_slot + first] = levels[:first]
+        self.levels[:len(levels) - first] = levels[first:]
+        self.next_slot = (self.next_slot + len(levels)) % size
+        self.filled = min(size, self.filled + len(levels))
+
+    def _update(self):
+        estimate = float(np.percentile(self.levels[:self.filled], self.config.noise_percentile))
+        with self.lock:
+            previous = self.noise_floor_db
+            if previous is not None and abs(estimate - previous) < self.config.noise_min_change_db:
+                return
+            self.noise_floor_db = estimate
+        if previous is None:
+            vlog("Noise floor %.1f dBFS", estimate)
+        else:
+            vlog("Noise floor moved from %.1f to %.1f dBFS", previous, estimate)
+        thresholds = self.on_update(estimate) or {}
+        with self.lock:
+            self.updates.append(dict(time=time.time(), noise_floor_db=round(estimate, 1), **thresholds))
+
+    def history(self):
+        # Every threshold update still kept, oldest first, for diagnostics
+        with self.lock:
+            return list(self.updates)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "noise_floor_db": round(self.noise_floor_db, 1) if self.noise_floor_db is not None else None,
+                "updates": len(self.updates),
+                "skipped_blocks": self.skipped_blocks,
+                "dropped_samples": self.reader.dropped_samples if self.reader else 0,
+            }
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        vlog(f"Noise floor stats: {self.stats()}")
+        vvlog("Noise floor history: %s", self.updates)
@@ -1,75 +1,164 @@
-import openai
+import hashlib
 import json
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from lazy_import import lazy_import
 from utils import log, vlog, vvlog
-from assistant_functions import get_weather
+from tool_registry import registry, ToolExecutor
+from http_client import http_client
+from resource_registry import ResourceRegistry
+import assistant_functions  # Registers the assistant's functions with the tool registry
+
+openai = lazy_import("openai")
+
+
+def _retry_after(error):
+    # Seconds the API asked us to wait before retrying, if it said so
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class RunTimings:
+    # Splits an assistant run into time until it starts executing, time in tool calls and the rest
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queued = None
+        self.tool_seconds = 0.0
+
+    def running(self):
+        if self.queued is None:
+            self.queued = time.perf_counter() - self.started
+
+    @contextmanager
+    def tools(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tool_seconds += time.perf_counter() - started
+
+    def report(self, trace):
+        if not trace:
+            return
+        total = time.perf_counter() - self.started
+        queued = self.queued or 0.0
+        trace.add("llm_queue", queued)
+        trace.add("llm_run", total - queued - self.tool_seconds)
+        if self.tool_seconds:
+            trace.add("tool_calls", self.tool_seconds)
+
 
 class OpenAIClient:
-    def __init__(self, config):
+    def __init__(self, config, sdk_client=None):
+        # sdk_client replaces the OpenAI SDK client, e.g. with a local fake for benchmarks
         self.config = config
         self.api_key = config.openai_api_key
-        self.openai_client = openai.OpenAI(api_key=self.api_key)
-        self.active_threads_file = "active.treg"
-        self.active_assistants_file = "active.areg"
+        self.openai_client = sdk_client or openai.OpenAI(api_key=self.api_key)
+        self.registry = ResourceRegistry(
+            self.config.resource_journal_file,
+            fsync_interval=self.config.resource_journal_fsync_interval,
+            compact_threshold=self.config.resource_journal_compact_threshold
+        )
+        self.tool_executor = ToolExecutor(registry, config)
+        http_client.configure(config)
 
-    def create_thread(self):
+    def create_thread(self, messages=None):
         try:
-            thread_response = self.openai_client.beta.threads.create()
+            thread_response = self.openai_client.beta.threads.create(messages=messages or [])
             thread_id = thread_response.id
             vlog(f"Thread created with ID: {thread_id}")
-            self._record_active_thread(thread_id)
+            self.registry.record("thread", thread_id)
             return thread_id
         except Exception as e:
             log(f"Failed to create thread: {e}", error=True)
 
-    def delete_thread(self, thread_id):
-        try:
-            self.openai_client.beta.threads.delete(thread_id)
-            vlog(f"Thread with ID: {thread_id} deleted successfully.")
-            self._remove_active_thread(thread_id)
-        except Exception as e:
-            log(f"Failed to delete thread: {e}", error=True)
+    def delete_thread(self, thread_id, retries=0):
+        return self._delete("thread", thread_id, self.openai_client.beta.threads.delete, retries)
 
     def create_assistant(self, prompt):
         try:
-            assistant_response = self.openai_client.beta.assistants.create(
-                name="Magi",
-                instructions=prompt,
-                tools=[
-                    {"type": "code_interpreter"},  # Add other tools/functions as needed
-                    {
-                        "type": "function",
-                        "function": {
-                            "name": "get_weather",
-                            "description": "Get the current weather for a location",
-                            "parameters": {
-                                "type": "object",
-                                "properties": {
-                                    "location": {"type": "string", "description": "The city to get the weather for"}
-                                },
-                                "required": ["location"]
-                            }
-                        }
-                    }
-                ],
-                model="gpt-3.5-turbo-1106"  # Replace with the desired model
-            )
+            assistant_response = self.openai_client.beta.assistants.create(**self._assistant_definition(prompt))
             assistant_id = assistant_response.id
             vlog(f"Assistant created with ID: {assistant_id}")
-            self._record_active_assistant(assistant_id)
+            self.registry.record("assistant", assistant_id)
             return assistant_id
         except Exception as e:
             log(f"Failed to create assistant: {e}", error=True)
 
-    def delete_assistant(self, assistant_id):
+    def get_or_create_assistant(self, prompt):
+        # Reuse the assistant from the last run if its prompt, tools and model are unchanged
+        fingerprint = self._assistant_fingerprint(prompt)
+        if self.config.warm_start:
+            stored = self._load_fingerprint()
+            if stored.get("fingerprint") == fingerprint and stored.get("assistant_id"):
+                try:
+                    assistant_id = self.openai_client.beta.assistants.retrieve(stored["assistant_id"]).id
+                    vlog(f"Reusing assistant with ID: {assistant_id}")
+                    return assistant_id
+                except Exception as e:
+                    vlog(f"Stored assistant is no longer usable ({e}), creating a new one...")
+
+        assistant_id = self.create_assistant(prompt)
+        if assistant_id:
+            self._save_fingerprint(fingerprint, assistant_id)
+        return assistant_id
+
+    def _assistant_definition(self, prompt):
+        return {
+            "name": "Magi",
+            "instructions": prompt,
+            "tools": [{"type": "code_interpreter"}] + registry.definitions(),
+            "model": self.config.assistant_model
+        }
+
+    def _assistant_fingerprint(self, prompt):
+        definition = json.dumps(self._assistant_definition(prompt), sort_keys=True)
+        return hashlib.sha256(definition.encode("utf-8")).hexdigest()
+
+    def _load_fingerprint(self):
         try:
-            self.openai_client.beta.assistants.delete(assistant_id)
-            vlog(f"Assistant with ID: {assistant_id} deleted successfully.")
-            self._remove_active_assistant(assistant_id)
-        except Exception as e:
-            log(f"Failed to delete assistant: {e}", error=True)
+            with open(self.config.assistant_fingerprint_file, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_fingerprint(self, fingerprint, assistant_id):
+        try:
+            with open(self.config.assistant_fingerprint_file, "w") as file:
+                json.dump({"fingerprint": fingerprint, "assistant_id": assistant_id}, file)
+        except OSError as e:
+            log(f"Failed to save assistant fingerprint: {e}", error=True)
+
+    def delete_assistant(self, assistant_id, retries=0):
+        return self._delete("assistant", assistant_id, self.openai_client.beta.assistants.delete, retries)
 
-    def process_command_with_assistant(self, thread_id, command, assistant_id):
+    def _delete(self, kind, resource_id, delete, retries):
+        # Delete a remote resource, retrying transient failures; one that is already gone counts as deleted
+        for attempt in range(retries + 1):
+            try:
+                delete(resource_id)
+                vlog(f"{kind.capitalize()} with ID: {resource_id} deleted successfully.")
+            except openai.NotFoundError:
+                vlog(f"{kind.capitalize()} with ID: {resource_id} was already gone.")
+            except Exception as e:
+                if attempt < retries:
+                    time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+                    continue
+                log(f"Failed to delete {kind}: {e}", error=True)
+                return False
+            self.registry.remove(kind, resource_id)
+            return True
+
+    def process_command_with_assistant(self, thread_id, command, assistant_id, stats=None, cancel=None, trace=None):
+        # stats, if given, is filled with the size of the fetched reply payload and, when there is no
+        # reply, with the run status or error, including whether it was rate limited and when to retry;
+        # setting cancel (a threading.Event) cancels the run and returns None
+        timings = RunTimings()
+        stats = {} if stats is None else stats
         try:
             # Add the user's message to the thread
             message = self.openai_client.beta.threads.messages.create(
@@ -77,41 +166,60 @@ class OpenAIClient:
                 role="user",
                 content=command
             )
-            vlog(f"Message created with ID: {message.id}")
+            vlog("Message created with ID: %s", message.id)
 
             # Run the assistant on the thread
             run_response = self.openai_client.beta.threads.runs.create(
                 thread_id=thread_id,
                 assistant_id=assistant_id
             )
-            vlog(f"Run created with ID: {run_response.id}")
+            vlog("Run created with ID: %s", run_response.id)
 
             # Wait for the run to complete and get the assistant's response
             while True:
+                if cancel is not None and cancel.is_set():
+                    self._cancel_run(thread_id, run_response.id)
+                    return None
                 run_status = self.openai_client.beta.threads.runs.retrieve(
                     thread_id=thread_id,
                     run_id=run_response.id
                 )
+                if run_status.status != 'queued':
+                    timings.running()
                 if run_status.status == 'completed':
                     break
+                elif run_status.status in ('failed', 'cancelled', 'expired'):
+                    log("Run ended with status: %s", run_status.status, error=True)
+                    last_error = getattr(run_status, "last_error", None)
+                    stats["status"] = run_status.status
+                    stats["error"] = getattr(last_error, "message", None)
+                    stats["rate_limited"] = getattr(last_error, "code", None) == "rate_limit_exceeded"
+                    return None
                 elif run_status.status == 'requires_action':
                     vlog("Assistant is requiring action...")
                     # Handle required actions, such as calling external functions
-                    self._handle_required_actions(run_status, thread_id, run_response.id)
+                    with timings.tools():
+                        self._handle_required_actions(run_status, thread_id, run_response.id, cancel)
+                    continue
                 # Polling interval
-                time.sleep(1)
+                if cancel is not None:
+                    cancel.wait(self.config.run_poll_interval)
+                else:
+                    time.sleep(self.config.run_poll_interval)
 
-            # Retrieve the assistant's messages
+            # Fetch only what is newer than our own message, newest first, instead of the whole thread
             messages = self.openai_client.beta.threads.messages.list(
-                thread_id=thread_id
+                thread_id=thread_id,
+                order="desc",
+                before=message.id,
+                limit=self.config.message_fetch_limit
             )
             assistant_messages = [msg for msg in messages.data if msg.role == 'assistant']
-            # Sort the messages by the 'created_at' timestamp
-            assistant_messages.sort(key=lambda msg: msg.created_at)
+            stats["payload_bytes"] = sum(len(msg.model_dump_json()) for msg in messages.data)
             if assistant_messages:
-                # Get the last message from the assistant
-                vvlog(assistant_messages)
-                assistant_reply_content = assistant_messages[-1].content
+                # The newest message from the assistant comes first
+                vvlog("Assistant message: %s", assistant_messages[0])
+                assistant_reply_content = assistant_messages[0].content
                 if isinstance(assistant_reply_content, list) and assistant_reply_content:
                     assistant_reply = assistant_reply_content[-1].text.value  # Get the last text value
                 else:
@@ -119,75 +227,153 @@ class OpenAIClient:
             else:
                 assistant_reply = "I'm sorry, I can't process your request right now."
 
-            log(f"Assistant Response: {assistant_reply}")
+            log("Assistant Response: %s", assistant_reply)
             return assistant_reply
         except Exception as e:
-            log(f"Error during command processing: {e}", True)
+            log("Error during command processing: %s", e, error=True)
+            stats["status"] = "error"
+            stats["error"] = str(e)
+            stats["rate_limited"] = isinstance(e, openai.RateLimitError)
+            if stats["rate_limited"]:
+                stats["retry_after"] = _retry_after(e)
+        finally:
+            timings.report(trace)
+
+    def stream_command_with_assistant(self, thread_id, command, assistant_id, cancel=None, trace=None, created=None):
+        # Yield the assistant's reply as text deltas while the run is still generating.
+        # If cancel (a threading.Event) gets set, or the generator is closed early, the run is cancelled.
+        # created, if given, receives the thread, message and run ids, e.g. for discard_turn()
+        created = {} if created is None else created
+        created["thread_id"] = thread_id
+        run_id = None
+        finished = False
+        timings = RunTimings()
+        try:
+            message = self.openai_client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=command
+            )
+            vlog("Message created with ID: %s", message.id)
+            created["message_id"] = message.id
+
+            stream = self.openai_client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                stream=True
+            )
+            while stream is not None:
+                required_run = None
+                with stream:
+                    for event in stream:
+                        if event.event == "thread.run.created":
+                            # Recorded before checking cancel, so a run cancelled right away is still cancelled on the server
+                            run_id = created["run_id"] = event.data.id
+                            vlog("Run created with ID: %s", run_id)
+                        if cancel is not None and cancel.is_set():
+                            return
+                        if event.event == "thread.message.delta":
+                            for content in event.data.delta.content or []:
+                                if content.type == "text" and content.text and content.text.value:
+                                    yield content.text.value
+                        elif event.event == "thread.run.in_progress":
+                            timings.running()
+                        elif event.event == "thread.run.requires_action":
+                            required_run = event.data
+                        elif event.event in ("thread.run.failed", "thread.run.cancelled", "thread.run.expired"):
+                            log("Run ended with status: %s", event.data.status, error=True)
+
+                # The stream ends when the run needs tool outputs; submitting them continues it in a new stream
+                stream = None
+                if required_run is not None:
+                    vlog("Assistant is requiring action...")
+                    with timings.tools():
+                        tool_outputs = self.tool_executor.run(required_run.required_action.submit_tool_outputs.tool_calls, cancel)
+                    if tool_outputs is None:
+                        return
+                    stream = self.openai_client.beta.threads.runs.submit_tool_outputs(
+                        thread_id=thread_id,
+                        run_id=required_run.id,
+                        tool_outputs=tool_outputs,
+                        stream=True
+                    )
+            finished = True
+        except Exception as e:
+            log("Error during streamed command processing: %s", e, error=True)
+        finally:
+            timings.report(trace)
+            if not finished and run_id is not None:
+                # Do not leave a run going that nobody listens to; it would also block the thread
+                self._cancel_run(thread_id, run_id)
 
 
-    def close_and_clear_files(self):
-        # Close threads
-        with open("active.treg", "r+") as file:
-            threads = file.read().strip().splitlines()
-            for thread_id in threads:
-                try:
-                    openai.beta.threads.delete(thread_id)
-                    log(f"Thread {thread_id} closed.")
-                except Exception as e:
-                    log(f"Error closing thread {thread_id}: {e}", True)
-            file.truncate(0)
+    def collect_stale_resources(self):
+        # Snapshot the threads and assistants left over from earlier runs, before this run records its own
+        return self.registry.active_ids("thread"), self.registry.active_ids("assistant")
 
-        # Close assistants
-        with open("active.areg", "r+") as file:
-            assistants = file.read().strip().splitlines()
-            for assistant_id in assistants:
-                try:
-                    openai.beta.assistants.delete(assistant_id)
-                    log(f"Assistant {assistant_id} closed.")
-                except Exception as e:
-                    log(f"Error closing assistant {assistant_id}: {e}", True)
-            file.truncate(0)
-
-    def _record_active_thread(self, thread_id):
-        # Append the new thread ID to the active_threads_file
-        with open(self.active_threads_file, "a") as file:
-            file.write(thread_id + "\n")
-
-    def _remove_active_thread(self, thread_id):
-        # Remove the deleted thread ID from the active_threads_file
-        with open(self.active_threads_file, "r") as file:
-            thread_ids = file.read().splitlines()
-        thread_ids.remove(thread_id)
-        with open(self.active_threads_file, "w") as file:
-            file.write("\n".join(thread_ids) + "\n")
-
-    def _record_active_assistant(self, assistant_id):
-        # Append the new assistant ID to the active_assistants_file
-        with open(self.active_assistants_file, "a") as file:
-            file.write(assistant_id + "\n")
-
-    def _remove_active_assistant(self, assistant_id):
-        # Remove the deleted assistant ID from the active_assistants_file
-        with open(self.active_assistants_file, "r") as file:
-            assistant_ids = file.read().splitlines()
-        assistant_ids.remove(assistant_id)
-        with open(self.active_assistants_file, "w") as file:
-            file.write("\n".join(assistant_ids) + "\n")
-
-    def _handle_required_actions(self, run_status, thread_id, run_id):
-        # Handle required actions from the assistant, such as calling external functions
-        for tool_call in run_status.required_action.submit_tool_outputs.tool_calls:
-            vlog(f"Assistant called {tool_call.function.name}()")
-            if tool_call.function.name == "get_weather":
-                arguments = json.loads(tool_call.function.arguments)
-                weather_info = get_weather(self.config.openweathermap_api_key, arguments["location"])
-                self.openai_client.beta.threads.runs.submit_tool_outputs(
-                    thread_id=thread_id,
-                    run_id=run_id,
-                    tool_outputs=[
-                        {
-                            "tool_call_id": tool_call.id,
-                            "output": weather_info
-                        }
-                    ]
-                )
\ No newline at end of file
+    def close_stale_resources(self, thread_ids, assistant_ids):
+        # Reap leftover threads and assistants concurrently with bounded parallelism
+        if not thread_ids and not assistant_ids:
+            return
+        started = time.perf_counter()
+        retries = self.config.cleanup_retries
+        with ThreadPoolExecutor(max_workers=self.config.cleanup_max_workers) as pool:
+            futures = [pool.submit(self.delete_thread, thread_id, retries) for thread_id in thread_ids]
+            futures += [pool.submit(self.delete_assistant, assistant_id, retries) for assistant_id in assistant_ids]
+        failed = sum(1 for future in futures if not future.result())
+        log(f"Closed {len(thread_ids)} stale threads and {len(assistant_ids)} stale assistants "
+            f"in {time.perf_counter() - started:.2f}s ({failed} failed).")
+
+    def _handle_required_actions(self, run_status, thread_id, run_id, cancel=None):
+        # Run every requested function concurrently and submit all outputs for the run together
+        tool_outputs = self.tool_executor.run(run_status.required_action.submit_tool_outputs.tool_calls, cancel)
+        if tool_outputs is None:
+            return  # Cancelled; the caller cancels the run
+        self.openai_client.beta.threads.runs.submit_tool_outputs(
+            thread_id=thread_id,
+            run_id=run_id,
+            tool_outputs=tool_outputs
+        )
+
+    def discard_turn(self, created, timeout=5):
+        """
+        Remove a cancelled turn from its thread: wait for its run to stop, then delete the user
+        message and anything the run added after it.
+
+        :param created: The ids filled in by stream_command_with_assistant().
+        :param timeout: Seconds to wait for the run to stop.
+        """
+        thread_id, message_id, run_id = created.get("thread_id"), created.get("message_id"), created.get("run_id")
+        if not message_id:
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            # A thread takes no new run while one is still active, and cancelling takes a moment
+            while run_id and time.monotonic() < deadline:
+                status = self.openai_client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id).status
+                if status not in ("queued", "in_progress", "requires_action", "cancelling"):
+                    break
+                time.sleep(0.1)
+            newer = self.openai_client.beta.threads.messages.list(
+                thread_id=thread_id,
+                order="desc",
+                before=message_id,
+                limit=self.config.message_fetch_limit
+            )
+            for message_id in [message.id for message in newer.data] + [message_id]:
+                self.openai_client.beta.threads.messages.delete(message_id=message_id, thread_id=thread_id)
+            vlog("Discarded the turn of run %s", run_id)
+        except Exception as e:
+            log("Error discarding turn: %s", e, error=True)
+
+    def _cancel_run(self, thread_id, run_id):
+        try:
+            self.openai_client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            vlog(f"Run {run_id} cancelled")
+        except Exception as e:
+            vlog(f"Could not cancel run {run_id}: {e}")
+
+    def shutdown(self):
+        self.tool_executor.shutdown()
+        self.registry.close()
+        vlog(f"HTTP cache stats: {http_client.stats()}")
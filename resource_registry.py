@@ -0,0 +1,136 @@
+import os
+import threading
+from utils import log, vlog, vvlog
+
+LEGACY_FILES = {"thread": "active.treg", "assistant": "active.areg"}
+
+
+class ResourceRegistry:
+    """
+    Crash-safe record of the remote threads and assistants this program has created.
+
+    Every create and delete is one appended line ("+ thread <id>" / "- thread <id>"), so recording
+    an event is O(1) and a crash can at worst lose a partial last line. Creates are fsynced right
+    away, because losing one would leak a resource; deletes are fsynced in batches, because losing
+    one only means a harmless second delete later. Once enough deletes pile up the journal is
+    compacted by atomically replacing it with just the live entries.
+    """
+    def __init__(self, path, fsync_interval=1.0, compact_threshold=256):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.lock = threading.Lock()
+        self.active = {"thread": {}, "assistant": {}}  # dicts keep creation order
+        self.dead_records = 0
+        self.dirty = False
+        self.closed = threading.Event()
+
+        self._replay()
+        self._migrate_legacy_files()
+        self.file = open(self.path, "a")
+        if self.dead_records >= self.compact_threshold:
+            self._compact()
+        self.flusher = threading.Thread(target=self._flush_worker, daemon=True)
+        self.flusher.start()
+
+    def record(self, kind, resource_id):
+        with self.lock:
+            if resource_id in self.active[kind]:
+                return
+            self.active[kind][resource_id] = True
+            self._append(f"+ {kind} {resource_id}\n")
+            self._fsync()
+
+    def remove(self, kind, resource_id):
+        with self.lock:
+            if self.active[kind].pop(resource_id, None) is None:
+                return
+            self._append(f"- {kind} {resource_id}\n")
+            self.dead_records += 2  # The create record is now dead as well
+            self.dirty = True
+            if self.dead_records >= self.compact_threshold:
+                self._compact()
+
+    def active_ids(self, kind):
+        with self.lock:
+            return list(self.active[kind])
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            if not self.file.closed:
+                self._fsync()
+                self.file.close()
+
+    def _append(self, line):
+        self.file.write(line)
+        self.file.flush()
+
+    def _fsync(self):
+        os.fsync(self.file.fileno())
+        self.dirty = False
+
+    def _flush_worker(self):
+        while not self.closed.wait(self.fsync_interval):
+            with self.lock:
+                if self.dirty and not self.file.closed:
+                    self._fsync()
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        intact = 0  # Bytes up to the end of the last whole line
+        with open(self.path, "rb") as file:
+            for raw in file:
+                if not raw.endswith(b"\n"):
+                    break  # Torn write from a crash; everything before it is intact
+                intact += len(raw)
+                parts = raw.decode("utf-8", "replace").split()
+                if len(parts) != 3 or parts[0] not in ("+", "-") or parts[1] not in self.active:
+                    continue
+                operation, kind, resource_id = parts
+                if operation == "+":
+                    self.active[kind][resource_id] = True
+                else:
+                    self.active[kind].pop(resource_id, None)
+                    self.dead_records += 2
+        if intact < os.path.getsize(self.path):
+            # Drop the torn tail, or the next append would be glued onto it and lost on replay
+            os.truncate(self.path, intact)
+            log("Resource journal %s ended in a partial record; truncated it", self.path)
+        vlog(f"Resource registry loaded: {len(self.active['thread'])} threads, {len(self.active['assistant'])} assistants")
+
+    def _migrate_legacy_files(self):
+        # Carry over IDs from the old one-file-per-kind registries, then drop them
+        migrated = False
+        for kind, legacy_path in LEGACY_FILES.items():
+            if not os.path.exists(legacy_path):
+                continue
+            with open(legacy_path, "r") as file:
+                for resource_id in file.read().split():
+                    self.active[kind][resource_id] = True
+            migrated = True
+        if migrated:
+            self._write_snapshot()
+            for legacy_path in LEGACY_FILES.values():
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
+            vlog("Migrated legacy active.treg/active.areg into the resource journal")
+
+    def _compact(self):
+        self.file.close()
+        self._write_snapshot()
+        self.file = open(self.path, "a")
+        vvlog("Resource journal compacted")
+
+    def _write_snapshot(self):
+        # Write only the live entries to a temporary file and atomically swap it in
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as file:
+            for kind, ids in self.active.items():
+                for resource_id in ids:
+                    file.write(f"+ {kind} {resource_id}\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.dead_records = 0
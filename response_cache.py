@@ -0,0 +1,193 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from intent_engine import normalize, STOPWORDS
+from utils import log, vlog, vvlog
+
+
+def _stem(word):
+    # Light stemming, so "capitals" and "capital" count as the same word
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def _trigrams(text):
+    padded = f" {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _cosine(a, b):
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    if not dot:
+        return 0.0
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+
+class ResponseCache:
+    """
+    Remembers assistant replies so repeated questions are answered without an assistant run.
+
+    Questions are keyed on their normalized words. A question with no exact entry may still hit
+    an entry whose character trigram vector is at least Config.response_cache_similarity close,
+    but only if both have the same set of stemmed words and the same numbers in the same order:
+    "population of indiana" must never answer "population of india", nor "5 minus 3" "3 minus 5". How
+    long a reply stays valid depends on the first Config.response_cache_rules entry whose
+    words appear in the question; a TTL of 0 means the question is never cached.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.path = self.config.response_cache_file
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> entry dict, least recently used first
+        self.vectors = {}  # key -> trigram Counter, for near-duplicate lookups
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._load()
+
+    def get(self, question):
+        """
+        Look up the cached reply for a question.
+
+        :return: The entry dict ("text", "audio_path", "latency", ...) or None.
+        """
+        key, words, numbers = self._key(question)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            near = False
+            if entry is None and key:
+                entry = self._nearest(key, words, numbers)
+                near = entry is not None
+            if entry is not None and entry["expires"] <= now:
+                self._drop(entry["key"])
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(entry["key"])
+            self.hits += 1
+            self.near_hits += near
+            self.saved_seconds += entry["latency"]
+        vlog(f"Response cache {'near ' if near else ''}hit for '{question}' (saved ~{entry['latency']:.2f}s)")
+        return entry
+
+    def peek(self, question):
+        # Whether get() would answer the question, without counting a lookup
+        key, words, numbers = self._key(question)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key) or (self._nearest(key, words, numbers) if key else None)
+            return entry is not None and entry["expires"] > now
+
+    def put(self, question, text, latency, audio_path=None):
+        """
+        Cache a reply.
+
+        :param latency: Seconds the assistant took to produce it, reported as saved time on hits.
+        :param audio_path: Optional file holding the synthesized reply.
+        """
+        key, words, numbers = self._key(question)
+        ttl = self.ttl_for(key)
+        if not key or not text or ttl <= 0:
+            return
+        with self.lock:
+            self._drop(key)
+            self.entries[key] = {
+                "key": key, "question": question, "text": text, "audio_path": audio_path,
+                "words": words, "numbers": numbers, "latency": latency, "expires": time.time() + ttl,
+            }
+            self.vectors[key] = _trigrams(key)
+            while len(self.entries) > self.config.response_cache_max_entries:
+                self._drop(next(iter(self.entries)))
+
+    def set_audio_path(self, key, audio_path):
+        # key is the "key" of the entry get() returned, which for a near-duplicate hit is not the question's own
+        with self.lock:
+            if key in self.entries:
+                self.entries[key]["audio_path"] = audio_path
+
+    def ttl_for(self, key):
+        words = set(key.split())
+        for name, keywords, ttl in self.config.response_cache_rules:
+            if words & set(keywords):
+                vvlog("Response cache rule '%s' applies to '%s' (ttl %ss)", name, key, ttl)
+                return ttl
+        return self.config.response_cache_default_ttl
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 2),
+            }
+
+    def shutdown(self):
+        vlog(f"Response cache stats: {self.stats()}")
+        self._save()
+
+    def _key(self, question):
+        # (key, sorted set of stemmed words, numbers in order)
+        words = [word for word in normalize(question) if word not in STOPWORDS]
+        numbers = [word for word in words if any(char.isdigit() for char in word)]
+        return " ".join(words), sorted({_stem(word) for word in words}), numbers
+
+    def _nearest(self, key, words, numbers):
+        vector = _trigrams(key)
+        best, best_score = None, self.config.response_cache_similarity
+        for candidate, entry in self.entries.items():
+            if entry["words"] != words or entry["numbers"] != numbers:
+                continue  # Any extra or different word may change the answer
+            score = _cosine(vector, self.vectors[candidate])
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def _drop(self, key):
+        self.entries.pop(key, None)
+        self.vectors.pop(key, None)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            log(f"Failed to load response cache {self.path}: {e}", error=True)
+            return
+        now = time.time()
+        for entry in entries:
+            if entry["expires"] > now:
+                _, entry["words"], entry["numbers"] = self._key(entry["key"])  # Files from before "words" lack it
+                self.entries[entry["key"]] = entry
+                self.vectors[entry["key"]] = _trigrams(entry["key"])
+        vlog(f"Response cache loaded {len(self.entries)} entries")
+
+    def _save(self):
+        if not self.path:
+            return
+        with self.lock:
+            entries = list(self.entries.values())
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump(entries, file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            log(f"Failed to save response cache {self.path}: {e}", error=True)
@@ -0,0 +1,59 @@
+from lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+
+class SampleRingBuffer:
+    """
+    Fixed-size ring of audio samples indexed by absolute sample position.
+
+    A single producer appends with write(); any number of readers copy ranges out with read()
+    using the absolute index of the first sample they want. The producer only ever advances
+    total_written, so readers never need a lock. All storage is allocated up front.
+    """
+    def __init__(self, capacity, dtype=None):
+        self.capacity = capacity
+        self.samples = np.zeros(capacity, dtype=dtype or np.int16)
+        self.total_written = 0
+
+    def write(self, samples):
+        count = len(samples)
+        if count > self.capacity:
+            samples = samples[-self.capacity:]
+            self.total_written += count - self.capacity
+            count = self.capacity
+        start = self.total_written % self.capacity
+        first = min(count, self.capacity - start)
+        np.copyto(self.samples[start:start + first], samples[:first], casting="unsafe")
+        if first < count:
+            np.copyto(self.samples[:count - first], samples[first:], casting="unsafe")
+        self.total_written += count
+
+    def oldest_index(self):
+        return max(0, self.total_written - self.capacity)
+
+    def read(self, start, count, out=None):
+        """
+        Copy up to count samples beginning at absolute index start.
+
+        :param start: Absolute index of the first sample; clamped to the oldest sample still held.
+        :param count: Maximum number of samples to copy; fewer are returned if not yet written.
+        :param out: Optional preallocated array to copy into.
+        :return: A tuple of (first absolute index actually read, array of samples).
+        """
+        start = max(start, self.oldest_index())
+        count = max(0, min(count, self.total_written - start))
+        if out is None:
+            out = np.empty(count, dtype=self.samples.dtype)
+        else:
+            out = out[:count]
+        offset = start % self.capacity
+        first = min(count, self.capacity - offset)
+        out[:first] = self.samples[offset:offset + first]
+        out[first:] = self.samples[:count - first]
+
+        # If the producer lapped us while copying, the oldest part of the copy is stale
+        overwritten = self.oldest_index() - start
+        if overwritten > 0:
+            return self.read(start + overwritten, count - overwritten, out)
+        return start, out
@@ -0,0 +1,57 @@
+import re
+
+# Words ending in a period that do not end a sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "vs", "etc", "e.g", "i.e", "approx"}
+
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s')
+CLAUSE_END = re.compile(r'[,;:—]\s')
+
+
+class SentenceSegmenter:
+    def __init__(self, min_chars=20, clause_min_chars=80):
+        # Segments shorter than min_chars are merged with the next one so TTS is not called for "Sure."
+        self.min_chars = min_chars
+        # Long sentences are split at clause boundaries once they grow past clause_min_chars
+        self.clause_min_chars = clause_min_chars
+        self.buffer = ""
+
+    def feed(self, token):
+        # Add a token and return any segments that are now complete
+        self.buffer += token
+        segments = []
+        while True:
+            end = self._find_boundary()
+            if end is None:
+                break
+            segment = self.buffer[:end].strip()
+            self.buffer = self.buffer[end:]
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self):
+        # Return whatever is left once the token stream has ended
+        segment = self.buffer.strip()
+        self.buffer = ""
+        return [segment] if segment else []
+
+    def _find_boundary(self):
+        for match in SENTENCE_END.finditer(self.buffer):
+            end = match.end()
+            if end < self.min_chars or self._is_abbreviation(match.start()):
+                continue
+            return end
+
+        if len(self.buffer) >= self.clause_min_chars:
+            # Split at the last clause boundary so the segment is as long as possible
+            boundaries = [m.end() for m in CLAUSE_END.finditer(self.buffer) if m.end() >= self.min_chars]
+            if boundaries:
+                return boundaries[-1]
+        return None
+
+    def _is_abbreviation(self, index):
+        if self.buffer[index] != ".":
+            return False
+        words = self.buffer[:index].split()
+        return bool(words) and words[-1].lower() in ABBREVIATIONS
+
@@ -0,0 +1,408 @@
+import copy
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from lazy_import import lazy_import
+from archive_writer import ArchiveWriter
+from audio_mixer import decode_wav
+from detector_pool import DetectorPool, RemoteEndpointer, RemoteWakeWordDetector, create_porcupine
+from openai_client import OpenAIClient
+from response_cache import ResponseCache
+from speech_recognizer import SpeechRecognizer
+from text_to_speech import TextToSpeech
+from tracing import Tracer
+from voice_assistant import VoiceAssistant
+from utils import log, vlog, vvlog, configure_logging
+
+np = lazy_import("numpy")
+
+
+class DeviceSource:
+    # A local input device, opened by the session's AudioCapture like the single-room assistant does
+    def __init__(self, device=None):
+        self.device = int(device) if device and device.isdigit() else device or None
+
+    def configure(self, config):
+        config.capture_input = "microphone"
+        config.capture_device = self.device
+
+    def start(self, capture):
+        pass
+
+    def stop(self):
+        pass
+
+    def describe(self):
+        return f"device {self.device if self.device is not None else 'default'}"
+
+
+class _PushSource:
+    # Base for sources that push audio into the capture ring from a thread of their own; replies are not played
+    def __init__(self):
+        self.capture = None
+        self.running = threading.Event()
+        self.thread = None
+
+    def configure(self, config):
+        config.capture_input = "external"
+        config.audio_output = "null"
+
+    def start(self, capture):
+        self.capture = capture
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, name=f"source-{self.describe()}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        raise NotImplementedError
+
+
+class WavSource(_PushSource):
+    # Plays a WAV file into the session at real time, followed by silence; with loop it repeats after gap_seconds
+    def __init__(self, path, loop=False, gap_seconds=2.0):
+        super().__init__()
+        self.path = path
+        self.loop = loop
+        self.gap_seconds = gap_seconds
+
+    def describe(self):
+        return f"wav {self.path}"
+
+    def _run(self):
+        samples = (decode_wav(self.path, self.capture.sample_rate) * 32767).astype(np.int16)
+        block = self.capture.block_size
+        period = block / self.capture.sample_rate
+        silence = np.zeros(block, dtype=np.int16)
+        gap = int(self.gap_seconds * self.capture.sample_rate)
+        offset = 0
+        deadline = time.perf_counter()
+        while self.running.is_set():
+            if offset < len(samples):
+                chunk = samples[offset:offset + block]
+                if len(chunk) < block:
+                    chunk = np.concatenate((chunk, silence[:block - len(chunk)]))
+            else:
+                chunk = silence
+            self.capture.feed(chunk)
+            offset += block
+            if self.loop and offset >= len(samples) + gap:
+                offset = 0
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+class SocketSource(_PushSource):
+    """
+    Raw 16-bit little-endian mono PCM at the capture rate from a local socket.
+
+    The address is a Unix socket path, or host:port for TCP. One client is served at a time;
+    when it disconnects the next one is accepted.
+    """
+    def __init__(self, address):
+        super().__init__()
+        self.address = address
+        self.server = None
+
+    def describe(self):
+        return f"socket {self.address}"
+
+    def start(self, capture):
+        host, _, port = self.address.rpartition(":")
+        if port.isdigit() and "/" not in self.address:
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server.bind((host or "127.0.0.1", int(port)))
+        else:
+            if os.path.exists(self.address):
+                os.remove(self.address)  # Left over from an earlier run
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(self.address)
+        self.server.listen(1)
+        self.server.settimeout(0.5)
+        super().start(capture)
+
+    def stop(self):
+        super().stop()
+        if self.server is not None:
+            self.server.close()
+            if self.server.family == socket.AF_UNIX and os.path.exists(self.address):
+                os.remove(self.address)
+            self.server = None
+
+    def _run(self):
+        while self.running.is_set():
+            try:
+                client, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            vlog(f"Audio client connected to {self.address}")
+            with client:
+                self._receive(client)
+            vlog(f"Audio client disconnected from {self.address}")
+
+    def _receive(self, client):
+        client.settimeout(0.5)
+        leftover = b""
+        while self.running.is_set():
+            try:
+                data = client.recv(self.capture.block_size * 2)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if not data:
+                return
+            data = leftover + data
+            usable = len(data) - len(data) % 2
+            leftover = data[usable:]
+            if usable:
+                self.capture.feed(np.frombuffer(data[:usable], dtype=np.int16))
+
+
+def parse_session(spec, loop=False, gap_seconds=2.0):
+    """
+    Parse a session spec of the form name=kind:target.
+
+    Kinds are "device" (target: a sounddevice index or name, empty for the default input),
+    "wav" (target: a WAV file) and "socket" (target: a Unix socket path or host:port).
+
+    :return: A tuple of (name, source).
+    :raises ValueError: If the spec is malformed.
+    """
+    name, _, source = spec.partition("=")
+    kind, _, target = source.partition(":")
+    if not name or not kind:
+        raise ValueError(f"Session spec must look like name=kind:target, got '{spec}'")
+    if kind == "device":
+        return name, DeviceSource(target)
+    if kind == "wav":
+        return name, WavSource(target, loop, gap_seconds)
+    if kind == "socket":
+        return name, SocketSource(target)
+    raise ValueError(f"Unknown audio source '{kind}' in session spec '{spec}'")
+
+
+class SharedServices:
+    """
+    What all sessions of a server have in common.
+
+    One assistant definition, one OpenAIClient (and with it the pooled HTTP connections and the
+    tool worker pool), speech synthesis with its cache, the response cache, the archive, the
+    trace writer and the DetectorPool running wake word and endpointing work in other processes.
+    """
+    def __init__(self, config, detector_processes=None):
+        self.config = config
+        self.archive = ArchiveWriter(self.config)
+        self.tracer = Tracer(self.config)
+        self.text_to_speech = self._create_text_to_speech()
+        self.openai_client = self._create_openai_client()
+        self.response_cache = ResponseCache(self.config) if self.config.response_cache_enabled else None
+        self.detectors = DetectorPool(self.config, detector_processes)
+        self.wake_engine = self._wake_engine()
+        self.assistant_id = None
+        self.stale_resources = ([], [])
+
+    def _create_text_to_speech(self):
+        return TextToSpeech(self.config, self.archive)
+
+    def _create_openai_client(self):
+        return OpenAIClient(self.config)
+
+    def _wake_engine(self):
+        # (factory, arguments) that build a session's wake word engine inside a worker process
+        return create_porcupine, {"access_key": self.config.porcupine_access_key, "keyword_path": self.config.custom_wake_word_file}
+
+    def start(self):
+        self.detectors.start()
+        self.stale_resources = self.openai_client.collect_stale_resources()
+        with open("system-prompt.txt", 'r') as file:
+            prompt = file.read()
+        self.assistant_id = self.openai_client.get_or_create_assistant(prompt)
+        if not self.assistant_id:
+            raise RuntimeError("No assistant available")
+        stale_threads, stale_assistants = self.stale_resources
+        self.stale_resources = (stale_threads, [stale for stale in stale_assistants if stale != self.assistant_id])
+        threading.Thread(target=self.text_to_speech.warm_up, args=(self.config.tts_warmup_phrases,), daemon=True).start()
+
+    def shutdown(self):
+        self.detectors.shutdown()
+        if self.assistant_id and not self.config.warm_start:
+            self.openai_client.delete_assistant(self.assistant_id)
+        if self.response_cache:
+            self.response_cache.shutdown()
+        self.openai_client.shutdown()
+        self.archive.shutdown()
+        self.tracer.shutdown()
+
+
+class Session(VoiceAssistant):
+    """
+    One room served by a SessionServer.
+
+    A VoiceAssistant with its own audio source, capture ring, conversation thread, recognizer,
+    mixer and interaction state, built on the server's SharedServices instead of its own clients.
+    """
+    def __init__(self, name, source, services):
+        self.name = name
+        self.source = source
+        self.services = services
+        self.interaction_thread = None
+        config = copy.copy(services.config)
+        config.tts_warmup_phrases = []  # Warmed up once for all sessions
+        source.configure(config)
+        super().__init__(config)
+        self.trace_attributes = {"session": name}
+
+    def _create_archive(self):
+        return self.services.archive
+
+    def _create_speech_recognizer(self):
+        recognizer = SpeechRecognizer(self.config, self.archive)
+        recognizer.endpointer = RemoteEndpointer(self.services.detectors, self.name, recognizer.endpointer)
+        return recognizer
+
+    def _create_text_to_speech(self):
+        return self.services.text_to_speech
+
+    def _create_response_cache(self):
+        return self.services.response_cache
+
+    def _create_tracer(self):
+        return self.services.tracer
+
+    def _init_openai(self):
+        client = self.services.openai_client
+        thread_id = client.create_thread()
+        return client, thread_id, self.services.assistant_id, ([], [])  # Stale resources are the server's
+
+    def _init_wake_word(self):
+        detector = RemoteWakeWordDetector(self.config, self.audio_capture, self.services.detectors, self.name, self.services.wake_engine)
+        detector.init_porcupine()
+        return detector
+
+    def setup_signal_handling(self):
+        pass  # The server handles SIGINT for all sessions
+
+    def shutdown(self):
+        # The "shut down" intent: stopping only this session would leave the room dead while the
+        # server runs on, and one room must not stop everyone else's, so the server owns shutdown
+        log(f"Ignoring the shutdown command in session '{self.name}'")
+        return "I can't shut down from here. Stop the server to turn me off."
+
+    def start(self):
+        super().start()
+        self.source.start(self.audio_capture)
+        self.interaction_thread = threading.Thread(target=self.interaction.run, name=f"session-{self.name}", daemon=True)
+        self.interaction_thread.start()
+
+    def stop(self):
+        self.interaction.post("stop")
+        if self.interaction_thread is not None:
+            self.interaction_thread.join()
+        self.source.stop()
+        self.cleanup()
+
+    def _close_shared(self):
+        pass  # Closed by SharedServices after the last session
+
+    def stats(self):
+        return {
+            "session": self.name,
+            "state": self.interaction.state.value,
+            "turns": self.interaction.counters["turns"],
+            "wake_word": self.wake_word_detector.stats(),
+            "noise": self.noise_estimator.stats(),
+        }
+
+
+class SessionServer:
+    """
+    Serves many rooms from one process: every session is a Session on the same SharedServices.
+
+    Sessions are created concurrently, since each one starts by creating its assistant thread.
+    run() blocks until SIGINT and logs per-session and per-worker stats every stats_interval seconds.
+    """
+    session_class = Session
+
+    def __init__(self, config, sessions, services=None, stats_interval=60):
+        self.config = config
+        self.specs = sessions  # (name, source) pairs
+        self.services = services or SharedServices(config, min(len(sessions), config.server_detector_processes or os.cpu_count() or 1))
+        self.stats_interval = stats_interval
+        self.sessions = []
+        self.stopped = threading.Event()
+
+    def start(self):
+        started = time.perf_counter()
+        self.services.start()
+        with ThreadPoolExecutor(max_workers=min(8, len(self.specs)), thread_name_prefix="session-init") as pool:
+            futures = [pool.submit(self.session_class, name, source, self.services) for name, source in self.specs]
+            for (name, source), future in zip(self.specs, futures):
+                try:
+                    self.sessions.append(future.result())
+                except Exception as e:
+                    log(f"Failed to create session '{name}' ({source.describe()}): {e}", error=True)
+        for session in self.sessions:
+            session.start()
+        log(f"Serving {len(self.sessions)} sessions after {time.perf_counter() - started:.2f}s: "
+            + ", ".join(f"{session.name} ({session.source.describe()})" for session in self.sessions))
+        threading.Thread(target=self.services.openai_client.close_stale_resources, args=self.services.stale_resources, daemon=True).start()
+
+    def run(self):
+        signal.signal(signal.SIGINT, lambda sig, frame: self.stopped.set())
+        try:
+            self.start()
+            while not self.stopped.wait(self.stats_interval):
+                vlog(f"Session stats: {[session.stats() for session in self.sessions]}")
+                vlog(f"Detector stats: {self.services.detectors.stats()}")
+        finally:
+            log("Shutting down the server...")
+            self.shutdown()
+
+    def shutdown(self):
+        if self.sessions:
+            with ThreadPoolExecutor(max_workers=min(8, len(self.sessions)), thread_name_prefix="session-stop") as pool:
+                list(pool.map(Session.stop, self.sessions))
+        self.sessions = []
+        self.services.shutdown()
+
+
+def run_server(args, config=None):
+    """
+    Entry point of "main.py serve".
+
+    :return: The process exit code.
+    """
+    from config import Config
+
+    config = config or Config()
+    configure_logging(config.log_json, config.log_rate_limit_burst, config.log_rate_limit_interval)
+    specs = args.sessions or config.server_sessions
+    if not specs:
+        log("No sessions given, e.g. main.py serve kitchen=device: hall=wav:hall.wav", error=True)
+        return 2
+    try:
+        sessions = [parse_session(spec, args.loop, config.server_wav_gap_seconds) for spec in specs]
+    except ValueError as e:
+        log(str(e), error=True)
+        return 2
+    if len({name for name, _ in sessions}) != len(sessions):
+        log("Session names must be unique", error=True)
+        return 2
+
+    processes = min(len(sessions), args.processes or config.server_detector_processes or os.cpu_count() or 1)
+    server = SessionServer(config, sessions, SharedServices(config, processes), stats_interval=args.stats_interval)
+    server.run()
+    return 0
@@ -0,0 +1,223 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from intent_engine import normalize
+from tracing import Trace
+from utils import log, vlog, vvlog
+
+
+def _key(text):
+    return " ".join(normalize(text or ""))
+
+
+class Speculation:
+    """
+    One assistant run started on a partial transcript, before the user has finished speaking.
+
+    The reply is buffered while it streams in. adopt() hands it over, buffered tokens first, once
+    the final transcript turns out to ask the same thing, and only then is the turn counted in the
+    conversation; discard() cancels the run and deletes its messages so the thread reads as if it
+    never happened.
+    """
+    def __init__(self, conversation, assistant_id, text):
+        self.conversation = conversation
+        self.text = text
+        self.key = _key(text)
+        self.trace = Trace()
+        self.cancel = threading.Event()
+        self.created = {}  # thread, message and run ids, filled in by the client
+        self.tokens = []
+        self.done = False
+        self.adopted = False
+        self.condition = threading.Condition()
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, args=(assistant_id,), name="speculation", daemon=True)
+        self.thread.start()
+
+    def _run(self, assistant_id):
+        try:
+            for token in self.conversation.stream(self.text, assistant_id, self.cancel, self.trace, self.created, record=False):
+                with self.condition:
+                    self.tokens.append(token)
+                    self.condition.notify_all()
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def adopt(self, cancel=None, trace=None):
+        # Generator over the whole reply, like Conversation.stream(); closing it early cancels the run
+        self.adopted = True
+        index = 0
+        try:
+            while not (cancel is not None and cancel.is_set()):
+                with self.condition:
+                    if index >= len(self.tokens):
+                        if self.done:
+                            break
+                        self.condition.wait(0.05)
+                        continue
+                    token = self.tokens[index]
+                index += 1
+                if trace:
+                    trace.mark("first_token")
+                yield token
+        finally:
+            with self.condition:
+                finished = self.done and index >= len(self.tokens)
+            if not finished:
+                self.cancel.set()
+            else:
+                self.thread.join()
+                self.conversation.keep(self.created)
+                if trace:
+                    for name, seconds in self.trace.spans.items():
+                        trace.add(name, seconds)
+
+    def discard(self, timeout):
+        # Blocks until the run has stopped and its messages are gone
+        self.cancel.set()
+        self.thread.join(timeout)
+        self.conversation.discard(self.created, timeout)
+
+
+class SpeculativeTurn:
+    # Watches the partial transcripts of one utterance and speculates on the one that looks final
+    def __init__(self, speculator, assistant_id):
+        self.speculator = speculator
+        self.config = speculator.config
+        self.assistant_id = assistant_id
+        self.lock = threading.Lock()
+        self.partial = None
+        self.generation = 0
+        self.timer = None
+        self.speculation = None
+        self.closed = False
+        self.revised = 0
+
+    def on_partial(self, text):
+        # Called by the recognition backend, from whichever thread produced the partial
+        key = _key(text)
+        with self.lock:
+            if self.closed or key == self.partial:
+                return
+            self.partial = key
+            self.generation += 1
+            generation = self.generation
+            if self.timer is not None:
+                self.timer.cancel()
+            stale, self.speculation = self.speculation, None
+            if stale is not None:
+                self.revised += 1  # The user kept talking, so the guess was premature
+            immediate = self.speculator.is_complete(key)
+            if immediate:
+                self.timer = None
+            else:
+                self.timer = threading.Timer(self.config.speculation_stable_ms / 1000, self._dispatch, args=(text, generation))
+                self.timer.daemon = True
+                self.timer.start()
+        if stale is not None:
+            vvlog("Partial transcript changed, dropping the speculative run for '%s'", stale.text)
+            self.speculator.executor.submit(stale.discard, self.config.speculation_discard_timeout)
+        if immediate:
+            self._dispatch(text, generation)
+
+    def _dispatch(self, text, generation):
+        self.speculator.executor.submit(self._start, text, generation)
+
+    def _start(self, text, generation):
+        # Runs on the speculator's single worker, after any discard queued before it
+        with self.lock:
+            if self.closed or generation != self.generation or not self.speculator.should_speculate(text):
+                return
+            vlog("Speculatively sending '%s'", text)
+            self.speculation = Speculation(self.speculator.conversation, self.assistant_id, text)
+            self.speculator.count("started")
+
+    def resolve(self, final_text, trace=None):
+        """
+        Stop speculating and match the final transcript against the speculative run.
+
+        :param final_text: The final transcript, or None if the utterance was cancelled or not understood.
+        :return: The Speculation to adopt, or None once any speculative run is gone from the thread.
+        """
+        resolved = time.perf_counter()
+        with self.lock:
+            self.closed = True
+            if self.timer is not None:
+                self.timer.cancel()
+            speculation, self.speculation = self.speculation, None
+        self.speculator.count("revised", self.revised)
+
+        if speculation is not None and final_text is not None and _key(final_text) == speculation.key:
+            saved = resolved - speculation.started
+            self.speculator.count("hits")
+            self.speculator.count("saved_seconds", saved)
+            vlog("Speculation hit, the reply had a %.2fs head start", saved)
+            if trace:
+                trace.set(speculation="hit", speculation_saved_ms=round(saved * 1000, 1))
+            return speculation
+
+        if speculation is not None:
+            self.speculator.count("misses")
+            vlog("Speculation miss: guessed '%s', heard '%s'", speculation.text, final_text)
+            self.speculator.executor.submit(speculation.discard, self.config.speculation_discard_timeout)
+        # The real request must not start while a speculative run still holds the thread
+        self.speculator.executor.submit(lambda: None).result()
+        if trace:
+            trace.set(speculation="miss" if speculation is not None else "none")
+            if speculation is not None:
+                trace.add("speculation_discard", time.perf_counter() - resolved)
+        return None
+
+
+class Speculator:
+    """
+    Sends the question to the assistant before the user has finished saying it.
+
+    A partial transcript is taken as the question once it has not changed for
+    Config.speculation_stable_ms, or right away when it matches one of
+    Config.speculation_complete_patterns. If the final transcript asks the same thing (same
+    normalized words) the turn adopts the reply that is already streaming in; otherwise the
+    speculative run is cancelled and removed from the thread before the real request is sent.
+    All speculative starts and discards run on one worker, so at most one speculative run holds
+    the conversation thread at a time.
+    """
+    def __init__(self, config, conversation, should_speculate=None):
+        self.config = config
+        self.conversation = conversation
+        self.should_speculate = should_speculate or (lambda text: True)  # e.g. skip what is answered locally
+        self.patterns = [re.compile(pattern) for pattern in self.config.speculation_complete_patterns]
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculation")
+        self.lock = threading.Lock()
+        self.counters = {"turns": 0, "started": 0, "hits": 0, "misses": 0, "revised": 0, "saved_seconds": 0.0}
+
+    def begin(self, assistant_id):
+        self.count("turns")
+        return SpeculativeTurn(self, assistant_id)
+
+    def discard(self, speculation):
+        # For a hit that ended up not being used, e.g. because the command was answered locally
+        if not speculation.adopted:
+            self.executor.submit(speculation.discard, self.config.speculation_discard_timeout)
+
+    def is_complete(self, key):
+        return any(pattern.search(key) for pattern in self.patterns)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        resolved = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / resolved if resolved else 0.0
+        stats["avg_saved_seconds"] = stats["saved_seconds"] / stats["hits"] if stats["hits"] else 0.0
+        stats["saved_seconds"] = round(stats["saved_seconds"], 2)
+        return stats
+
+    def shutdown(self):
+        vlog(f"Speculation stats: {self.stats()}")
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,76 @@
+import threading
+import time
+from queue import Queue
+from sentence_segmenter import SentenceSegmenter
+from utils import log, vlog, vvlog
+
+
+class SpeechPipeline:
+    def __init__(self, config, text_to_speech, audio_manager):
+        self.config = config
+        self.text_to_speech = text_to_speech
+        self.audio_manager = audio_manager
+
+    def speak(self, tokens, on_first_segment=None, cancel=None, trace=None):
+        """
+        Speak a stream of text tokens, synthesizing each sentence as soon as it is complete.
+
+        :param tokens: Any iterable of text fragments, e.g. the deltas of a streamed assistant run.
+        :param on_first_segment: Optional function called once, right before the first segment is synthesized.
+        :param cancel: Optional threading.Event; once set, no further tokens are read or segments synthesized.
+        :param trace: Optional Trace that receives the "tts" span and the "first_audio" mark.
+        :return: The full text that was spoken.
+        """
+        segmenter = SentenceSegmenter(self.config.segment_min_chars, self.config.segment_clause_min_chars)
+        segment_queue = Queue()
+        worker = threading.Thread(target=self._synthesis_worker, args=(segment_queue, on_first_segment, cancel, trace), daemon=True)
+        worker.start()
+
+        text = ""
+        try:
+            for token in tokens:
+                if cancel is not None and cancel.is_set():
+                    break
+                text += token
+                for segment in segmenter.feed(token):
+                    segment_queue.put(segment)
+            for segment in segmenter.flush():
+                segment_queue.put(segment)
+        finally:
+            segment_queue.put(None)  # Signal the worker that the stream has ended
+            if hasattr(tokens, "close"):
+                tokens.close()  # Lets a generator abandon its remaining work, e.g. cancel the assistant run
+            worker.join()
+        return text
+
+    def _synthesis_worker(self, segment_queue, on_first_segment, cancel, trace):
+        # Synthesize segments in order and queue them for gap-free playback
+        index = 0
+        while True:
+            segment = segment_queue.get()
+            if segment is None:
+                break
+            if cancel is not None and cancel.is_set():
+                continue  # Drain the queue without synthesizing
+            if index == 0 and on_first_segment:
+                on_first_segment()
+            vvlog("Synthesizing segment %d: %s", index, segment)
+            started = time.perf_counter()
+            chunks = self.text_to_speech.stream_audio(segment, cancel)
+            queued = False
+            try:
+                # Each chunk joins the playback queue as soon as it arrives
+                for chunk in chunks:
+                    if cancel is not None and cancel.is_set():
+                        break
+                    if not queued and trace:
+                        trace.add("tts", time.perf_counter() - started)  # Time until the segment could start playing
+                    self.audio_manager.queue_sound(chunk)
+                    if trace:
+                        trace.mark("first_audio")
+                    queued = True
+            finally:
+                chunks.close()
+            if not queued and not (cancel is not None and cancel.is_set()):
+                log("Skipping segment %d, synthesis failed", index, error=True)
+            index += 1
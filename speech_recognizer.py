@@ -1,38 +1,129 @@
-import speech_recognition as sr
-import datetime
-import os
+import threading
+import time
+from endpointer import Endpointer
+from asr_backends import create_backend
+from lazy_import import lazy_import
 from utils import log, vlog, vvlog
 
+sr = lazy_import("speech_recognition")
+np = lazy_import("numpy")
+
 class SpeechRecognizer:
-    def __init__(self, config):
+    def __init__(self, config, archive=None):
         self.config = config
+        self.archive = archive
         self.recognizer = sr.Recognizer()
         self.recognizer.pause_threshold = self.config.recognizer_pause_threshold
         self.recognizer.phrase_threshold = self.config.recognizer_phrase_threshold
         self.recognizer.non_speaking_duration = self.config.recognizer_non_speaking_duration
-        self.ambient_noise_energy_threshold = None
+        self.endpointer = Endpointer(
+            self.config.capture_sample_rate,
+            frame_ms=self.config.vad_frame_ms,
+            threshold_db=self.config.vad_threshold_db,
+            hangover_ms=self.config.vad_hangover_ms,
+            min_speech_ms=self.config.vad_min_speech_ms,
+            trailing_silence=self.config.vad_trailing_silence
+        )
+        self.backend = create_backend(self.config, self.recognizer)
+        self.last_speech_end = None
+        self.last_endpoint_delay = None
+        # One utterance at a time: the endpointer, backend and last_* results are per utterance
+        self.listening = threading.Lock()
+
+    def set_noise_floor(self, level_db):
+        # Live update from the NoiseFloorEstimator; returns the thresholds it set, for the history
+        self.endpointer.seed_noise_floor(level_db)
+        # speech_recognition's threshold (used by the listen() fallback) is the ambient RMS times its energy ratio
+        ambient_rms = 32768 * 10 ** (level_db / 20)
+        self.recognizer.energy_threshold = max(ambient_rms, 1) * self.recognizer.dynamic_energy_ratio
+        return {
+            "speech_threshold_db": round(level_db + self.config.vad_threshold_db, 1),
+            "energy_threshold": round(self.recognizer.energy_threshold, 1),
+        }
+
+    def capture_utterance(self, source, timeout, cancel=None):
+        # Read from the source until the endpointer reports the end of the utterance,
+        # streaming the audio to the recognition backend as it arrives; returns None if cancel is set
+        self.backend.start()
+        self.last_speech_end = None
+        self.last_endpoint_delay = None
+        if source.SAMPLE_WIDTH != 2 or source.SAMPLE_RATE != self.endpointer.sample_rate:
+            return self.recognizer.listen(source, timeout=timeout)
+
+        self.endpointer.reset()
+        pause_frames = max(1, self.config.asr_pause_hint_ms // self.config.vad_frame_ms)
+        paused_at = None
+        chunks = []
+        samples_read = 0
+        start_limit = int(timeout * source.SAMPLE_RATE) if timeout else None
+        max_samples = int(self.config.vad_max_utterance_seconds * source.SAMPLE_RATE)
+        while True:
+            if cancel is not None and cancel.is_set():
+                return None
+            data = source.stream.read(source.CHUNK)
+            chunk = np.frombuffer(data, dtype=np.int16)
+            chunks.append(chunk)
+            samples_read += len(chunk)
+            self.backend.accept(data)
+            if self.endpointer.process(chunk):
+                break
+            if self.endpointer.in_speech and self.endpointer.silence_run >= pause_frames and paused_at != self.endpointer.speech_end:
+                # The speaker paused; let the backend start on what has been said so far
+                paused_at = self.endpointer.speech_end
+                self.backend.on_pause(paused_at, self._speech_segment(source, chunks))
+            if self.endpointer.speech_start is None and start_limit and samples_read >= start_limit:
+                raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+            if samples_read >= max_samples:
+                vlog("Utterance reached the maximum length, cutting off")
+                break
 
-    def calibrate_for_ambient_noise(self, source):
-        log(f"Calibrating for ambient noise ({self.config.noise_calibration_time}s)...")
-        self.recognizer.adjust_for_ambient_noise(source, duration=self.config.noise_calibration_time)
-        self.ambient_noise_energy_threshold = self.recognizer.energy_threshold
-        vlog(f"Calibrated energy threshold: {self.ambient_noise_energy_threshold}")
+        if self.endpointer.speech_start is None:
+            raise sr.WaitTimeoutError("no speech detected before the utterance limit")
+        vvlog("Endpoint detected after %.2fs of audio", samples_read / source.SAMPLE_RATE)
+        self.last_speech_end = self.endpointer.speech_end
+        # Audio read after the speech ended, i.e. how long the endpointer waited to be sure
+        self.last_endpoint_delay = (samples_read - self.endpointer.speech_end) / source.SAMPLE_RATE
+        return self._speech_segment(source, chunks)
 
-    def recognize_speech(self, source, timeout):
+    def _speech_segment(self, source, chunks):
+        # Keep a little padding around the detected speech so word edges are not clipped
+        padding = int(self.config.vad_padding_seconds * source.SAMPLE_RATE)
+        audio = np.concatenate(chunks)
+        start = max(0, self.endpointer.speech_start - padding)
+        end = min(len(audio), self.endpointer.speech_end + padding)
+        return sr.AudioData(audio[start:end].tobytes(), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+    def recognize_speech(self, source, timeout, cancel=None, trace=None, on_partial=None):
+        # on_partial, if given, is called with every partial transcript of this utterance.
+        # After a barge-in the cancelled turn may still be in here; the new turn waits for it to
+        # leave, which costs no audio because the source reads from the capture ring
+        with self.listening:
+            return self._recognize_speech(source, timeout, cancel, trace, on_partial)
+
+    def _recognize_speech(self, source, timeout, cancel, trace, on_partial):
+        if cancel is not None and cancel.is_set():
+            return None
         log("Listening, speak your command...")
+        self.backend.on_partial = on_partial
         try:
-            audio = self.recognizer.listen(source, timeout=timeout)
+            started = time.perf_counter()
+            audio = self.capture_utterance(source, timeout, cancel)
+            if audio is None:
+                vlog("Listening cancelled")
+                return None
             vvlog("Picking up audio...")
+            finished = time.perf_counter()
 
-            text = self.recognizer.recognize_google(audio)
+            text = self.backend.finish(self.last_speech_end, audio)
+            if trace:
+                trace.add("listen", finished - started)
+                trace.add("endpointing", self.last_endpoint_delay or 0.0)
+                trace.add("asr", time.perf_counter() - finished)
             log("Processed Audio: " + text)
 
-            # Save the audio data to a file in the 'recordings' directory
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            audio_filename = os.path.join(self.config.recordings_directory, f"audio_{timestamp}.wav")
-            with open(audio_filename, "wb") as audio_file:
-                audio_file.write(audio.get_wav_data())
-            vlog(f"Audio saved to {audio_filename}")
+            # Save the audio and transcript to the 'recordings' directory in the background
+            if self.archive:
+                self.archive.save_recording(audio, text)
 
             return text
         except sr.WaitTimeoutError:
@@ -41,4 +132,9 @@ class SpeechRecognizer:
             log("Google Speech Recognition could not understand audio", error=True)
         except sr.RequestError as e:
             log(f"Could not request results from Google Speech Recognition service; {e}", error=True)
-        return None
\ No newline at end of file
+        finally:
+            self.backend.on_partial = None
+        return None
+
+    def shutdown(self):
+        self.backend.close()
@@ -0,0 +1,101 @@
+import json
+import sys
+import threading
+import time
+
+
+class ImportProfiler:
+    """
+    Meta path hook that records how long every module takes to import.
+
+    Like "python -X importtime", but it can be switched on from inside the program and it also
+    sees modules imported lazily later on. Times are inclusive ("total") and exclusive of
+    nested imports ("self"), per thread so imports in parallel init phases are not mixed up.
+    """
+    def __init__(self):
+        self.records = []
+        self.local = threading.local()
+        self.finding = threading.local()
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        # Let the real finders locate the module, then time its loader
+        if getattr(self.finding, "active", False):
+            return None
+        self.finding.active = True
+        try:
+            spec = None
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+        finally:
+            self.finding.active = False
+        if spec is not None and spec.loader is not None:
+            self._wrap_loader(name, spec.loader)
+        return spec
+
+    def _wrap_loader(self, name, loader):
+        if isinstance(loader, type):
+            return  # Built-in and frozen importers are shared classes and cheap anyway
+        try:
+            for method in ("create_module", "exec_module"):
+                original = getattr(loader, method, None)
+                if original is not None:
+                    setattr(loader, method, self._timed(name, original))
+        except AttributeError:
+            pass
+
+    def _timed(self, name, function):
+        def wrapper(*args, **kwargs):
+            stack = self.local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                total = time.perf_counter() - started
+                children = stack.pop()
+                if stack:
+                    stack[-1] += total
+                self.records.append({"module": name, "self": total - children, "total": total, "thread": threading.current_thread().name})
+        return wrapper
+
+    def module_times(self):
+        # Merge create_module and exec_module records per module
+        merged = {}
+        for record in self.records:
+            entry = merged.setdefault(record["module"], {"module": record["module"], "self": 0.0, "total": 0.0})
+            entry["self"] += record["self"]
+            entry["total"] += record["total"]
+        return sorted(merged.values(), key=lambda entry: entry["self"], reverse=True)
+
+
+def report(profiler, phases, output_path, top=25):
+    """
+    Print the startup breakdown and write it as JSON.
+
+    :param profiler: The ImportProfiler that was active during startup.
+    :param phases: Mapping of phase name to seconds.
+    :param output_path: Where to write the JSON report.
+    :param top: How many of the slowest modules to print.
+    """
+    modules = profiler.module_times()
+    print("Startup phases:")
+    for phase, seconds in phases.items():
+        print(f"  {phase:<20s} {seconds * 1000:9.1f} ms")
+    print(f"Slowest imports (self time, {len(modules)} modules total):")
+    for entry in modules[:top]:
+        print(f"  {entry['module']:<55s} {entry['self'] * 1000:9.1f} ms  (total {entry['total'] * 1000:.1f} ms)")
+
+    with open(output_path, "w") as file:
+        json.dump({"timestamp": time.time(), "phases": phases, "imports": modules}, file, indent=2)
+    print(f"Startup profile written to {output_path}")
@@ -0,0 +1,38 @@
+import threading
+import numpy as np
+from audio_mixer import StreamHandle
+
+
+class RacingEvent(threading.Event):
+    # finished event that lets another thread append just as the voice reports itself drained
+    def __init__(self, handle, chunk):
+        super().__init__()
+        self.handle = handle
+        self.chunk = chunk
+        self.appended = None
+        self.appender = None
+
+    def set(self):
+        if self.appender is None:
+            self.appender = threading.Thread(target=self._append)
+            self.appender.start()
+            self.appender.join(0.2)  # Blocks on the handle's lock if finishing holds it
+        super().set()
+
+    def _append(self):
+        self.appended = self.handle.append(self.chunk)
+
+
+def test_chunk_appended_while_draining_is_refused_or_played():
+    handle = StreamHandle(16000, close_when_drained=True)
+    late = np.full(64, 0.5, dtype=np.float32)
+    handle.finished = RacingEvent(handle, late)
+    handle.append(np.full(64, 0.25, dtype=np.float32))
+
+    out = np.zeros(128, dtype=np.float32)
+    playing = handle._mix_into(out)
+    handle.finished.appender.join(1)
+
+    assert not playing
+    assert handle.finished.appended is False  # The caller knows to start a new voice for it
+    assert not handle.chunks
@@ -0,0 +1,91 @@
+import threading
+import time
+import numpy as np
+from config import Config
+from interaction import InteractionController, State
+from speech_recognizer import SpeechRecognizer
+
+RATE = 16000
+CHUNK = 320
+
+
+class ScriptedStream:
+    # Microphone stand-in: quiet room noise, then speech and silence once talk() is called, in real time
+    def __init__(self):
+        self.rng = np.random.default_rng(0)
+        self.pending = []
+        self.reads = 0
+
+    def talk(self, seconds=0.6, trailing=0.8):
+        speech = (np.sin(np.arange(int(seconds * RATE)) * 2 * np.pi * 300 / RATE) * 8000).astype(np.int16)
+        self.pending.append(np.concatenate([speech, np.zeros(int(trailing * RATE), dtype=np.int16)]))
+
+    def read(self, size):
+        time.sleep(size / RATE)
+        self.reads += 1
+        if self.pending:
+            samples, self.pending[0] = self.pending[0][:size], self.pending[0][size:]
+            if not len(self.pending[0]):
+                self.pending.pop(0)
+            if len(samples) == size:
+                return samples.tobytes()
+        return self.rng.normal(0, 30, size).astype(np.int16).tobytes()
+
+
+class ScriptedSource:
+    SAMPLE_RATE = RATE
+    SAMPLE_WIDTH = 2
+    CHUNK = CHUNK
+
+    def __init__(self, stream):
+        self.stream = stream
+
+
+class SilentAudio:
+    def stop_all_sounds(self, fade=None):
+        pass
+
+
+def test_barge_in_while_listening_keeps_the_new_turn_intact():
+    config = Config()
+    config.asr_backend = "offline"
+    config.asr_offline_transcript = "what is the weather in paris"
+    config.wake_debounce_seconds = 0
+    recognizer = SpeechRecognizer(config)
+    recognizer.endpointer.seed_noise_floor(-60)
+    streams, partials, commands = {}, {}, {}
+
+    def process_command(event, turn):
+        streams[turn.id] = stream = ScriptedStream()
+        partials[turn.id] = []
+        commands[turn.id] = recognizer.recognize_speech(
+            ScriptedSource(stream), 5, turn.cancel, on_partial=partials[turn.id].append
+        )
+
+    controller = InteractionController(config, SilentAudio(), process_command)
+    dispatcher = threading.Thread(target=controller.run, daemon=True)
+    dispatcher.start()
+    try:
+        controller.post("wake")
+        deadline = time.monotonic() + 2
+        while (1 not in streams or streams[1].reads < 3) and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+        controller.post("wake")  # Barge in while the first turn is listening
+        while 2 not in streams and time.monotonic() < deadline:
+            time.sleep(0.005)
+        streams[2].talk()
+
+        deadline = time.monotonic() + 5
+        while controller.state != State.IDLE and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        controller.post("stop")
+        dispatcher.join(2)
+
+    assert controller.counters["barge_ins"] == 1
+    assert commands[1] is None
+    assert commands[2] == "what is the weather in paris"
+    assert partials[1] == []
+    assert partials[2] and "what is the weather in paris".startswith(partials[2][-1])  # Speculation still sees the new turn
+    assert recognizer.backend.on_partial is None
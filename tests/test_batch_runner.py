@@ -0,0 +1,76 @@
+import io
+import json
+import threading
+from config import Config
+from batch_runner import BatchRunner, Backoff
+
+
+class FakeClient:
+    # Answers every command by echoing it, each on a new thread
+    def __init__(self):
+        self.threads = 0
+
+    def create_thread(self, messages=None):
+        self.threads += 1
+        return f"thread_{self.threads}"
+
+    def delete_thread(self, thread_id, retries=0):
+        pass
+
+    def process_command_with_assistant(self, thread_id, command, assistant_id, stats=None, cancel=None, trace=None):
+        return f"You said: {command}"
+
+
+def run(lines, text_to_speech=None):
+    runner = BatchRunner(Config(), FakeClient(), "assistant_1", text_to_speech, concurrency=2, backoff=Backoff(0, 0))
+    output = io.StringIO()
+    ok = runner.run(lines, output)
+    results = {result["id"]: result for result in map(json.loads, output.getvalue().splitlines())}
+    return ok, results, runner.counters
+
+
+def test_malformed_line_is_reported_as_failed():
+    ok, results, counters = run(['{"id": "a", "command": "hello"}', '{"id": "b", "command": ', "good morning"])
+
+    assert not ok
+    assert counters == {"items": 3, "ok": 2, "failed": 1, "retries": 0}
+    assert results["a"]["reply"] == "You said: hello"
+    assert not results["2"]["ok"]
+    assert results["2"]["error"].startswith("malformed JSON on line 2")
+    assert results["3"]["ok"]
+
+
+def test_say_item_without_text_to_speech_is_reported_as_failed():
+    ok, results, counters = run(['{"id": "greeting", "say": "Good morning"}'])
+
+    assert not ok
+    assert counters["failed"] == 1
+    assert results["greeting"]["error"] == "say item needs --tts"
+
+
+def test_items_without_an_id_are_numbered_by_line():
+    ok, results, counters = run(["# morning questions", "", '{"command": ', "good morning", '{"command": "hello"}'])
+
+    assert counters["items"] == 3
+    assert sorted(results) == ["3", "4", "5"]
+    assert not results["3"]["ok"]
+    assert results["4"]["reply"] == "You said: good morning"
+
+
+class BrokenOutput:
+    def write(self, text):
+        raise OSError("disk full")
+
+    def flush(self):
+        pass
+
+
+def test_failed_result_write_does_not_stall_the_batch():
+    runner = BatchRunner(Config(), FakeClient(), "assistant_1", concurrency=2, backoff=Backoff(0, 0))
+    finished = []
+    worker = threading.Thread(target=lambda: finished.append(runner.run([f"command {n}" for n in range(6)], BrokenOutput())), daemon=True)
+
+    worker.start()
+    worker.join(5)
+
+    assert finished, "run() is still waiting for a free slot"
@@ -0,0 +1,80 @@
+import threading
+from config import Config
+from conversation import Conversation
+from speculation import Speculation
+
+
+class FakeClient:
+    # Streams a reply that only finishes once released, and records thread creates and deletes
+    def __init__(self):
+        self.released = threading.Event()
+        self.deleted = []
+        self.discarded = []
+        self.threads = 1
+
+    def stream_command_with_assistant(self, thread_id, command, assistant_id, cancel=None, trace=None, created=None):
+        if created is not None:
+            created["thread_id"] = thread_id
+        yield "Still "
+        self.released.wait(5)
+        yield "answering."
+
+    def discard_turn(self, created, timeout=5):
+        self.discarded.append(created.get("thread_id"))
+
+    def create_thread(self, messages=None):
+        self.threads += 1
+        return f"thread_{self.threads}"
+
+    def delete_thread(self, thread_id, retries=0):
+        self.deleted.append(thread_id)
+
+
+def test_rotation_waits_for_turns_on_the_old_thread():
+    config = Config()
+    client = FakeClient()
+    conversation = Conversation(config, client, "thread_1")
+    tokens = conversation.stream("what time is it", "assistant_1")
+    assert next(tokens) == "Still "  # A turn is now running on thread_1
+
+    rotation = threading.Thread(target=conversation.rotate)
+    rotation.start()
+    rotation.join(0.3)
+    assert conversation.thread_id == "thread_2"
+    assert rotation.is_alive() and client.deleted == []
+
+    client.released.set()
+    assert list(tokens) == ["answering."]
+    rotation.join(5)
+    assert client.deleted == ["thread_1"]
+
+
+def finished_speculation(conversation):
+    speculation = Speculation(conversation, "assistant_1", "what time is it")
+    speculation.thread.join(5)
+    assert speculation.done
+    return speculation
+
+
+def test_discarded_speculation_is_not_counted():
+    client = FakeClient()
+    client.released.set()
+    conversation = Conversation(Config(), client, "thread_1")
+
+    finished_speculation(conversation).discard(5)
+
+    assert client.discarded == ["thread_1"]
+    assert (conversation.message_count, conversation.token_estimate, list(conversation.recent_turns)) == (0, 0, [])
+
+
+def test_adopted_speculation_is_counted_once():
+    client = FakeClient()
+    client.released.set()
+    conversation = Conversation(Config(), client, "thread_1")
+    speculation = finished_speculation(conversation)
+    assert conversation.message_count == 0
+
+    assert "".join(speculation.adopt()) == "Still answering."
+
+    assert conversation.message_count == 2
+    assert list(conversation.recent_turns) == [("what time is it", "Still answering.")]
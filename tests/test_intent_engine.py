@@ -0,0 +1,44 @@
+import pytest
+from config import Config
+from intent_engine import IntentEngine
+
+
+@pytest.fixture
+def engine():
+    engine = IntentEngine(Config())
+    engine.register("time", ["what time is it", "what is the time", "tell me the time", "time", "current time"], None)
+    engine.register("date", ["what is the date", "what is the date today", "what day is it", "what day is it today", "what is today", "today's date"], None)
+    engine.register("set_timer", ["set a timer for {duration}", "timer for {duration}", "{duration} timer"], None)
+    engine.register("set_volume", ["set the volume to {number}", "set volume to {number} percent", "volume {number}"], None)
+    engine.register("volume_up", ["volume up", "turn it up", "turn the volume up", "increase the volume"], None)
+    engine.register("volume_down", ["volume down", "turn it down", "turn the volume down", "decrease the volume"], None)
+    return engine
+
+
+@pytest.mark.parametrize("command, intent, slots", [
+    ("What's the time?", "time", {}),
+    ("What time is it please", "time", {}),
+    ("Set a timer for five minutes and 30 seconds", "set_timer", {"duration": 330}),
+    ("set the volume to 70 percent", "set_volume", {"number": 70}),
+    ("Turn the volume down", "volume_down", {}),
+    ("decrease the volum", "volume_down", {}),  # A typo in a longer word
+    ("increase the voulme", "volume_up", {}),
+])
+def test_matches_local_commands(engine, command, intent, slots):
+    match = engine.match(command)
+    assert match is not None and match.intent.name == intent
+    assert match.slots == slots
+
+
+@pytest.mark.parametrize("command", [
+    "what's the weather today",
+    "what's the rate today",
+    "what is the tide today",
+    "what's on today",
+    "turn it on",
+    "what time is it in Tokyo",
+    "set a timer",
+    "volume",
+])
+def test_leaves_other_questions_to_the_assistant(engine, command):
+    assert engine.match(command) is None
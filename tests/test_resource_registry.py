@@ -0,0 +1,18 @@
+from resource_registry import ResourceRegistry
+
+
+def test_record_after_a_torn_tail_survives_replay(tmp_path):
+    path = str(tmp_path / "resources.journal")
+    with open(path, "w") as file:
+        file.write("+ thread t1\n+ thread t2\n+ thr")  # Crashed halfway through a create
+
+    registry = ResourceRegistry(path)
+    assert registry.active_ids("thread") == ["t1", "t2"]
+    registry.record("thread", "t3")
+    registry.close()
+
+    replayed = ResourceRegistry(path)
+    replayed.close()
+    assert replayed.active_ids("thread") == ["t1", "t2", "t3"]
+    with open(path) as file:
+        assert file.read() == "+ thread t1\n+ thread t2\n+ thread t3\n"
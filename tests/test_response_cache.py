@@ -0,0 +1,49 @@
+import pytest
+from config import Config
+from response_cache import ResponseCache
+
+
+def test_audio_for_a_near_duplicate_hit_is_stored_on_the_matched_entry(tmp_path):
+    config = Config()
+    config.response_cache_file = str(tmp_path / "response_cache.json")
+    cache = ResponseCache(config)
+    cache.put("what is the capital of france", "Paris.", 1.0)
+
+    entry = cache.get("what is capital of frances")
+    assert entry["text"] == "Paris."
+    cache.set_audio_path(entry["key"], "paris.wav")
+
+    assert cache.get("what is the capital of france")["audio_path"] == "paris.wav"
+    assert cache.get("what is capital of frances")["audio_path"] == "paris.wav"
+
+
+def cache_with(tmp_path, *questions):
+    config = Config()
+    config.response_cache_file = str(tmp_path / "response_cache.json")
+    cache = ResponseCache(config)
+    for question in questions:
+        cache.put(question, f"Answer to {question}", 1.0)
+    return cache
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("what is the population of india", "what is the population of indiana"),
+    ("when was john kennedy born", "when was john kennedy jr born"),
+    ("what is 5 minus 3", "what is 3 minus 5"),
+    ("who is the president of france", "who was the president of france"),
+])
+def test_question_with_other_words_is_a_miss(tmp_path, cached, asked):
+    cache = cache_with(tmp_path, cached)
+
+    assert cache.get(asked) is None
+    assert cache.get(cached)["text"] == f"Answer to {cached}"
+
+
+def test_near_duplicate_survives_a_restart(tmp_path):
+    cache = cache_with(tmp_path, "what are the capitals of the baltic states")
+    cache.shutdown()
+
+    reloaded = cache_with(tmp_path)
+    entry = reloaded.get("what are the capital of the baltic states")
+    assert entry["text"] == "Answer to what are the capitals of the baltic states"
+    assert reloaded.near_hits == 1
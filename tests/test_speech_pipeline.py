@@ -0,0 +1,94 @@
+import threading
+from config import Config
+from sentence_segmenter import SentenceSegmenter
+from speech_pipeline import SpeechPipeline
+
+
+class FakeTextToSpeech:
+    # "Synthesizes" a segment as two chunks of its text
+    def __init__(self):
+        self.segments = []
+
+    def stream_audio(self, text, cancel=None):
+        self.segments.append(text)
+        yield text.encode()
+        yield b"|"
+
+
+class FakeAudioManager:
+    def __init__(self):
+        self.queued = []
+
+    def queue_sound(self, chunk):
+        self.queued.append(chunk)
+
+
+def tokens(text, size=3):
+    # The reply as a model would stream it, a few characters at a time
+    for index in range(0, len(text), size):
+        yield text[index:index + size]
+
+
+def segment(text, min_chars=20, clause_min_chars=80):
+    segmenter = SentenceSegmenter(min_chars, clause_min_chars)
+    segments = [piece for token in tokens(text) for piece in segmenter.feed(token)]
+    return segments + segmenter.flush()
+
+
+def test_sentences_are_split_as_they_complete():
+    assert segment("Sure. It is sunny in Paris today. Expect a high of 64 degrees!", min_chars=10) == [
+        "Sure. It is sunny in Paris today.", "Expect a high of 64 degrees!",
+    ]
+
+
+def test_abbreviations_do_not_end_a_sentence():
+    assert segment("Dr. Smith lives on Baker St. near the station. He is in.", min_chars=5) == [
+        "Dr. Smith lives on Baker St. near the station.", "He is in.",
+    ]
+
+
+def test_no_ends_a_sentence():
+    assert segment("The answer is no. Anything else?", min_chars=5) == ["The answer is no.", "Anything else?"]
+
+
+def test_long_sentence_is_split_at_a_clause():
+    text = "The forecast for the coming week is mostly dry, with a chance of showers on Thursday and Friday afternoon"
+    assert segment(text, clause_min_chars=60) == [
+        "The forecast for the coming week is mostly dry,", "with a chance of showers on Thursday and Friday afternoon",
+    ]
+
+
+def test_pipeline_speaks_every_segment_in_order():
+    text_to_speech, audio_manager = FakeTextToSpeech(), FakeAudioManager()
+    pipeline = SpeechPipeline(Config(), text_to_speech, audio_manager)
+    first = []
+    reply = "It is sunny in Paris today. Expect a high of 64 degrees. Take sunglasses."
+
+    spoken = pipeline.speak(tokens(reply), on_first_segment=lambda: first.append(True))
+
+    assert spoken == reply
+    assert first == [True]
+    assert text_to_speech.segments == ["It is sunny in Paris today.", "Expect a high of 64 degrees.", "Take sunglasses."]
+    assert b"".join(audio_manager.queued) == b"It is sunny in Paris today.|Expect a high of 64 degrees.|Take sunglasses.|"
+
+
+def test_cancelled_pipeline_stops_reading_tokens():
+    text_to_speech, audio_manager = FakeTextToSpeech(), FakeAudioManager()
+    pipeline = SpeechPipeline(Config(), text_to_speech, audio_manager)
+    cancel = threading.Event()
+    closed = []
+
+    def reply():
+        try:
+            yield "It is sunny in Paris today. "
+            cancel.set()
+            yield "Expect a high of 64 degrees. "
+            yield "Take sunglasses."
+        finally:
+            closed.append(True)
+
+    spoken = pipeline.speak(reply(), cancel=cancel)
+
+    assert spoken == "It is sunny in Paris today. "
+    assert closed == [True]
+    assert "Take sunglasses." not in text_to_speech.segments
@@ -0,0 +1,89 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from config import Config
+from openai_client import OpenAIClient
+from tool_registry import ToolRegistry, ToolExecutor
+
+
+class FakeRuns:
+    # The runs API, recording every submit_tool_outputs call
+    def __init__(self):
+        self.submitted = []
+
+    def submit_tool_outputs(self, thread_id, run_id, tool_outputs):
+        self.submitted.append((thread_id, run_id, tool_outputs))
+
+
+def tool_call(call_id, name, arguments="{}"):
+    return SimpleNamespace(id=call_id, type="function", function=SimpleNamespace(name=name, arguments=arguments))
+
+
+@pytest.fixture
+def released():
+    # Set at teardown so a tool left hanging by the test finishes
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture
+def client(tmp_path, released):
+    config = Config()
+    config.resource_journal_file = str(tmp_path / "resources.journal")
+    config.tool_max_workers = 4
+    config.tool_timeout = 5
+
+    # Both lookups only return once the other one has started, so they must run at the same time
+    both_running = threading.Barrier(2, timeout=2)
+    tools = ToolRegistry()
+
+    @tools.register("First lookup", {"type": "object", "properties": {}})
+    def first_lookup():
+        both_running.wait()
+        return "first"
+
+    @tools.register("Second lookup", {"type": "object", "properties": {}})
+    def second_lookup():
+        both_running.wait()
+        return "second"
+
+    @tools.register("Never answers in time", {"type": "object", "properties": {}}, timeout=0.2)
+    def hanging_lookup():
+        released.wait(10)
+        return "too late"
+
+    runs = FakeRuns()
+    sdk = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+    client = OpenAIClient(config, sdk)
+    client.tool_executor = ToolExecutor(tools, config)
+    yield client, runs
+    client.shutdown()
+
+
+def test_tool_calls_run_concurrently_and_are_submitted_once(client):
+    client, runs = client
+    calls = [tool_call("call_1", "first_lookup"), tool_call("call_2", "second_lookup"), tool_call("call_3", "hanging_lookup")]
+    run_status = SimpleNamespace(required_action=SimpleNamespace(submit_tool_outputs=SimpleNamespace(tool_calls=calls)))
+
+    client._handle_required_actions(run_status, "thread_1", "run_1")
+
+    assert len(runs.submitted) == 1
+    thread_id, run_id, outputs = runs.submitted[0]
+    assert (thread_id, run_id) == ("thread_1", "run_1")
+    assert [output["tool_call_id"] for output in outputs] == ["call_1", "call_2", "call_3"]
+    assert outputs[0]["output"] == "first"
+    assert outputs[1]["output"] == "second"
+    assert outputs[2]["output"] == "The function hanging_lookup timed out."
+
+
+def test_cancelled_tool_calls_are_not_submitted(client):
+    client, runs = client
+    cancel = threading.Event()
+    cancel.set()
+    calls = [tool_call("call_1", "hanging_lookup")]
+    run_status = SimpleNamespace(required_action=SimpleNamespace(submit_tool_outputs=SimpleNamespace(tool_calls=calls)))
+
+    client._handle_required_actions(run_status, "thread_1", "run_1", cancel)
+
+    assert runs.submitted == []
@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from config import Config
+from http_client import http_client
+from tool_registry import registry
+import assistant_functions  # Registers get_weather
+
+
+class WeatherStandIn(ThreadingHTTPServer):
+    """
+    Local stand-in for the OpenWeatherMap current weather endpoint.
+
+    Each request takes the next scripted behaviour ("ok", "error" for a 503 or "slow" for a reply
+    after slow_seconds); once the script runs out every request is "ok". The reported
+    temperature is the number of the request, so tests can tell which response they got.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), WeatherHandler)
+        self.script = []
+        self.requests = 0
+        self.slow_seconds = 1.0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/data/2.5/weather"
+
+    def next_behaviour(self):
+        with self.lock:
+            self.requests += 1
+            return self.requests, self.script.pop(0) if self.script else "ok"
+
+
+class WeatherHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        number, behaviour = self.server.next_behaviour()
+        if behaviour == "slow":
+            time.sleep(self.server.slow_seconds)
+        if behaviour == "error":
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps({
+            "weather": [{"description": "clear sky"}],
+            "main": {"temp": number, "humidity": 50},
+            "wind": {"speed": 3},
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # The client gave up waiting
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = WeatherStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def config(server):
+    config = Config()
+    config.openweathermap_api_key = "test-key"
+    config.openweathermap_url = server.url
+    config.http_read_timeout = 0.3
+    config.http_retries = 2
+    http_client.configure(config)
+    http_client.backoff = 0.01
+    http_client.clear()
+    yield config
+    http_client.clear()
+
+
+def weather(config, location="Paris"):
+    return registry.call("get_weather", json.dumps({"location": location}), config)
+
+
+def test_repeated_lookup_is_served_from_the_cache(server, config):
+    first = weather(config)
+    second = weather(config, "  paris ")
+
+    assert "Temperature: 1°F" in first
+    assert second == first.replace("Paris", "  paris ")
+    assert server.requests == 1
+
+
+def test_stale_report_is_served_while_it_is_refreshed(server, config):
+    config.weather_cache_ttl = 0.5
+    assert "Temperature: 1°F" in weather(config)
+    time.sleep(0.7)  # Past fresh, still within the stale window
+
+    assert "Temperature: 1°F" in weather(config)  # Served stale without waiting for the refresh
+    deadline = time.monotonic() + 2
+    while http_client.stats()["refreshes"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert server.requests == 2
+    assert "Temperature: 2°F" in weather(config)
+    assert server.requests == 2
+
+
+def test_server_error_is_retried(server, config):
+    server.script = ["error"]
+
+    assert "Temperature: 2°F" in weather(config)
+    assert server.requests == 2
+
+
+def test_read_timeout_gives_an_error_message(server, config):
+    config.http_retries = 0
+    http_client.configure(config)
+    server.script = ["slow"]
+
+    started = time.monotonic()
+    result = weather(config)
+
+    assert result.startswith("Failed to get weather data for Paris")
+    assert time.monotonic() - started < server.slow_seconds
+    assert server.requests == 1
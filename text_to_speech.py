@@ -1,43 +1,209 @@
-import os
-from google.cloud import texttospeech
+import datetime
+import importlib.util
+import io
+from lazy_import import lazy_import
+from audio_mixer import StreamResampler, decode_pcm16, decode_wav, encode_wav
+from tts_cache import TTSCache
 from utils import log, vlog, vvlog
 
+np = lazy_import("numpy")
+soundfile = lazy_import("soundfile")  # Optional, only needed for OGG_OPUS replies
+texttospeech = lazy_import("google.cloud.texttospeech")
+
+OPUS_BLOCK_FRAMES = 4800  # samples decoded per chunk of an OGG_OPUS reply, 0.1s at 48 kHz
+
+def _soundfile_available():
+    return importlib.util.find_spec("soundfile") is not None
+
+
 class TextToSpeech:
-    def __init__(self, config):
+    def __init__(self, config, archive=None):
         self.config = config
-        self.client = texttospeech.TextToSpeechClient.from_service_account_json(
-            self.config.google_credentials
+        self.archive = archive
+        self.sample_rate = self.config.mixer_sample_rate  # Audio is requested at the rate it is played at
+        self.streaming = self.config.tts_streaming
+        self.encoding = self.config.tts_transfer_encoding
+        if self.encoding == "OGG_OPUS" and not _soundfile_available():
+            log("OGG_OPUS speech needs the soundfile package, using LINEAR16 instead", error=True)
+            self.encoding = "LINEAR16"
+        self.client = self._create_client()
+        self.cache = None
+        if self.config.tts_cache_enabled:
+            self.cache = TTSCache(
+                self.config.tts_cache_directory,
+                self.config.tts_cache_memory_budget,
+                self.config.tts_cache_disk_budget
+            )
+
+    def synthesize_audio(self, text):
+        # Return the synthesized WAV bytes for text, served from the cache when possible
+        key = self._cache_key(text) if self.cache else None
+        if key:
+            audio = self.cache.get(key)
+            if audio is not None:
+                vlog("Speech served from cache")
+                return audio
+        chunks = list(self._synthesize_chunks(key, text))
+        return encode_wav(np.concatenate(chunks), self.sample_rate) if chunks else None
+
+    def stream_audio(self, text, cancel=None):
+        """
+        Synthesize text as float32 chunks at the mixer's sample rate, each playable as soon as it arrives.
+
+        With Config.tts_streaming the service sends audio while it is still synthesizing, and an
+        OGG_OPUS reply is decoded a block at a time. Cached speech comes back as a single chunk.
+        Once a synthesis is complete it is cached and archived on the archive thread. A stream
+        that is closed early is neither cached nor archived.
+
+        :param cancel: Optional threading.Event; once set, no further audio is requested or decoded.
+        :return: A generator of 1-D float32 numpy arrays; empty if synthesis failed.
+        """
+        key = self._cache_key(text) if self.cache else None
+        if key:
+            audio = self.cache.get(key)
+            if audio is not None:
+                vlog("Speech served from cache")
+                yield decode_wav(io.BytesIO(audio), self.sample_rate)
+                return
+        yield from self._synthesize_chunks(key, text, cancel)
+
+    def _synthesize_chunks(self, key, text, cancel=None):
+        chunks = []
+        try:
+            for chunk in self._request_chunks(text):
+                if cancel is not None and cancel.is_set():
+                    return
+                if len(chunk):
+                    chunks.append(chunk)
+                    yield chunk
+        except Exception as e:
+            log(f"Error synthesizing speech: {e}", error=True)
+            return
+        if chunks:
+            log("Speech synthesized successfully")
+            self._store(key, encode_wav(np.concatenate(chunks), self.sample_rate))
+
+    def _request_chunks(self, text):
+        if self.streaming:
+            try:
+                chunks = self._stream_synthesis(text)
+                first = next(chunks, None)
+            except Exception as e:
+                # Most voices do not support streaming synthesis; stop trying for this session
+                log(f"Streaming synthesis failed ({e}), falling back to single requests", error=True)
+                self.streaming = False
+            else:
+                if first is not None:
+                    yield first
+                    yield from chunks
+                return
+
+        audio = self._request_synthesis(text)
+        if audio[:4] == b"OggS":
+            yield from self._decode_ogg(audio)
+        else:
+            yield decode_wav(io.BytesIO(audio), self.sample_rate)
+
+    def _stream_synthesis(self, text):
+        # Raw PCM chunks from the streaming API, sent while the rest of the text is still being synthesized
+        voice = texttospeech.VoiceSelectionParams(
+            language_code="en-US",
+            name=self.config.tts_streaming_voice or self.config.voice_name
+        )
+        streaming_config = texttospeech.StreamingSynthesizeConfig(
+            voice=voice,
+            streaming_audio_config=texttospeech.StreamingAudioConfig(
+                audio_encoding=texttospeech.AudioEncoding.PCM,
+                sample_rate_hertz=self.sample_rate,
+                speaking_rate=self.config.speaking_rate
+            )
         )
+        requests = iter([
+            texttospeech.StreamingSynthesizeRequest(streaming_config=streaming_config),
+            texttospeech.StreamingSynthesizeRequest(input=texttospeech.StreamingSynthesisInput(text=text)),
+        ])
+        responses = self.client.streaming_synthesize(requests)
+        remainder = b""
+        try:
+            for response in responses:
+                # Chunks are not guaranteed to end on a sample boundary
+                buffer = remainder + response.audio_content
+                even = len(buffer) - len(buffer) % 2
+                remainder = buffer[even:]
+                yield decode_pcm16(buffer[:even])
+        finally:
+            if hasattr(responses, "cancel"):
+                responses.cancel()  # No-op once the call has completed
+
+    def _decode_ogg(self, audio):
+        # Decode an OGG_OPUS reply a block at a time, so the first block can play before the rest is decoded
+        with soundfile.SoundFile(io.BytesIO(audio)) as file:
+            resampler = StreamResampler(file.samplerate, self.sample_rate)
+            for block in file.blocks(blocksize=OPUS_BLOCK_FRAMES, dtype="float32", always_2d=True):
+                yield resampler.feed(block.mean(axis=1))
+        yield resampler.flush()
 
-    def synthesize_speech(self, text, filename="output.wav"):
+    def _store(self, key, audio):
+        # Cache and archive a finished synthesis without writing to disk on the response path
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")[:-3]
+        if self.archive is None:
+            if self.cache:
+                self.cache.put(key, audio)
+            return
+        if self.cache:
+            self.archive.defer(self.cache.put, key, audio)
+        if self.config.archive_tts_replies:
+            self.archive.save_file(self.config.outputs_directory, f"speech_{timestamp}.wav", audio)
+
+    def _cache_key(self, text):
+        # Whatever format the audio was transferred in, the cache holds it as WAV
+        return TTSCache.make_key(text, self.config.voice_name, self.config.pitch, self.config.speaking_rate)
+
+    def _create_client(self):
+        return texttospeech.TextToSpeechClient.from_service_account_json(self.config.google_credentials)
+
+    def _request_synthesis(self, text):
+        # One call to the synthesis service; returns WAV bytes, or OGG bytes with Config.tts_transfer_encoding OGG_OPUS
         synthesis_input = texttospeech.SynthesisInput(text=text)
         voice = texttospeech.VoiceSelectionParams(
             language_code="en-US",
             name=self.config.voice_name
         )
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.LINEAR16,
-            pitch=self.config.pitch,
-            speaking_rate=self.config.speaking_rate
-        )
-
-        try:
-            response = self.client.synthesize_speech(
-                input=synthesis_input,
-                voice=voice,
-                audio_config=audio_config
+        if self.encoding == "OGG_OPUS":
+            # Opus always decodes at 48 kHz; it is resampled to the playback rate while decoding
+            audio_config = texttospeech.AudioConfig(
+                audio_encoding=texttospeech.AudioEncoding.OGG_OPUS,
+                pitch=self.config.pitch,
+                speaking_rate=self.config.speaking_rate
+            )
+        else:
+            audio_config = texttospeech.AudioConfig(
+                audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+                sample_rate_hertz=self.sample_rate,
+                pitch=self.config.pitch,
+                speaking_rate=self.config.speaking_rate
             )
-            log("Speech synthesized successfully")
 
-            # Ensure the outputs directory exists
-            os.makedirs(self.config.outputs_directory, exist_ok=True)
-            # Save the audio content to a file in the outputs directory
-            file_path = os.path.join(self.config.outputs_directory, filename)
-            with open(file_path, "wb") as out:
-                out.write(response.audio_content)
-                vlog(f"Audio content saved to {file_path}")
+        response = self.client.synthesize_speech(
+            input=synthesis_input,
+            voice=voice,
+            audio_config=audio_config
+        )
+        return response.audio_content
 
-            return file_path
-        except Exception as e:
-            log(f"Error synthesizing speech: {e}", error=True)
-            return None
\ No newline at end of file
+    def cached_audio_path(self, text):
+        # Where the speech cache keeps the audio for text, if it has it on disk
+        if not self.cache:
+            return None
+        return self.cache.path(self._cache_key(text))
+
+    def warm_up(self, phrases):
+        # Pre-synthesize common phrases so they play instantly later
+        if not self.cache:
+            return
+        for phrase in phrases:
+            key = self._cache_key(phrase)
+            if not self.cache.contains(key):
+                vvlog(f"Warming TTS cache: {phrase}")
+                self.synthesize_audio(phrase)
+        vlog(f"TTS cache warm-up finished ({len(phrases)} phrases)")
@@ -0,0 +1,124 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from utils import log, vlog, vvlog
+
+
+class Tool:
+    def __init__(self, function, name, description, parameters, config_args, timeout):
+        self.function = function
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.config_args = config_args  # function argument name -> Config attribute it is filled from
+        self.timeout = timeout
+
+    def definition(self):
+        # The entry for this tool in the assistant's "tools" list
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters
+            }
+        }
+
+
+class ToolRegistry:
+    def __init__(self):
+        self.tools = {}
+
+    def register(self, description, parameters, name=None, config_args=None, timeout=None):
+        """
+        Decorator that exposes a function to the assistant.
+
+        :param description: What the function does, as shown to the model.
+        :param parameters: JSON schema of the arguments the model must supply.
+        :param name: Function name as seen by the model; defaults to the Python name.
+        :param config_args: Mapping of extra argument names to Config attributes, e.g. API keys.
+        :param timeout: Seconds to wait for a result before giving up; defaults to Config.tool_timeout.
+        """
+        def decorator(function):
+            tool = Tool(function, name or function.__name__, description, parameters, config_args or {}, timeout)
+            self.tools[tool.name] = tool
+            return function
+        return decorator
+
+    def definitions(self):
+        return [tool.definition() for tool in self.tools.values()]
+
+    def call(self, name, arguments, config):
+        # Run a tool by name with the model's JSON arguments and return its output as a string
+        tool = self.tools.get(name)
+        if tool is None:
+            return f"Unknown function: {name}"
+        kwargs = json.loads(arguments) if arguments else {}
+        for argument, attribute in tool.config_args.items():
+            kwargs[argument] = getattr(config, attribute)
+        result = tool.function(**kwargs)
+        return result if isinstance(result, str) else json.dumps(result)
+
+
+class ToolExecutor:
+    # Runs all tool calls of a required action concurrently on a bounded pool
+    def __init__(self, registry, config):
+        self.registry = registry
+        self.config = config
+        self.pool = ThreadPoolExecutor(max_workers=self.config.tool_max_workers, thread_name_prefix="tool")
+
+    def run(self, tool_calls, cancel=None):
+        """
+        Execute tool calls in parallel.
+
+        :param tool_calls: Tool calls from a run's required_action.
+        :param cancel: Optional threading.Event; once set, calls not yet started are dropped and None is returned.
+        :return: A list of {"tool_call_id", "output"} dicts, ready to submit in a single call.
+        """
+        started = time.monotonic()
+        futures = []
+        for tool_call in tool_calls:
+            vlog("Assistant called %s()", tool_call.function.name)
+            future = self.pool.submit(self.registry.call, tool_call.function.name, tool_call.function.arguments, self.config)
+            futures.append((tool_call, future))
+
+        tool_outputs = []
+        for tool_call, future in futures:
+            tool = self.registry.tools.get(tool_call.function.name)
+            timeout = tool.timeout if tool and tool.timeout else self.config.tool_timeout
+            try:
+                output = self._result(future, started + timeout, cancel)
+            except TimeoutError:
+                log(f"Tool {tool_call.function.name} timed out after {timeout}s", error=True)
+                output = f"The function {tool_call.function.name} timed out."
+            except Exception as e:
+                log(f"Tool {tool_call.function.name} failed: {e}", error=True)
+                output = f"The function {tool_call.function.name} failed: {e}"
+            if cancel is not None and cancel.is_set():
+                for _, pending in futures:
+                    pending.cancel()
+                vlog("Tool calls cancelled")
+                return None
+            tool_outputs.append({"tool_call_id": tool_call.id, "output": output})
+        vvlog("Ran %d tool calls in %.2fs", len(tool_outputs), time.monotonic() - started)
+        return tool_outputs
+
+    def _result(self, future, deadline, cancel):
+        # Wait for a tool's result until the deadline, waking up regularly to notice cancellation
+        while True:
+            remaining = deadline - time.monotonic()
+            if cancel is None:
+                return future.result(timeout=max(0, remaining))
+            if cancel.is_set():
+                return None
+            try:
+                return future.result(timeout=max(0, min(remaining, 0.1)))
+            except TimeoutError:
+                if remaining <= 0.1:
+                    raise
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+registry = ToolRegistry()
@@ -0,0 +1,152 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from queue import Queue, Full
+from utils import log, vlog, vvlog
+
+
+class Trace:
+    """
+    Timings of one voice turn.
+
+    Spans are durations in seconds and add up when a stage runs more than once (every TTS
+    segment, every round of tool calls). Marks are points in time, in seconds since the trace
+    started, and only the first mark of a name counts (e.g. "first_audio"). Safe to use from
+    the worker threads a turn fans out to.
+    """
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.marks = {}
+        self.attributes = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def mark(self, name):
+        with self.lock:
+            self.marks.setdefault(name, time.perf_counter() - self.started)
+
+    def set(self, **attributes):
+        with self.lock:
+            self.attributes.update(attributes)
+
+    def record(self):
+        # The JSON line for this trace; times are in milliseconds
+        with self.lock:
+            return {
+                "trace_id": self.trace_id,
+                "timestamp": self.timestamp,
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "spans": {name: round(seconds * 1000, 1) for name, seconds in self.spans.items()},
+                "marks": {name: round(seconds * 1000, 1) for name, seconds in self.marks.items()},
+                "attributes": dict(self.attributes),
+            }
+
+
+class Tracer:
+    # Hands out traces and appends finished ones to Config.trace_file on a background thread
+    def __init__(self, config):
+        self.config = config
+        self.path = self.config.trace_file
+        self.queue = Queue(maxsize=self.config.trace_queue_size)
+        self.dropped = 0
+        self.thread = None
+        if self.config.tracing_enabled:
+            self.thread = threading.Thread(target=self._worker, daemon=True)
+            self.thread.start()
+
+    def start(self, **attributes):
+        trace = Trace()
+        if attributes:
+            trace.set(**attributes)
+        return trace
+
+    def finish(self, trace):
+        if self.thread is None:
+            return
+        record = trace.record()
+        vvlog("Trace %s: %s ms, spans %s, marks %s", record["trace_id"], record["total_ms"], record["spans"], record["marks"])
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+            log("Trace queue full, dropped trace (%d dropped so far)", self.dropped, error=True)
+
+    def _worker(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            try:
+                with open(self.path, "a") as file:
+                    file.write(json.dumps(record) + "\n")
+            except OSError as e:
+                log(f"Error writing trace to {self.path}: {e}", error=True)
+
+    def shutdown(self, timeout=5):
+        if self.thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except Full:
+            return
+        self.thread.join(timeout)
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(path, window_seconds=None):
+    """
+    Print p50/p95/p99 per stage for the traces in a JSONL file.
+
+    :param path: The trace file written by Tracer.
+    :param window_seconds: Only include traces from this many seconds back; None for all of them.
+    """
+    if not os.path.exists(path):
+        print(f"No trace file at {path}")
+        return
+    cutoff = time.time() - window_seconds if window_seconds else 0
+    stages = {}
+    count = 0
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A torn last line from a crash
+            if record.get("timestamp", 0) < cutoff:
+                continue
+            count += 1
+            stages.setdefault("total", []).append(record["total_ms"])
+            for name, value in record.get("spans", {}).items():
+                stages.setdefault(name, []).append(value)
+            for name, value in record.get("marks", {}).items():
+                stages.setdefault(f"@{name}", []).append(value)
+
+    window = f"last {window_seconds / 60:g} min" if window_seconds else "all time"
+    print(f"{count} traces ({window}) from {path}; times in ms, @ = time since the turn started")
+    print(f"  {'stage':<22s} {'count':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s}")
+    for name in sorted(stages, key=lambda name: (name == "total", name.startswith("@"), name)):
+        values = sorted(stages[name])
+        print(f"  {name:<22s} {len(values):6d} {percentile(values, 0.5):9.1f} {percentile(values, 0.95):9.1f} {percentile(values, 0.99):9.1f}")
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from utils import log, vlog, vvlog
+
+
+class TTSCache:
+    def __init__(self, directory, memory_budget, disk_budget):
+        # Budgets are in bytes; both tiers evict the least recently used entry first
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.lock = threading.Lock()
+
+        self.memory = OrderedDict()  # key -> audio bytes
+        self.memory_size = 0
+        self.disk = OrderedDict()  # key -> file size
+        self.disk_size = 0
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_disk_index()
+
+    @staticmethod
+    def make_key(text, voice_name, pitch, speaking_rate):
+        # Content address of a synthesized phrase: identical text and voice settings give identical audio
+        payload = json.dumps([text, voice_name, pitch, speaking_rate])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return audio
+            if key not in self.disk:
+                self.misses += 1
+                return None
+            self.disk.move_to_end(key)
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                audio = file.read()
+            os.utime(path)  # The file mtime doubles as the LRU order across restarts
+        except OSError as e:
+            log(f"Failed to read cached speech {path}: {e}", error=True)
+            with self.lock:
+                self._drop_disk_entry(key)
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+            self._store_in_memory(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        path = self._path(key)
+        try:
+            # Write to a temporary file first so a crash never leaves a truncated entry behind
+            temp_path = path + ".tmp"
+            with open(temp_path, "wb") as file:
+                file.write(audio)
+            os.replace(temp_path, path)
+        except OSError as e:
+            log(f"Failed to write cached speech {path}: {e}", error=True)
+            path = None
+
+        with self.lock:
+            self._store_in_memory(key, audio)
+            if path:
+                self._drop_disk_entry(key)
+                self.disk[key] = len(audio)
+                self.disk_size += len(audio)
+                self._evict_disk()
+
+    def contains(self, key):
+        with self.lock:
+            return key in self.memory or key in self.disk
+
+    def path(self, key):
+        # The file holding a cached phrase, or None if it is not on disk
+        with self.lock:
+            return self._path(key) if key in self.disk else None
+
+    def _store_in_memory(self, key, audio):
+        if len(audio) > self.memory_budget:
+            return
+        if key in self.memory:
+            self.memory_size -= len(self.memory.pop(key))
+        self.memory[key] = audio
+        self.memory_size += len(audio)
+        while self.memory_size > self.memory_budget:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        while self.disk_size > self.disk_budget and self.disk:
+            key, _ = next(iter(self.disk.items()))
+            self._drop_disk_entry(key)
+            try:
+                os.remove(self._path(key))
+                vvlog("Evicted cached speech %s", key)
+            except OSError:
+                pass
+
+    def _drop_disk_entry(self, key):
+        size = self.disk.pop(key, None)
+        if size is not None:
+            self.disk_size -= size
+
+    def _load_disk_index(self):
+        # Rebuild the disk LRU order from file modification times
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".wav"):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((stat.st_mtime, name[:-len(".wav")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_size += size
+        self._evict_disk()
+        vlog(f"TTS cache loaded {len(self.disk)} entries ({self.disk_size} bytes)")
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.wav")
@@ -1,25 +1,201 @@
+import atexit
 import datetime
+import json
+import sys
+import threading
+import time
+from queue import SimpleQueue, Empty
 from colorama import Fore, Back, Style, init
 
 # Initialize colorama
 init(autoreset=True)
 
+# Logging happens on a background thread: log/vlog/vvlog only check the verbosity and queue the
+# unformatted message with its arguments, so callers (audio threads included) never wait on
+# string formatting or a slow terminal. Messages may use %-style placeholders, which are only
+# filled in by the writer: vvlog("Reply: %s", message) costs almost nothing when -vv is off.
+
+verbosity_level = 0
+json_output = False
+output = None  # None for whatever sys.stdout is at the time of writing
+rate_limit_burst = 5  # errors with the same message template let through per interval...
+rate_limit_interval = 10.0  # ...seconds; further repeats are counted and reported with the next one
+
+LEVEL_NAMES = {0: "info", 1: "verbose", 2: "very_verbose"}
+
+_queue = SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
 def set_verbosity(level):
     global verbosity_level
     verbosity_level = level
 
 
-def log(message, error=False):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    color = Fore.RED if error else Fore.RESET
-    print(f"{color}[{timestamp}] {Style.BRIGHT}{message}{Style.RESET_ALL}")
+def configure_logging(json_lines=None, burst=None, interval=None, stream=None):
+    # json_lines: write one JSON object per line instead of colored text; stream: e.g. sys.stderr
+    global json_output, rate_limit_burst, rate_limit_interval, output
+    if json_lines is not None:
+        json_output = json_lines
+    if stream is not None:
+        output = stream
+    if burst is not None:
+        rate_limit_burst = burst
+    if interval is not None:
+        rate_limit_interval = interval
+
+
+def log_enabled(level):
+    # For callers that would have to compute something expensive just to log it
+    return verbosity_level >= level
 
-def vlog(message):
+
+def log(message, *args, error=False):
+    _enqueue(0, error, message, args)
+
+def vlog(message, *args):
     if verbosity_level >= 1:
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"{Fore.RESET}[{timestamp}][VERBOSE] {message}{Style.RESET_ALL}")
+        _enqueue(1, False, message, args)
 
-def vvlog(message):
+def vvlog(message, *args):
     if verbosity_level >= 2:
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"{Fore.LIGHTBLACK_EX}[{timestamp}][VERY-VERBOSE] {message}{Style.RESET_ALL}")
\ No newline at end of file
+        _enqueue(2, False, message, args)
+
+
+def flush(timeout=2):
+    # Wait until everything logged so far has been written, e.g. before printing a report
+    if _writer is None:
+        return
+    written = threading.Event()
+    _queue.put(written)
+    written.wait(timeout)
+
+
+def _enqueue(level, error, message, args):
+    if _writer is None:
+        _start_writer()
+    _queue.put((time.time(), level, error, message, args))
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            thread = threading.Thread(target=_write_loop, name="log-writer", daemon=True)
+            thread.start()
+            _writer = thread
+            atexit.register(_stop_writer)
+
+
+def _stop_writer(timeout=2):
+    _queue.put(None)
+    _writer.join(timeout)
+
+
+class _RateLimiter:
+    # Lets rate_limit_burst errors per message template through every rate_limit_interval seconds
+    def __init__(self):
+        self.windows = {}  # template -> [window start, emitted, suppressed]
+
+    def admit(self, template, timestamp):
+        """
+        :return: None to drop the message, otherwise how many repeats were dropped before it.
+        """
+        window = self.windows.get(template)
+        if window is None or timestamp - window[0] >= rate_limit_interval:
+            suppressed = window[2] if window else 0
+            self.windows[template] = [timestamp, 1, 0]
+            if len(self.windows) > 1024:
+                self._expire(timestamp)
+            return suppressed
+        if window[1] < rate_limit_burst:
+            window[1] += 1
+            return 0
+        window[2] += 1
+        return None
+
+    def pending(self):
+        return {template: window[2] for template, window in self.windows.items() if window[2]}
+
+    def _expire(self, now):
+        for template in [t for t, window in self.windows.items() if now - window[0] >= rate_limit_interval and not window[2]]:
+            del self.windows[template]
+
+
+def _write_loop():
+    limiter = _RateLimiter()
+    running = True
+    while running:
+        lines = []
+        record = _queue.get()
+        # Write whatever else is already queued in the same batch
+        while True:
+            if record is None:
+                running = False
+            elif isinstance(record, threading.Event):
+                _write(lines)
+                lines = []
+                record.set()
+            else:
+                line = _format(record, limiter)
+                if line is not None:
+                    lines.append(line)
+            if not running:
+                break
+            try:
+                record = _queue.get_nowait()
+            except Empty:
+                break
+        if not running:
+            for template, count in limiter.pending().items():
+                lines.append(_render(time.time(), 0, True, f"{count} repeats of '{template}' were suppressed"))
+        _write(lines)
+
+
+def _format(record, limiter):
+    timestamp, level, error, message, args = record
+    template = message if isinstance(message, str) else str(message)
+    suppressed = 0
+    if error:
+        suppressed = limiter.admit(template, timestamp)
+        if suppressed is None:
+            return None
+    try:
+        text = template % args if args else template
+    except (TypeError, ValueError):
+        text = f"{template} {args!r}"
+    if suppressed:
+        text = f"{text} ({suppressed} similar messages suppressed)"
+    return _render(timestamp, level, error, text, suppressed)
+
+
+def _render(timestamp, level, error, text, suppressed=0):
+    moment = datetime.datetime.fromtimestamp(timestamp)
+    if json_output:
+        record = {
+            "time": moment.isoformat(timespec="milliseconds"),
+            "level": "error" if error else LEVEL_NAMES.get(level, str(level)),
+            "message": text,
+        }
+        if suppressed:
+            record["suppressed"] = suppressed
+        return json.dumps(record)
+    stamp = moment.strftime("%Y-%m-%d %H:%M:%S")
+    if level == 2:
+        return f"{Fore.LIGHTBLACK_EX}[{stamp}][VERY-VERBOSE] {text}{Style.RESET_ALL}"
+    if level == 1:
+        return f"{Fore.RESET}[{stamp}][VERBOSE] {text}{Style.RESET_ALL}"
+    color = Fore.RED if error else Fore.RESET
+    return f"{color}[{stamp}] {Style.BRIGHT}{text}{Style.RESET_ALL}"
+
+
+def _write(lines):
+    if not lines:
+        return
+    stream = output or sys.stdout
+    try:
+        stream.write("\n".join(lines) + "\n")
+        stream.flush()
+    except (OSError, ValueError):
+        pass  # stdout closed or gone; logging must never take the process down
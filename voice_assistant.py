@@ -1,53 +1,133 @@
+import os
 import threading
 import signal
-import speech_recognition as sr
 import time
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
 from audio_manager import AudioManager
+from audio_capture import AudioCapture
+from archive_writer import ArchiveWriter
 from speech_recognizer import SpeechRecognizer
 from text_to_speech import TextToSpeech
 from openai_client import OpenAIClient
+from conversation import Conversation
+from intent_engine import IntentEngine
+from local_intents import LocalIntents
+from response_cache import ResponseCache
+from speculation import Speculator
+from interaction import InteractionController, State
+from tracing import Tracer
+from speech_pipeline import SpeechPipeline
+from noise_estimator import NoiseFloorEstimator
 from wake_word_detector import WakeWordDetector
-from assistant_functions import get_weather
-from utils import log, vlog, vvlog
-import openai_client
+from utils import log, vlog, vvlog, configure_logging
 
 
 class VoiceAssistant:
-    def __init__(self):
+    def __init__(self, config=None):
         vvlog("Initializing Voice Assistant...")
+        self.startup_started = time.perf_counter()
+        self.startup_timings = {}
         self.shutdown_flag = False
-        self.config = Config()
-        self.audio_manager = AudioManager()
-        self.speech_recognizer = SpeechRecognizer(self.config)
-        self.text_to_speech = TextToSpeech(self.config)
-        self.openai_client = OpenAIClient(self.config)
-        self.wake_word_detector = WakeWordDetector(self.config)
+        self.wake_word_thread = None
+        self.config = config or self._timed("config", Config)
+        configure_logging(self.config.log_json, self.config.log_rate_limit_burst, self.config.log_rate_limit_interval)
+        self.archive = self._create_archive()
+        self.audio_capture = AudioCapture(self.config)
+
+        # The backends do not depend on each other, so bring them up in parallel
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            audio = pool.submit(self._timed, "audio", AudioManager, self.config)
+            asr = pool.submit(self._timed, "asr", self._create_speech_recognizer)
+            tts = pool.submit(self._timed, "tts", self._create_text_to_speech)
+            llm = pool.submit(self._timed, "llm", self._init_openai)
+            wake = pool.submit(self._timed, "wake_word", self._init_wake_word)
+            self.audio_manager = audio.result()
+            self.speech_recognizer = asr.result()
+            self.text_to_speech = tts.result()
+            self.openai_client, thread_id, self.assistant_id, self.stale_resources = llm.result()
+            self.wake_word_detector = wake.result()
+
+        self.conversation = Conversation(self.config, self.openai_client, thread_id)
+
+        self.speech_pipeline = SpeechPipeline(self.config, self.text_to_speech, self.audio_manager)
         self.setup_signal_handling()
 
-        # Close past threads and assistants
-        vlog("Closing past threads and assistants...")
-        self.openai_client.close_and_clear_files()
+        # Pre-synthesize common phrases in the background
+        threading.Thread(target=self.text_to_speech.warm_up, args=(self.config.tts_warmup_phrases,), daemon=True).start()
+
+        # Common commands are answered locally, without a round trip to the assistant
+        self.last_response = None
+        self.intents = IntentEngine(self.config)
+        self.local_intents = LocalIntents(self)
+        self.local_intents.register(self.intents)
+        self.response_cache = self._create_response_cache() if self.config.response_cache_enabled else None
+
+        # Questions that need the assistant may be sent before the user has finished asking them
+        self.speculator = None
+        if self.config.speculation_enabled and self.config.stream_responses:
+            self.speculator = Speculator(self.config, self.conversation, self._needs_assistant)
+
+        self.tracer = self._create_tracer()
+        self.trace_attributes = {}  # Added to every trace, e.g. the session name in server mode
+
+        # Wake words and command progress go through one dispatcher: idle -> listening -> thinking -> speaking
+        self.interaction = InteractionController(self.config, self.audio_manager, self.process_command)
+
+        # Recognition thresholds follow the room's noise floor, measured whenever nobody is talking to us
+        self.noise_estimator = NoiseFloorEstimator(
+            self.config, self.audio_capture, self.speech_recognizer.set_noise_floor,
+            lambda: self.interaction.state == State.IDLE
+        )
+
+    def _timed(self, phase, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        self.startup_timings[phase] = time.perf_counter() - started
+        vvlog(f"Startup phase '{phase}' took {self.startup_timings[phase]:.2f}s")
+        return result
+
+    def _create_archive(self):
+        return ArchiveWriter(self.config)
+
+    def _create_speech_recognizer(self):
+        return SpeechRecognizer(self.config, self.archive)
+
+    def _create_text_to_speech(self):
+        return TextToSpeech(self.config, self.archive)
+
+    def _create_response_cache(self):
+        return ResponseCache(self.config)
+
+    def _create_tracer(self):
+        return Tracer(self.config)
+
+    def _create_openai_client(self):
+        return OpenAIClient(self.config)
+
+    def _init_openai(self):
+        client = self._create_openai_client()
+
+        # Remember what earlier runs left behind before this run records its own thread and assistant
+        stale_threads, stale_assistants = client.collect_stale_resources()
 
-        # Create a thread and an assistant
         vlog("Creating new thread...")
-        self.thread_id = self.openai_client.create_thread()
+        thread_id = client.create_thread()
 
         with open("system-prompt.txt", 'r') as file:
             prompt = file.read()
             vvlog(f"Creating Assistant with prompt from 'system-prompt.txt'")
-        
-        vlog("Creating new assistant...")
-        self.assistant_id = self.openai_client.create_assistant(prompt)
-    
-        self.command_actions = {
-                "stop": self.stop_audio,
-                "nevermind": self.cancel_command,
-                "never mind": self.cancel_command,
-                "cancel": self.cancel_command,
-                "shutdown": self.shutdown,
-                "shut down": self.shutdown,
-            }
+
+        vlog("Getting assistant...")
+        assistant_id = client.get_or_create_assistant(prompt)
+        stale_assistants = [stale for stale in stale_assistants if stale != assistant_id]
+        return client, thread_id, assistant_id, (stale_threads, stale_assistants)
+
+    def _init_wake_word(self):
+        vvlog("Initializing Porcupine...")
+        detector = WakeWordDetector(self.config, self.audio_capture)
+        detector.init_porcupine()
+        return detector
 
     def setup_signal_handling(self):
         signal.signal(signal.SIGINT, self.signal_handler)
@@ -55,57 +135,123 @@ class VoiceAssistant:
     def signal_handler(self, sig, frame):
         log("Shutdown initiated by signal...")
         self.shutdown_flag = True
+        self.interaction.post("stop")
 
     def run(self):
         try:
-            # Initialize the wake word detector
-            vvlog("Initializing Porcupine...")
-            self.wake_word_detector.init_porcupine()
-
-            # Calibrate the recognizer for ambient noise before starting the main loop
-            with sr.Microphone() as source:
-                self.speech_recognizer.calibrate_for_ambient_noise(source)
-
-            # Start the wake word detector in a separate thread
-            self.wake_word_thread = threading.Thread(target=self.wake_word_detector.listen_for_wake_word, args=(self.wake_word_detected,))
-            self.wake_word_thread.start()
-            vvlog("Wake-Word thread started!")
-
-            log("Voice Assistant is running. Say the wake word to activate.")
-            while not self.shutdown_flag:
-                time.sleep(1)
+            self.start()
+            # Wake words and command progress are dispatched here until shutdown
+            self.interaction.run()
         finally:
             self.cleanup()
 
-    def wake_word_detected(self):
+    def start(self):
+        # Open the shared microphone stream and start listening for the wake word right away
+        self.audio_capture.start()
+        self.wake_word_thread = threading.Thread(target=self.wake_word_detector.listen_for_wake_word, args=(self.wake_word_detected,))
+        self.wake_word_thread.start()
+        vvlog("Wake-Word thread started!")
+
+        time_to_ready = time.perf_counter() - self.startup_started
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.startup_timings.items())
+        log(f"Voice Assistant is running after {time_to_ready:.2f}s ({phases}). Say the wake word to activate.")
+
+        # Noise tracking and closing leftovers from earlier runs happen while already listening
+        self.noise_estimator.start()
+        vlog("Closing past threads and assistants in the background...")
+        threading.Thread(target=self.openai_client.close_stale_resources, args=self.stale_resources, daemon=True).start()
+
+    def wake_word_detected(self, event):
+        # Runs on the wake word thread; the interaction controller decides what happens next
+        self.interaction.post("wake", event)
+
+    def process_command(self, event, turn=None):
         # Play a sound to acknowledge wake word detection
         self.audio_manager.play_sound('sounds/Wake.wav')
 
-        # Capture and process the command
-        self.process_command()
-
-    def process_command(self):
-        with sr.Microphone() as source:
-            command = self.speech_recognizer.recognize_speech(source, self.config.command_await_timeout)
+        trace = self.tracer.start(noise_floor_db=self.noise_estimator.stats()["noise_floor_db"], **self.trace_attributes)
+        if turn is not None:
+            turn.trace = trace
+        speculation = None
+        try:
+            # Capture and process the command, starting right where the wake word ended
+            start_sample = None
+            if event is not None:
+                trace.add("wake", max(0.0, time.time() - event.timestamp))
+                start_sample = event.sample_index - int(self.config.command_preroll_seconds * self.audio_capture.sample_rate)
+            cancel = turn.cancel if turn else None
+            speculative = self.speculator.begin(self.assistant_id) if self.speculator else None
+            with self.audio_capture.source(start_sample) as source:
+                command = self.speech_recognizer.recognize_speech(
+                    source, self.config.command_await_timeout, cancel, trace,
+                    on_partial=speculative.on_partial if speculative else None
+                )
+            if speculative:
+                speculation = speculative.resolve(None if cancel is not None and cancel.is_set() else command, trace)
+            if cancel is not None and cancel.is_set():
+                trace.set(outcome="cancelled")
+                return
             if command:
                 self.audio_manager.play_sound('sounds/Heard.wav')
-                self.handle_command(command)
+                self.handle_command(command, turn, speculation)
+                trace.set(outcome="cancelled" if turn and turn.cancelled else "answered")
             else:
+                trace.set(outcome="no_speech")
                 self.audio_manager.play_sound('sounds/NoSpeech.wav')
+        finally:
+            if speculation is not None:
+                self.speculator.discard(speculation)  # Unless the reply was used
+            self.tracer.finish(trace)
 
-    def handle_command(self, command):
-        # Check for local commands such as "shutdown"
-        if command.lower() in self.command_actions:
-            vlog("Command issued is local command, executing corresponding function...")
+    def _enter(self, turn, state):
+        if turn is not None:
+            turn.enter(state)
+
+    def _needs_assistant(self, command):
+        # Whether a command would go to the assistant rather than be answered locally or from the cache
+        if self.intents.match(command):
+            return False
+        return not (self.response_cache and self.response_cache.peek(command))
+
+    def handle_command(self, command, turn=None, speculation=None):
+        # Check for local commands such as "shutdown" or "what time is it"
+        started = time.perf_counter()
+        cancel = turn.cancel if turn else None
+        trace = turn.trace if turn else None
+        self._enter(turn, State.THINKING)
+        match = self.intents.match(command)
+        if trace:
+            trace.set(route="local" if match else "assistant", intent=match.intent.name if match else None)
+        if match:
+            if match.confidence < 1.0:
+                # Not what the pattern says word for word, so leave a trace of the guess
+                log("Treating '%s' as local intent '%s' (%.2f)", command, match.intent.name, match.confidence)
+            vlog("Command matched local intent '%s' (%.2f), executing corresponding function...", match.intent.name, match.confidence)
             self.audio_manager.play_sound('sounds/LocalCommand.wav')
-            self.command_actions[command.lower()]()  # Execute the corresponding function
-        else:
-            self.audio_manager.play_sound('sounds/Heard.wav', True)
-            # Process command with OpenAI or other functionalities
-            # Use the thread_id and assistant_id when calling process_command_with_assistant
-            self.audio_manager.play_sound('sounds/Request.wav')
-            response = self.openai_client.process_command_with_assistant(self.thread_id, command, self.assistant_id)
+            response = match.intent.handler(**match.slots)
+            vvlog("Local intent handled in %.1f ms", (time.perf_counter() - started) * 1000)
             if response:
+                self.say(response, turn)
+        else:
+            # Questions asked before are answered from the response cache without any network traffic
+            cached = self.response_cache.get(command) if self.response_cache else None
+            if cached:
+                if trace:
+                    trace.set(route="cache")
+                self.audio_manager.play_sound('sounds/Received.wav')
+                self.say_cached(command, cached, turn)
+                return
+
+            # The cues play while the request is already under way
+            self.audio_manager.play_sequence('sounds/Heard.wav', 'sounds/Request.wav')
+            if self.config.stream_responses:
+                text_response = self.stream_response(command, turn, speculation)
+                if text_response and self.response_cache and not (cancel is not None and cancel.is_set()):
+                    self.response_cache.put(command, text_response, time.perf_counter() - started)
+                return
+            response = self.conversation.ask(command, self.assistant_id, cancel, trace)
+            if response and not (cancel is not None and cancel.is_set()):
+                latency = time.perf_counter() - started
                 self.audio_manager.play_sound('sounds/Received.wav')
                 # Assuming response is a list of MessageContentText objects, extract the text value
                 if isinstance(response, list) and response and hasattr(response[0], 'text'):
@@ -113,13 +259,80 @@ class VoiceAssistant:
                 else:
                     text_response = str(response)  # Fallback to converting whatever response is to a string
                 
-                # Generate a unique filename for each synthesized speech
-                timestamp = time.strftime("%Y%m%d-%H%M%S")
-                audio_file_path = self.text_to_speech.synthesize_speech(text_response, f"speech_{timestamp}.wav")
-                
-                if audio_file_path:
-                    self.audio_manager.play_sound(audio_file_path)
+                self.say(text_response, turn)
+                if self.response_cache:
+                    self.response_cache.put(command, text_response, latency, self.text_to_speech.cached_audio_path(text_response))
+
+    def say(self, text, turn=None):
+        # Play the reply as it is synthesized; repeated replies are served from the speech cache without an API call
+        vlog("Speaking: %s", text)
+        self.last_response = text
+        cancel = turn.cancel if turn else None
+        started = time.perf_counter()
+        chunks = self.text_to_speech.stream_audio(text, cancel)
+        handle = None
+        try:
+            for chunk in chunks:
+                if turn and turn.cancelled:
+                    return
+                if handle is None:
+                    if turn and turn.trace:
+                        turn.trace.add("tts", time.perf_counter() - started)
+                        turn.trace.mark("first_audio")
+                    self._enter(turn, State.SPEAKING)
+                handle = self.audio_manager.queue_sound(chunk)
+        finally:
+            chunks.close()
+        self._wait_for_playback(self.audio_manager.speech_voice if handle else None, turn)
+
+    def say_cached(self, command, cached, turn=None):
+        # Play the stored audio of a cached reply, synthesizing it once if there is none yet
+        log(f"Assistant Response (cached): {cached['text']}")
+        if cached["audio_path"] and os.path.exists(cached["audio_path"]):
+            self.last_response = cached["text"]
+            self._enter(turn, State.SPEAKING)
+            self._wait_for_playback(self.audio_manager.play_sound(cached["audio_path"]), turn)
+            return
+        self.say(cached["text"], turn)
+        self.response_cache.set_audio_path(cached["key"], self.text_to_speech.cached_audio_path(cached["text"]))
+
+    def _wait_for_playback(self, handle, turn):
+        # Stay in the speaking state until the reply has been played, unless the turn is cancelled
+        if turn is None or handle is None:
+            return
+        if turn.trace:
+            turn.trace.mark("first_audio")
+        started = time.perf_counter()
+        while handle.is_playing() and not turn.cancelled:
+            handle.wait(0.05)
+        if turn.trace:
+            turn.trace.add("playback", time.perf_counter() - started)
     
+    def stream_response(self, command, turn=None, speculation=None):
+        # Speak the reply sentence by sentence while the assistant is still generating it,
+        # picking up the speculative run if one was already started on this question
+        cancel = turn.cancel if turn else None
+
+        def first_segment():
+            self._enter(turn, State.SPEAKING)
+            self.audio_manager.play_sound('sounds/Received.wav')
+
+        trace = turn.trace if turn else None
+        if speculation is not None:
+            tokens = speculation.adopt(cancel, trace)
+        else:
+            tokens = self.conversation.stream(command, self.assistant_id, cancel, trace)
+        text_response = self.speech_pipeline.speak(tokens, on_first_segment=first_segment, cancel=cancel, trace=trace)
+        if cancel is not None and cancel.is_set():
+            return None
+        if text_response:
+            log(f"Assistant Response: {text_response}")
+            self.last_response = text_response
+            self._wait_for_playback(self.audio_manager.speech_voice, turn)
+        else:
+            self.speech_pipeline.speak(["I'm sorry, I can't process your request right now."])
+        return text_response
+
     def stop_audio(self):
         self.audio_manager.stop_all_sounds()
         log("Audio stopped.")
@@ -132,19 +345,37 @@ class VoiceAssistant:
         self.shutdown_flag = True
         # Play a sound to acknowledge shutdown command
         self.audio_manager.play_sound('sounds/Shutdown.wav', wait_full_sound=True)
+        self.interaction.post("stop")
 
     def cleanup(self):
         log("Cleaning up resources...")
+        self.interaction.shutdown()
 
-        # Delete the thread and assistant
-        if self.thread_id:
-            self.openai_client.delete_thread(self.thread_id)
-        if self.assistant_id:
-            self.openai_client.delete_assistant(self.assistant_id)
+        # Delete the thread; the assistant goes with the shared services below
+        vlog(f"Conversation stats: {self.conversation.stats()}")
+        if self.conversation.thread_id:
+            self.openai_client.delete_thread(self.conversation.thread_id)
 
+        self.local_intents.shutdown()
+        if self.speculator:
+            self.speculator.shutdown()
         self.wake_word_detector.shutdown()
 
-        if self.wake_word_thread.is_alive():
+        if self.wake_word_thread and self.wake_word_thread.is_alive():
             self.wake_word_thread.join()  # Wait for the wake word thread to finish
 
-        self.audio_manager.shutdown()
\ No newline at end of file
+        self.noise_estimator.stop()
+        self.speech_recognizer.shutdown()
+        self.audio_capture.stop()
+        self.audio_manager.shutdown()
+        self._close_shared()
+
+    def _close_shared(self):
+        # What a server shares between its sessions; it closes these once, after the last session
+        if self.assistant_id and not self.config.warm_start:
+            self.openai_client.delete_assistant(self.assistant_id)
+        if self.response_cache:
+            self.response_cache.shutdown()
+        self.openai_client.shutdown()
+        self.archive.shutdown()
+        self.tracer.shutdown()
\ No newline at end of file
@@ -1,47 +1,97 @@
 import time
-import pvporcupine
-import numpy as np
-import sounddevice as sd
+import threading
+from collections import namedtuple
+from queue import Queue, Empty
+from lazy_import import lazy_import
 from utils import log, vlog, vvlog
 
+pvporcupine = lazy_import("pvporcupine")
+np = lazy_import("numpy")
+
+# sample_index is the absolute capture position right after the frame in which the keyword ended
+WakeWordEvent = namedtuple("WakeWordEvent", ["keyword_index", "sample_index", "timestamp"])
+
+
 class WakeWordDetector:
-    def __init__(self, config):
+    def __init__(self, config, capture):
         self.config = config
+        self.capture = capture
         self.porcupine = None
         self.keyword_path = self.config.custom_wake_word_file
         self.access_key = self.config.porcupine_access_key
         self.detected_callback = None
 
+        # Detection events are published here; listen_for_wake_word dispatches them to detected_callback
+        self.events = Queue()
+        self.running = threading.Event()
+        self.reader = None
+        self.processor = None
+
     def init_porcupine(self):
+        if self.porcupine is not None:
+            return
         try:
             self.porcupine = pvporcupine.create(access_key=self.access_key, keyword_paths=[self.keyword_path])
         except Exception as e:
             log(f"Failed to initialize Porcupine: {e}", error=True)
             raise
+        if self.porcupine.sample_rate != self.capture.sample_rate:
+            raise ValueError(f"Porcupine expects {self.porcupine.sample_rate} Hz audio, capture runs at {self.capture.sample_rate} Hz")
 
     def listen_for_wake_word(self, detected_callback):
         self.detected_callback = detected_callback
         self.init_porcupine()
+        self.capture.start()
+        self.reader = self.capture.reader()
+        self.running.set()
 
-        def callback(indata, frames, time, status):
-            if status:
-                log(f"Error: {status}", error=True)
-            if indata.dtype != np.int16:
-                indata = (indata * 32767).astype(np.int16)
-            keyword_index = self.porcupine.process(indata.flatten())
+        self.processor = threading.Thread(target=self._process_frames, daemon=True)
+        self.processor.start()
+
+        log(f"Listening for keyword '{self.config.key_word}'...")
+        self._dispatch_events()
+
+    def _process_frames(self):
+        # Feed frames from the shared capture ring to Porcupine off the audio thread
+        frame = np.zeros(self.porcupine.frame_length, dtype=np.int16)
+        while self.running.is_set():
+            samples = self.reader.read(len(frame), out=frame, timeout=0.1)
+            if samples is None:
+                continue
+            keyword_index = self.porcupine.process(samples)
             if keyword_index >= 0:
+                self.events.put(WakeWordEvent(keyword_index, self.reader.position, time.time()))
+
+    def _dispatch_events(self):
+        # Hand detection events to the callback and report audio problems, on the listening thread
+        reported_status_errors = 0
+        while self.running.is_set():
+            try:
+                event = self.events.get(timeout=0.1)
+            except Empty:
+                event = None
+
+            if self.capture.status_errors != reported_status_errors:
+                log("Input stream reported %d status errors", self.capture.status_errors - reported_status_errors, error=True)
+                reported_status_errors = self.capture.status_errors
+
+            if event is not None:
                 log(f"Keyword '{self.config.key_word}' detected.")
                 if self.detected_callback:
-                    self.detected_callback()
+                    self.detected_callback(event)
 
-        with sd.InputStream(callback=callback,
-                            blocksize=self.porcupine.frame_length,
-                            samplerate=self.porcupine.sample_rate,
-                            channels=1):
-            log(f"Listening for keyword '{self.config.key_word}'...")
-            while True:
-                time.sleep(0.1)
+    def stats(self):
+        return {
+            "dropped_samples": self.reader.dropped_samples if self.reader else 0,
+            "callback_overruns": self.capture.callback_overruns,
+            "status_errors": self.capture.status_errors,
+        }
 
     def shutdown(self):
+        self.running.clear()
+        if self.processor is not None:
+            self.processor.join()  # Porcupine must not be deleted while a frame is being processed
+        vlog(f"Wake word detector stats: {self.stats()}")
         if self.porcupine is not None:
-            self.porcupine.delete()
\ No newline at end of file
+            self.porcupine.delete()
+            self.porcupine = None